@@ -0,0 +1,138 @@
+import queue
+import numpy as np
+
+import torch
+import torch.multiprocessing as mp
+
+from model import ASAF1
+from rollout import MakeEnv, SerialVecEnv, Collector
+from utils import PhaseTimer
+
+
+# Policy weights in one flat shared-memory tensor, published by the learner and pulled by the actors:
+class SharedWeights:
+    def __init__(self, policy, ctx):
+        self.flat    = torch.cat([p.detach().cpu().reshape(-1) for p in policy.parameters()]).share_memory_()
+        self.version = ctx.Value("i", 0)
+        self.lock    = ctx.Lock()
+
+    def GetVersion(self):
+        return self.version.value
+
+    def Publish(self, policy):
+        with self.lock:
+            self.flat.copy_(torch.cat([p.detach().cpu().reshape(-1) for p in policy.parameters()]))
+            self.version.value += 1
+
+    # Parameters are copied in place, so views on them (e.g. the NumPy inference path) stay valid:
+    def Pull(self, policy):
+        with self.lock:
+            offset = 0
+            for p in policy.parameters():
+                p.data.copy_(self.flat[offset: offset + p.numel()].view_as(p))
+                offset += p.numel()
+
+            return self.version.value
+
+
+def ActorWorker(actorIndex, envName, numEnvs, seed, agentParams, sharedWeights, chunkQueue, chunkSize, stopEvent):
+    torch.set_num_threads(1)
+    envs      = SerialVecEnv([MakeEnv(envName) for _ in range(numEnvs)])
+    for i, env in enumerate(envs.envs):
+        env.seed(seed + i)
+
+    agent     = ASAF1(**agentParams, optimizer=None)
+    version   = sharedWeights.Pull(agent.policy)
+    collector = Collector(envs, agent)
+    try:
+        while not stopEvent.is_set():
+            # A chunk is always collected with a single version of the weights:
+            if sharedWeights.GetVersion() != version:
+                version = sharedWeights.Pull(agent.policy)
+                agent.actor.Refresh()
+
+            states, actions, episodes = [], [], []
+            for _ in range(chunkSize // numEnvs + int(chunkSize % numEnvs != 0)):
+                stepStates, stepActions, finishedEpisodes = collector.Step()
+                states  .append(stepStates )
+                actions .append(stepActions)
+                episodes.extend((actorIndex * numEnvs + i, reward, numTrans) for i, reward, numTrans in finishedEpisodes)
+
+            chunk = (version, np.concatenate(states), np.concatenate(actions), episodes)
+            while not stopEvent.is_set():
+                try:
+                    chunkQueue.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        envs.Close()
+
+
+# Actor processes keep collecting with a recent snapshot of the policy while the learner runs Fit. Chunks collected
+# with weights more than maxStaleness versions older than the learner's are dropped (0 = strictly on-policy).
+# While waiting for a chunk, the actors are checked every pollSeconds, so a dead actor raises instead of blocking the learner:
+class AsyncCollector:
+    def __init__(self, envName, agent, agentParams, numActors, numEnvsPerActor=1, chunkSize=1000, maxStaleness=1, seed=0, timer=None, pollSeconds=1.):
+        ctx = mp.get_context("spawn")
+        self.agent         = agent
+        self.timer         = timer or PhaseTimer()
+        self.maxStaleness  = maxStaleness
+        self.pollSeconds   = pollSeconds
+        self.numDropped    = 0
+        self.version       = 0
+        self.sharedWeights = SharedWeights(agent.policy, ctx)
+        self.chunkQueue    = ctx.Queue(maxsize=2 * numActors)
+        self.stopEvent     = ctx.Event()
+        self.processes     = []
+        for i in range(numActors):
+            args = (i, envName, numEnvsPerActor, seed + 1 + i * numEnvsPerActor, agentParams, self.sharedWeights, self.chunkQueue, chunkSize, self.stopEvent)
+            process = ctx.Process(target=ActorWorker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    # Returns (states, actions, finishedEpisodes) of the next chunk, the transitions of a too stale chunk are dropped:
+    def Step(self):
+        with self.timer("actor.wait"):
+            while True:
+                try:
+                    version, states, actions, episodes = self.chunkQueue.get(timeout=self.pollSeconds)
+                    break
+                except queue.Empty:
+                    self.CheckActors()
+
+        self.version = version
+        if self.sharedWeights.GetVersion() - version > self.maxStaleness:
+            self.numDropped += len(states)
+            states, actions  = states[:0], actions[:0]
+
+        return states, actions, episodes
+
+    # Called by the learner after every Fit, numRest transitions of the current chunk are not pushed yet.
+    # Returns False when they became too stale by this Fit (they are dropped then):
+    def OnPolicyUpdated(self, numRest=0):
+        self.sharedWeights.Publish(self.agent.policy)
+        if self.sharedWeights.GetVersion() - self.version > self.maxStaleness:
+            self.numDropped += numRest
+            return False
+
+        return True
+
+    # An actor only exits after Close, otherwise it died (e.g. an env or import error in the worker), then the others are stopped too:
+    def CheckActors(self):
+        for i, process in enumerate(self.processes):
+            if not process.is_alive():
+                self.Close()
+                raise RuntimeError(f"Actor process {i} exited with code {process.exitcode} !")
+
+    def Close(self):
+        self.stopEvent.set()
+        for process in self.processes:
+            while process.is_alive():
+                try:
+                    self.chunkQueue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+                process.join(timeout=0.1)
@@ -0,0 +1,455 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import numpy as np
+
+import torch
+from torch.distributions.normal import Normal
+
+from model import ASAF1, GaussianLogProb, LogAddExp, GetPrecisionDtype, EPS, EPS2
+from ensemble import ASAF1Ensemble
+from data import ExpertBuffer, AgentBuffer
+from synthetic import SYNTHETIC_ENVS, MakeSyntheticEnv, GenerateSyntheticDemo
+
+
+def TimeIt(func, nRepeat=1000, nWarmup=10):
+    for _ in range(nWarmup):
+        func()
+
+    start = time.perf_counter()
+    for _ in range(nRepeat):
+        func()
+
+    return (time.perf_counter() - start) / nRepeat
+
+
+# Single-state latency and batched throughput of ASAF1.Act against the previous OneStepAction + RecoverAction path:
+def BenchmarkAct(stateDim=28, actionDim=8, hiddenDim=256, batchSizes=(1, 16, 64), squashing=None, nRepeat=1000):
+    agent = ASAF1(stateDim, actionDim, hiddenDim, -1., 1., squashing=squashing)
+    agent.ToEvalMode()
+    paths = {
+        "legacy": lambda state: agent.RecoverAction(agent.policy.OneStepAction(state)),
+        "numpy" : None,
+        "torch" : None
+    }
+    results = []
+    for batchSize in batchSizes:
+        state = np.random.randn(batchSize, stateDim) if batchSize > 1 else np.random.randn(stateDim)
+        for name, func in paths.items():
+            if func is None:
+                agent.actor.backend = name
+                func = agent.Act
+
+            latency = TimeIt(lambda: func(state), nRepeat)
+            results.append({"Path": name, "BatchSize": batchSize, "Latency": latency, "StatesPerSec": batchSize / latency})
+            print(f"| Act | {name :6s} | Batch: {batchSize :4d} | Latency: {latency * 1e6 :9.2f} us | Throughput: {batchSize / latency :12.1f} states/s |")
+
+    agent.actor.backend = "auto"
+    return results
+
+
+def GetRandomTransitions(n, stateDim, actionDim, minActVal=-1., maxActVal=1.):
+    return torch.randn(n, stateDim), torch.rand(n, actionDim) * (maxActVal - minActVal) + minActVal
+
+
+FIT_MODES = {
+    "separate": {"isFusedUpdate": False},
+    "fused"   : {"isFusedUpdate": True },
+    "window"  : {"sampling": "window"},
+    "random"  : {"sampling": "random"}
+}
+
+
+# Fit steps (minibatch updates) per second of ASAF1 built with each of the given keyword arguments:
+def BenchmarkFit(stateDim=28, actionDim=8, hiddenDim=256, nExpert=25000, nAgent=4000, epochs=2, batchSize=256, squashing=None, modes=FIT_MODES):
+    expertState, expertAction = GetRandomTransitions(nExpert, stateDim, actionDim)
+    agentState , agentAction  = GetRandomTransitions(nAgent , stateDim, actionDim)
+    nStep = epochs * (nAgent // batchSize + int(nAgent % batchSize != 0))
+    results = []
+    for name, kwargs in modes.items():
+        torch.manual_seed(0)
+        agent = ASAF1(stateDim, actionDim, hiddenDim, -1., 1., squashing=squashing, gradClip=1., **kwargs)
+        start = time.perf_counter()
+        agent.Fit(expertState, expertAction, agentState, agentAction, epochs, batchSize)
+        elapsed = time.perf_counter() - start
+        results.append({"Mode": name, "Steps": nStep, "Seconds": elapsed, "StepsPerSec": nStep / elapsed})
+        print(f"| Fit | {name :8s} | Steps: {nStep :5d} | Time: {elapsed :8.3f} s | {nStep / elapsed :8.1f} steps/s |")
+
+    return results
+
+
+# Fit of an N member ensemble (one batched update) against N separate agents:
+def BenchmarkEnsembleFit(stateDim=28, actionDim=8, hiddenDim=256, numMembers=(1, 4, 8), nExpert=25000, nAgent=4000, epochs=2, batchSize=256):
+    expertState, expertAction = GetRandomTransitions(nExpert, stateDim, actionDim)
+    results = []
+    for n in numMembers:
+        agentState , agentAction  = GetRandomTransitions(n * nAgent, stateDim, actionDim)
+        agentState , agentAction  = agentState.view(n, nAgent, stateDim), agentAction.view(n, nAgent, actionDim)
+        torch.manual_seed(0)
+        agent = ASAF1Ensemble(n, stateDim, actionDim, hiddenDim, -1., 1., gradClip=1.)
+        start = time.perf_counter()
+        agent.Fit(expertState, expertAction, agentState, agentAction, epochs, batchSize)
+        elapsed = time.perf_counter() - start
+        results.append({"Members": n, "Seconds": elapsed, "SecondsPerMember": elapsed / n})
+        print(f"| Ensemble Fit | Members: {n :3d} | Time: {elapsed :8.3f} s | {elapsed / n :8.3f} s/member |")
+
+    return results
+
+
+# Fit with 1 (ASAF1.Fit) ... N processes (distributed.DataParallelFit), the second Fit is timed (the first one also allocates the shared memory):
+def BenchmarkDataParallelFit(stateDim=28, actionDim=8, hiddenDim=256, numProcs=(1, 2, 4), nExpert=25000, nAgent=4000, epochs=2, batchSize=1024):
+    from distributed import DataParallelFit
+
+    expertState, expertAction = GetRandomTransitions(nExpert, stateDim, actionDim)
+    agentState , agentAction  = GetRandomTransitions(nAgent , stateDim, actionDim)
+    nStep   = epochs * (nAgent // batchSize + int(nAgent % batchSize != 0))
+    params  = dict(stateDim=stateDim, actionDim=actionDim, hiddenDim=hiddenDim, minActVal=-1., maxActVal=1., gradClip=1.)
+    results = []
+    for n in numProcs:
+        torch.manual_seed(0)
+        agent  = ASAF1(**params)
+        fitter = DataParallelFit(agent, params, n) if n > 1 else agent
+        fitter.Fit(expertState, expertAction, agentState, agentAction, epochs, batchSize)
+        start  = time.perf_counter()
+        fitter.Fit(expertState, expertAction, agentState, agentAction, epochs, batchSize)
+        elapsed = time.perf_counter() - start
+        if n > 1:
+            fitter.Close()
+
+        speedup = results[0]["Seconds"] / elapsed if results else 1.
+        results.append({"Processes": n, "Steps": nStep, "Seconds": elapsed, "StepsPerSec": nStep / elapsed, "Speedup": speedup})
+        print(f"| Data-parallel Fit | Processes: {n :2d} | Steps: {nStep :5d} | Time: {elapsed :8.3f} s | {nStep / elapsed :8.1f} steps/s | Speedup: {speedup :5.2f} |")
+
+    return results
+
+
+# Expert buffer loading without / with Preprocess (cold: computed and cached, warm: read from the cache) and the Fit that consumes it:
+def BenchmarkPreprocess(envName="SyntheticAnt-v0", hiddenDim=256, numDemo=25000, nAgent=4000, epochs=2, batchSize=256, squashing="tanh"):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        demoPath = GenerateSyntheticDemo(envName, os.path.join(folder, "demo"), numDemo)
+        dims     = SYNTHETIC_ENVS[envName]
+        agentState, agentAction = GetRandomTransitions(nAgent, dims["stateDim"], dims["actionDim"])
+        for name, kwargs in [("raw", {}), ("cold", dict(minActVal=-1., maxActVal=1., squashing=squashing)), ("warm", dict(minActVal=-1., maxActVal=1., squashing=squashing))]:
+            start  = time.perf_counter()
+            buffer = ExpertBuffer(demoPath, numDemo, **kwargs)
+            loadSeconds = time.perf_counter() - start
+
+            torch.manual_seed(0)
+            agent = ASAF1(dims["stateDim"], dims["actionDim"], hiddenDim, -1., 1., squashing=squashing, gradClip=1.)
+            start = time.perf_counter()
+            agent.Fit(*buffer[:], agentState, agentAction, epochs, batchSize, buffer.isMapped, buffer.logJacobians)
+            fitSeconds = time.perf_counter() - start
+
+            results.append({"Mode": name, "LoadSeconds": loadSeconds, "FitSeconds": fitSeconds})
+            print(f"| Preprocess | {name :4s} | Load: {loadSeconds :8.4f} s | Fit: {fitSeconds :8.3f} s |")
+
+    return results
+
+
+def BenchmarkBuffer(stateDim=28, actionDim=8, nTransition=4000, sampleSize=256, nRepeat=100):
+    buffer  = AgentBuffer(nTransition, "cpu", stateDim, actionDim)
+    state   = np.random.randn(stateDim)
+    action  = np.random.randn(actionDim)
+    results = []
+    for name, func, n in (
+        ("Push"  , lambda: buffer.Push(state, action), nTransition),
+        ("Slice" , lambda: buffer[:]                 , nRepeat    ),
+        ("Sample", lambda: buffer.Sample(sampleSize) , nRepeat    )
+    ):
+        latency = TimeIt(func, n)
+        results.append({"Op": name, "Latency": latency})
+        print(f"| Buffer | {name :6s} | Latency: {latency * 1e6 :9.2f} us |")
+
+    return results
+
+
+# The log-prob and loss of the policy with torch.distributions.Normal (before the closed-form GaussianLogProb):
+def ReferenceLogProb(policy, state, action):
+    mean, std = policy(state)
+    if policy.squashing is None:
+        return torch.sum(Normal(mean, std).log_prob(action), dim=-1, keepdim=True)
+    else:
+        logProb = Normal(mean, std).log_prob(torch.atanh(torch.clamp(action, -1 + EPS2, 1 - EPS2)))
+        return torch.sum(logProb - torch.log(1 - action ** 2 + EPS), dim=-1, keepdim=True)
+
+
+def ReferenceLoss(expertLogProb, expertOldProb, agentLogProb, agentOldProb):
+    expertLoss = -(expertLogProb - torch.log(expertLogProb.exp() + expertOldProb.exp() + EPS)).mean()
+    agentLoss  = -(agentOldProb  - torch.log(agentLogProb .exp() + agentOldProb .exp() + EPS)).mean()
+    return expertLoss + agentLoss
+
+
+# Agreement of GetLogProb / the ASAF loss with the reference implementation (values and gradients), and a gradcheck of GaussianLogProb:
+def CheckLogProb(stateDim=28, actionDim=8, hiddenDim=256, batchSize=512):
+    results = []
+    for squashing in (None, "tanh"):
+        torch.manual_seed(0)
+        agent = ASAF1(stateDim, actionDim, hiddenDim, -1., 1., squashing=squashing)
+        expertState, expertAction = GetRandomTransitions(batchSize, stateDim, actionDim, -0.999, 0.999)
+        agentState , agentAction  = GetRandomTransitions(batchSize, stateDim, actionDim, -0.999, 0.999)
+        expertOldProb, agentOldProb = torch.randn(batchSize, 1) * 5, torch.randn(batchSize, 1) * 5
+
+        grads = []
+        for GetLogProb, GetLoss in ((agent.policy.GetLogProb, None), (lambda s, a: ReferenceLogProb(agent.policy, s, a), ReferenceLoss)):
+            agent.policy.zero_grad()
+            expertLogProb, agentLogProb = GetLogProb(expertState, expertAction), GetLogProb(agentState, agentAction)
+            if GetLoss is None:
+                loss = -(expertLogProb - LogAddExp(expertLogProb, expertOldProb)).mean() - (agentOldProb - LogAddExp(agentLogProb, agentOldProb)).mean()
+            else:
+                loss = GetLoss(expertLogProb, expertOldProb, agentLogProb, agentOldProb)
+            loss.backward()
+            grads.append((expertLogProb.detach(), loss.detach(), [param.grad.clone() for param in agent.policy.parameters()]))
+
+        (logProb, loss, grad), (refLogProb, refLoss, refGrad) = grads
+        result = {
+            "Squashing"   : str(squashing),
+            "LogProbError": (logProb - refLogProb).abs().max().item(),
+            "LossError"   : (loss - refLoss).abs().item(),
+            "GradError"   : max(((g - r).abs().max() / (r.abs().max() + EPS)).item() for g, r in zip(grad, refGrad))
+        }
+        results.append(result)
+        print(f"| Check LogProb | {str(squashing) :4s} | LogProb err: {result['LogProbError'] :.2e} | Loss err: {result['LossError'] :.2e} | Grad rel err: {result['GradError'] :.2e} |")
+
+    inputs = (torch.randn(16, actionDim, dtype=torch.float64, requires_grad=True), torch.randn(16, actionDim, dtype=torch.float64, requires_grad=True), torch.randn(16, actionDim, dtype=torch.float64))
+    isGradOk = torch.autograd.gradcheck(GaussianLogProb.apply, inputs)
+    print(f"| Check LogProb | gradcheck of GaussianLogProb: {isGradOk} |")
+    results.append({"GradCheck": isGradOk})
+    return results
+
+
+def BenchmarkLogProb(stateDim=28, actionDim=8, hiddenDim=256, batchSize=512, nRepeat=200):
+    results = []
+    for squashing in (None, "tanh"):
+        agent = ASAF1(stateDim, actionDim, hiddenDim, -1., 1., squashing=squashing)
+        state, action = GetRandomTransitions(batchSize, stateDim, actionDim, -0.999, 0.999)
+        for impl, GetLogProb in (("fused", agent.policy.GetLogProb), ("normal", lambda s, a: ReferenceLogProb(agent.policy, s, a))):
+            for name, isBackward in (("forward", False), ("backward", True)):
+                def Step():
+                    logProb = GetLogProb(state, action)
+                    if isBackward: logProb.sum().backward()
+
+                if isBackward:
+                    latency = TimeIt(Step, nRepeat)
+                else:
+                    with torch.no_grad():
+                        latency = TimeIt(Step, nRepeat)
+                results.append({"Squashing": str(squashing), "Impl": impl, "Pass": name, "BatchSize": batchSize, "Latency": latency})
+                print(f"| LogProb | {str(squashing) :4s} | {impl :6s} | {name :8s} | Batch: {batchSize :5d} | Latency: {latency * 1e6 :9.2f} us |")
+
+    return results
+
+
+def BenchmarkInitProb(stateDim=28, actionDim=8, hiddenDim=256, nExpert=25000, nAgent=4000, batchSize=256, nRepeat=5):
+    agent = ASAF1(stateDim, actionDim, hiddenDim, -1., 1.)
+    expertState, expertAction = GetRandomTransitions(nExpert, stateDim, actionDim)
+    agentState , agentAction  = GetRandomTransitions(nAgent , stateDim, actionDim)
+    latency = TimeIt(lambda: agent.GetInitProb(expertState, expertAction, agentState, agentAction, batchSize), nRepeat, 1)
+    print(f"| GetInitProb | Expert: {nExpert :6d} | Agent: {nAgent :5d} | Latency: {latency * 1e3 :9.2f} ms |")
+    return [{"Expert": nExpert, "Agent": nAgent, "Latency": latency}]
+
+
+# End-to-end Train on a synthetic env (no testing, everything is written into a temporary folder):
+def BenchmarkTrain(envName="SyntheticAnt-v0", maxTrans=20000, numTransUpdate=4000, epochsPerUpdate=10, batchSize=256, hiddenDim=256, numEnvs=1, numDemo=25000):
+    from train import Train
+
+    with tempfile.TemporaryDirectory() as folder:
+        demoPath = GenerateSyntheticDemo(envName, os.path.join(folder, "demo"), numDemo)
+        start    = time.perf_counter()
+        Train(demoPath, numDemo, envName, float("inf"), maxTrans, numTransUpdate, epochsPerUpdate, batchSize, 1., 1e-3, "Adam", {}, "StepLR", 
+              {"step_size": 1, "gamma": 1}, 0, hiddenDim, None, float("inf"), False, 1, False, folder, folder, 0, numEnvs)
+        elapsed  = time.perf_counter() - start
+
+    print(f"| Train | {envName} | Envs: {numEnvs :2d} | Trans: {maxTrans :7d} | Time: {elapsed :8.2f} s | {maxTrans / elapsed :9.1f} trans/s |")
+    return [{"Env": envName, "NumEnvs": numEnvs, "Transitions": maxTrans, "Seconds": elapsed, "TransPerSec": maxTrans / elapsed}]
+
+
+# Memory of the expert set, Fit throughput and the final test reward of a short training run in every precision:
+def BenchmarkPrecision(envName="SyntheticAnt-v0", hiddenDim=256, precisions=("fp32", "bf16"), maxTrans=20000, numTransUpdate=4000, epochsPerUpdate=10,
+                       batchSize=256, numDemo=25000, numTestEpisode=5):
+    from train import Train, GetDefaultConfig
+    from test import Test, LoadTestAgent
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        demoPath = GenerateSyntheticDemo(envName, os.path.join(folder, "demo"), numDemo)
+        for precision in precisions:
+            dtype = GetPrecisionDtype(precision)
+            expertBuffer = ExpertBuffer(demoPath, numDemo, "cpu", dtype)
+            agentBuffer  = AgentBuffer(numTransUpdate, "cpu", expertBuffer.states.size(1), expertBuffer.actions.size(1), dtype)
+            agentBuffer.SetData(*expertBuffer[:numTransUpdate])
+
+            torch.manual_seed(0)
+            agent   = ASAF1(expertBuffer.states.size(1), expertBuffer.actions.size(1), hiddenDim, -1., 1., gradClip=1., precision=precision)
+            nStep   = epochsPerUpdate * (numTransUpdate // batchSize + int(numTransUpdate % batchSize != 0))
+            start   = time.perf_counter()
+            agent.Fit(*expertBuffer[:], *agentBuffer[:], epochsPerUpdate, batchSize)
+            elapsed = time.perf_counter() - start
+
+            config = {
+                **GetDefaultConfig(), "expertDemoPath": demoPath, "maxExpertDemo": numDemo, "envName": envName, "endTrainReward": float("inf"),
+                "maxTrans": maxTrans, "numTransUpdate": numTransUpdate, "epochsPerUpdate": epochsPerUpdate, "batchSize": batchSize,
+                "scheduler": None, "hiddenDim": hiddenDim, "isTest": False, "modelSaveFolder": folder, "historySaveFolder": folder,
+                "seed": 0, "checkpointInterval": 0, "precision": precision
+            }
+            modelPath = Train(**config)["ModelPath"]
+            env       = MakeSyntheticEnv(envName)
+            env.seed(0)
+            testReward, _ = Test(LoadTestAgent(modelPath, env, hiddenDim), env, numTestEpisode)
+
+            results.append({
+                "Precision"  : precision,
+                "ExpertBytes": expertBuffer.GetMemorySize(),
+                "FitSeconds" : elapsed,
+                "StepsPerSec": nStep / elapsed,
+                "TestReward" : testReward
+            })
+            print(f"| Precision | {precision} | Expert: {expertBuffer.GetMemorySize() / 2 ** 20 :7.2f} MB | Fit: {nStep / elapsed :8.1f} steps/s | Test Reward: {testReward :.2f} |")
+
+    return results
+
+
+# Wall time of "import <module>" in a fresh interpreter (best of nRepeat), "python" is the bare interpreter startup:
+def BenchmarkImport(modules=("utils", "model", "data", "test", "train", "cli"), nRepeat=3):
+    import subprocess
+
+    folder  = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in ("python", ) + tuple(modules):
+        code    = "pass" if module == "python" else f"import {module}"
+        seconds = []
+        for _ in range(nRepeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=folder, check=True)
+            seconds.append(time.perf_counter() - start)
+
+        results.append({"Module": module, "Seconds": min(seconds)})
+        print(f"| Import | {module :8s} | {min(seconds) :7.3f} s |")
+
+    return results
+
+
+# Run every benchmark with the dims of a synthetic env and write the results into a json file:
+def RunSuite(outputPath, envName="SyntheticAnt-v0", hiddenDim=256, trainTrans=20000, numThreads=1, maxFitProcs=4):
+    torch.manual_seed(0)
+    np.random.seed(0)
+    torch.set_num_threads(numThreads)
+    dims = dict(stateDim=SYNTHETIC_ENVS[envName]["stateDim"], actionDim=SYNTHETIC_ENVS[envName]["actionDim"])
+    results = {
+        "Import": BenchmarkImport(),
+        "Meta": {
+            "Env"     : envName,
+            "Hidden"  : hiddenDim,
+            "Threads" : numThreads,
+            "Torch"   : torch.__version__,
+            "Numpy"   : np.__version__,
+            "Python"  : sys.version.split()[0],
+            "Machine" : platform.platform(),
+            "Time"    : time.strftime("%Y-%m-%d %H:%M:%S")
+        },
+        "Buffer"     : BenchmarkBuffer(**dims),
+        "LogProb"    : BenchmarkLogProb(**dims, hiddenDim=hiddenDim),
+        "LogProbCheck": CheckLogProb(**dims, hiddenDim=hiddenDim),
+        "GetInitProb": BenchmarkInitProb(**dims, hiddenDim=hiddenDim),
+        "Fit"        : BenchmarkFit(**dims, hiddenDim=hiddenDim),
+        "EnsembleFit": BenchmarkEnsembleFit(**dims, hiddenDim=hiddenDim),
+        "DataParallelFit": BenchmarkDataParallelFit(**dims, hiddenDim=hiddenDim, numProcs=range(1, maxFitProcs + 1)),
+        "Preprocess" : BenchmarkPreprocess(envName, hiddenDim),
+        "Act"        : BenchmarkAct(**dims, hiddenDim=hiddenDim),
+        "Train"      : BenchmarkTrain(envName, trainTrans, hiddenDim=hiddenDim) if trainTrans > 0 else [],
+        "Precision"  : BenchmarkPrecision(envName, hiddenDim, maxTrans=trainTrans) if trainTrans > 0 else []
+    }
+    with open(outputPath, "w") as f:
+        json.dump(results, f, indent=4)
+
+    return results
+
+
+# Latency of exported policies (see export.py) against ASAF1.Act:
+def BenchmarkExport(modelPath, minActVal=-1., maxActVal=1., squashing=None, batchSizes=(1, 64), nRepeat=1000, exportFolder=None):
+    from export import ExportPolicy, LoadPolicy
+    from inference import ExportedPolicy
+
+    # The exported files go to a temporary folder unless exportFolder is given:
+    if exportFolder is None:
+        with tempfile.TemporaryDirectory() as folder:
+            return BenchmarkExport(modelPath, minActVal, maxActVal, squashing, batchSizes, nRepeat, folder)
+
+    policy = LoadPolicy(modelPath, squashing)
+    agent  = ASAF1(policy.fc0.in_features, policy.mu.out_features, policy.fc0.out_features, minActVal, maxActVal, squashing=squashing)
+    agent.policy.load_state_dict(policy.state_dict())
+    agent.ToEvalMode()
+    paths = {"ASAF1.Act": agent.Act}
+    for exportFormat, ext in (("torchscript", ".pt"), ("onnx", ".onnx")):
+        try:
+            exportPath = ExportPolicy(modelPath, os.path.join(exportFolder, "benchmark_policy" + ext), minActVal, maxActVal, squashing, exportFormat)
+            paths[exportFormat] = ExportedPolicy(exportPath)
+        except ImportError as e:
+            print(f"Skip {exportFormat}: {e}")
+
+    results = []
+    for batchSize in batchSizes:
+        state = np.random.randn(batchSize, agent.policy.fc0.in_features) if batchSize > 1 else np.random.randn(agent.policy.fc0.in_features)
+        for name, func in paths.items():
+            if name != "ASAF1.Act" and not np.allclose(func(state), agent.Act(state), atol=1e-5):
+                raise RuntimeError(f"{name} does not match ASAF1.Act !")
+
+            latency = TimeIt(lambda: func(state), nRepeat)
+            results.append({"Path": name, "BatchSize": batchSize, "Latency": latency})
+            print(f"| Export | {name :11s} | Batch: {batchSize :4d} | Latency: {latency * 1e6 :9.2f} us |")
+
+    return results
+
+
+# TestGenerally rewards (same seeds) and Act latency of the int8 policy against the float policy of a checkpoint:
+def BenchmarkQuantized(modelPath, envName, hiddenDim=256, testNumSeed=50, numWorkers=1, batchSizes=(1, 64), nRepeat=1000):
+    from test import TestGenerally, LoadTestAgent
+    from rollout import MakeEnv
+
+    env     = MakeEnv(envName)
+    agents  = {backend: LoadTestAgent(modelPath, env, hiddenDim, backend) for backend in ("auto", "int8")}
+    results = []
+    for backend, agent in agents.items():
+        agent.ToEvalMode()
+        _, rewards = TestGenerally(modelPath, envName, testNumSeed, hiddenDim, numWorkers, actBackend=backend)
+        result = {"Backend": backend, "AvgReward": sum(rewards) / len(rewards), "MinReward": min(rewards), "Rewards": rewards}
+        for batchSize in batchSizes:
+            state = np.random.randn(batchSize, env.observation_space.shape[0]) if batchSize > 1 else np.random.randn(env.observation_space.shape[0])
+            result[f"Latency(B={batchSize})"] = TimeIt(lambda: agent.Act(state), nRepeat)
+        results.append(result)
+
+    states   = np.random.randn(1000, env.observation_space.shape[0])
+    maxError = float(np.abs(agents["int8"].Act(states) - agents["auto"].Act(states)).max())
+    env.close()
+    for result in results:
+        result["MaxActionError"] = maxError if result["Backend"] == "int8" else 0.
+        latency = " | ".join(f"B={b}: {result[f'Latency(B={b})'] * 1e6 :8.2f} us" for b in batchSizes)
+        print(f"| Quantized | {result['Backend'] :4s} | Avg reward: {result['AvgReward'] :9.2f} | Min reward: {result['MinReward'] :9.2f} | {latency} |")
+    print(f"Max |int8 - float| action = {maxError :.5f} | Reward change = {results[1]['AvgReward'] - results[0]['AvgReward'] :.2f}")
+
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark buffers, log-prob, Fit, Act and Train on a synthetic env.")
+    parser.add_argument("--output"    , default="benchmark.json")
+    parser.add_argument("--env"       , default="SyntheticAnt-v0", choices=list(SYNTHETIC_ENVS))
+    parser.add_argument("--hidden"    , type=int, default=256)
+    parser.add_argument("--trainTrans", type=int, default=20000, help="transitions of the end-to-end Train benchmark (0 = skip)")
+    parser.add_argument("--threads"   , type=int, default=1)
+    parser.add_argument("--fitProcs"  , type=int, default=4, help="data-parallel Fit is benchmarked with 1 ... fitProcs processes")
+    parser.add_argument("--quantized" , default=None, help="only compare the int8 and float policies of this checkpoint on --env")
+    parser.add_argument("--testEnv"   , default=None, help="env of --quantized (default: --env)")
+    parser.add_argument("--testSeeds" , type=int, default=50)
+    args = parser.parse_args()
+
+    if args.quantized:
+        torch.set_num_threads(args.threads)
+        BenchmarkQuantized(args.quantized, args.testEnv or args.env, args.hidden, args.testSeeds)
+    else:
+        RunSuite(args.output, args.env, args.hidden, args.trainTrans, args.threads, args.fitProcs)
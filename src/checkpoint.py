@@ -0,0 +1,98 @@
+import os
+import queue
+import random
+import threading
+import numpy as np
+
+import torch
+
+from utils import GetUniquePath
+
+
+# Copy of a (nested) state with every tensor cloned to CPU, so the training loop can keep mutating the originals:
+def Snapshot(state):
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    elif isinstance(state, np.ndarray):
+        return state.copy()
+    elif isinstance(state, dict):
+        return {key: Snapshot(value) for key, value in state.items()}
+    elif isinstance(state, (list, tuple)):
+        return type(state)(Snapshot(value) for value in state)
+    else:
+        return state
+
+
+def SaveCheckpoint(state, path, isUnique=True):
+    path    = GetUniquePath(path) if isUnique else path
+    tmpPath = path + ".tmp"
+    torch.save(state, tmpPath)
+    os.replace(tmpPath, path)
+    return path
+
+
+def LoadCheckpoint(path, device="cpu"):
+    try:
+        return torch.load(path, map_location=device, weights_only=False)
+    except TypeError:
+        return torch.load(path, map_location=device)
+
+
+def GetRandomState():
+    state = {
+        "python": random.getstate(),
+        "numpy" : np.random.get_state(),
+        "torch" : torch.get_rng_state()
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def SetRandomState(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+# Writes checkpoints in a background thread: Submit only snapshots the state, torch.save and the atomic
+# rename happen off the training loop. Errors of the thread are raised by the next Submit / Close:
+class CheckpointWriter:
+    def __init__(self, maxPending=2):
+        self.jobs   = queue.Queue(maxPending)
+        self.error  = None
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+        self.thread.start()
+
+    def Run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                SaveCheckpoint(*job)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.jobs.task_done()
+
+    def RaiseError(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def Submit(self, state, path, isUnique=True):
+        self.RaiseError()
+        self.jobs.put((Snapshot(state), path, isUnique))
+
+    # Block until every submitted checkpoint is written:
+    def Wait(self):
+        self.jobs.join()
+        self.RaiseError()
+
+    def Close(self):
+        self.jobs.put(None)
+        self.thread.join()
+        self.RaiseError()
@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import inspect
+import importlib
+
+
+# Config-driven entry points, the heavy modules are only imported by the command that needs them:
+#   python cli.py train --config train.yaml --set hiddenDim=64 seed=1
+#   python cli.py test  --config test.json
+#   python cli.py eval  --set modelPath=../model/ASAF1_256_Ant-v2.pth threshold=4000
+# The arguments are the defaults of the function, then the constants of its module, then the config file, then --set.
+COMMANDS = {
+    "train": ("train", "Train"),
+    "test" : ("test" , "TestAll"),
+    "eval" : ("test" , "TestGenerally")
+}
+
+
+def LoadConfig(path):
+    with open(path, "r") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            return yaml.safe_load(f) or {}
+        elif path.endswith(".json"):
+            return json.load(f)
+        else:
+            raise ValueError(f"Invalid config file {path} (.json, .yaml or .yml) !")
+
+
+# "name=value", the value is parsed as json when possible (numbers, booleans, null, lists, dicts), otherwise kept as a string:
+def ParseOverride(text):
+    if "=" not in text:
+        raise ValueError(f"Invalid override {text} (expected name=value) !")
+
+    name, value = text.split("=", 1)
+    try:
+        return name, json.loads(value)
+    except json.JSONDecodeError:
+        return name, value
+
+
+def BuildConfig(command, configPath=None, overrides=()):
+    moduleName, funcName = COMMANDS[command]
+    module     = importlib.import_module(moduleName)
+    func       = getattr(module, funcName)
+    parameters = inspect.signature(func).parameters
+
+    config = {name: p.default for name, p in parameters.items() if p.default is not inspect.Parameter.empty}
+    if hasattr(module, "GetDefaultConfig"):
+        config.update({name: value for name, value in module.GetDefaultConfig().items() if name in parameters})
+
+    userConfig = LoadConfig(configPath) if configPath else {}
+    userConfig.update(dict(ParseOverride(text) for text in overrides))
+    for name in userConfig:
+        if name not in parameters:
+            raise ValueError(f"Invalid argument {name} of {funcName} !")
+    config.update(userConfig)
+
+    missing = [name for name in parameters if name not in config]
+    if missing:
+        raise ValueError(f"Missing arguments {missing} of {funcName} !")
+
+    return func, {name: config[name] for name in parameters}
+
+
+def Main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run Train (train), TestAll (test) or TestGenerally (eval) from a YAML / JSON config.")
+    parser.add_argument("command" , choices=list(COMMANDS))
+    parser.add_argument("--config", default=None, help="YAML or JSON file of {argument: value}")
+    parser.add_argument("--set"   , nargs="*", default=[], metavar="NAME=VALUE", help="overrides of single arguments")
+    parser.add_argument("--dry"   , action="store_true", help="only print the resolved config")
+    args = parser.parse_args(argv)
+
+    func, config = BuildConfig(args.command, args.config, args.set)
+    print(json.dumps(config, indent=4, default=str))
+    if not args.dry:
+        result = func(**config)
+        print(json.dumps(result, indent=4, default=str))
+        return result
+
+
+if __name__ == '__main__':
+    Main()
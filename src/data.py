@@ -1,97 +1,297 @@
-import numpy as np
+import os
+import json
 import pickle
-import random
+import hashlib
+import numpy as np
 
 import torch
 from torch.utils.data import Dataset
 
+from utils import AtanhAction, EPS2
+
 
+# Transitions are stored in contiguous preallocated tensors (allocated from the first pushed transition 
+# if the dimensions are not given), so slicing a buffer on CPU returns views instead of copies.
+# dtype is the storage dtype of the transitions (e.g. torch.bfloat16 to halve the memory of large demo sets), actionDtype
+# the one of the actions if it differs:
 class Buffer(Dataset):
-    def __init__(self, nTransition, device="cpu"):
+    def __init__(self, nTransition, device="cpu", stateDim=None, actionDim=None, dtype=torch.float32, actionDtype=None):
         self.device      = device
-        self.transitions = [None for _ in range(nTransition)]
+        self.dtype       = dtype
+        self.actionDtype = actionDtype or dtype
+        self.nTransition = nTransition
+        self.states      = None
+        self.actions     = None
         self.pointer     = 0
+        self.isFull      = False
+        if stateDim is not None and actionDim is not None:
+            self.Allocate(stateDim, actionDim)
     
     def __getitem__(self, i):
         if isinstance(i, slice):
-            return [torch.tensor(data).to(self.device).float() for data in zip(*self.transitions[i])]
+            return [self.states[i].to(self.device), self.actions[i].to(self.device)]
 
-        state, action = self.transitions[i]
-        return (
-            torch.from_numpy(state ).to(self.device).float(), 
-            torch.from_numpy(action).to(self.device).float()
-        )
+        return self.states[i].to(self.device), self.actions[i].to(self.device)
     
     def __len__(self):
-        return len(self.transitions)
+        return self.nTransition
+
+    def Allocate(self, stateDim, actionDim):
+        self.SetData(torch.zeros([self.nTransition, stateDim], dtype=self.dtype), torch.zeros([self.nTransition, actionDim], dtype=self.actionDtype))
+
+    def SetData(self, states, actions):
+        self.states      = states .to(self.dtype)
+        self.actions     = actions.to(self.actionDtype)
+        self.nTransition = states.size(0)
+
+        # numpy has no bfloat16, such buffers are written through torch:
+        self.isNumpy = all(dtype in (torch.float32, torch.float64, torch.float16) for dtype in (self.dtype, self.actionDtype))
+        if self.isNumpy:
+            self.stateArray  = self.states .numpy()
+            self.actionArray = self.actions.numpy()
+
+    # Memory used by the stored transitions (in bytes):
+    def GetMemorySize(self):
+        if self.states is None:
+            return 0
+        return self.states.element_size() * self.states.nelement() + self.actions.element_size() * self.actions.nelement()
 
     def Sample(self, num):
-        transitions = random.sample(self.transitions, num)
-        return [torch.tensor(data).to(self.device).float() for data in zip(*transitions)]
+        index = torch.randperm(self.nTransition)[:num]
+        return [self.states[index].to(self.device), self.actions[index].to(self.device)]
     
     def Push(self, state, action):
-        self.transitions[self.pointer] = (state, action)
+        if self.states is None:
+            self.Allocate(np.size(state), np.size(action))
+
+        if self.isNumpy:
+            self.stateArray [self.pointer] = state
+            self.actionArray[self.pointer] = action
+        else:
+            self.states [self.pointer] = torch.as_tensor(np.asarray(state , dtype=np.float32))
+            self.actions[self.pointer] = torch.as_tensor(np.asarray(action, dtype=np.float32))
+        if self.pointer == self.nTransition - 1:
+            self.isFull = True
+
         self.pointer += 1
-        if self.pointer >= len(self.transitions):
+        if self.pointer >= self.nTransition:
             self.pointer = 0
     
     def Clear(self):
-        for i in range(len(self.transitions)):
-            self.transitions[i] = None
+        self.isFull = False
+
+    def StateDict(self):
+        return {"states": self.states, "actions": self.actions, "pointer": self.pointer, "isFull": self.isFull}
+
+    def LoadStateDict(self, state):
+        self.SetData(state["states"].clone(), state["actions"].clone())
+        self.pointer = state["pointer"]
+        self.isFull  = state["isFull"]
     
     def IsFull(self):
-        return self.transitions[-1] is not None
+        return self.isFull
 
 
+# With minActVal / maxActVal the demo goes through Preprocess (cached on disk), then the actions are already mapped to [-1, 1]
+# (and transformed by AtanhAction with tanh squashing), which ASAF1.Fit is told by isMapped / logJacobians. The mapped actions
+# stay in fp32 like their logJacobians, whatever the storage dtype of the states:
 class ExpertBuffer(Buffer):
-    def __init__(self, path, numData=None, device="cpu"):
-        super().__init__(0, device)
-        self.transitions = self.LoadData(path, numData)
+    def __init__(self, path, numData=None, device="cpu", dtype=torch.float32, minActVal=None, maxActVal=None, squashing=None, isDedup=False, cacheFolder=None):
+        isMapped = minActVal is not None and maxActVal is not None
+        super().__init__(0, device, dtype=dtype, actionDtype=torch.float32 if isMapped else dtype)
+        self.isMapped     = isMapped
+        self.logJacobians = None
+        self.stateMean    = None
+        self.stateStd     = None
+        if self.isMapped:
+            data = Preprocess(path, minActVal, maxActVal, numData, squashing, isDedup, cacheFolder)
+            self.SetData(data["states"], data["actions"])
+            self.stateMean, self.stateStd = data["stateMean"].to(device), data["stateStd"].to(device)
+            if data["logJacobians"] is not None:
+                self.logJacobians = data["logJacobians"].to(device)
+        else:
+            self.SetData(*self.LoadData(path, numData))
+
+        self.isFull = True
     
+    # path: a columnar demo folder (memory-mapped) or a legacy pickle file:
     def LoadData(self, path, numData=None):
-        with open(path, "rb") as f:
-            data = pickle.load(f)
-    
-        if numData is None:
-            return data
+        if IsDemoFolder(path):
+            states, actions = LoadDemo(path, numData)
         else:
-            return data[-numData:]
+            states, actions = LoadPickleDemo(path, numData)
+
+        return torch.from_numpy(states).to(self.dtype), torch.from_numpy(actions).to(self.dtype)
 
 
 class AgentBuffer(Buffer):
     pass
 
 
-def Preprocess():
-    pass
+# Columnar demo format: a folder with a small json header and contiguous raw state / action arrays:
+#   header.json = {"version": 1, "numData": N, "stateDim": S, "actionDim": A, "dtype": "float32"}
+#   states.bin  = N x S array, actions.bin = N x A array (C order)
+DEMO_VERSION     = 1
+DEMO_HEADER_FILE = "header.json"
+DEMO_STATE_FILE  = "states.bin"
+DEMO_ACTION_FILE = "actions.bin"
 
 
-if __name__ == "__main__":
-    trans = [
-        [np.array([2.1, 3.5, 6.7]), np.array([2.8, 4.1, 3.5, 4.3])],
-        [np.array([2.4, 4.3, 5.5]), np.array([2.4, 5.4, 4.5, 4.6])],
-        [np.array([3.3, 3.8, 1.5]), np.array([2.9, 5.0, 4.0, 7.6])],
-        [np.array([5.6, 6.2, 9.9]), np.array([2.7, 1.3, 5.4, 3.4])]
-    ]
-    device = torch.device("cuda:0")
-    
-    aBuffer = AgentBuffer(len(trans), device)
-    for tran in trans:
-        aBuffer.Push(*tran)
-        print(aBuffer.IsFull())
+def IsDemoFolder(path):
+    return os.path.isfile(os.path.join(path, DEMO_HEADER_FILE))
+
 
-    print(aBuffer.Sample(3))
+def ReadDemoHeader(path):
+    with open(os.path.join(path, DEMO_HEADER_FILE), "r") as f:
+        return json.load(f)
 
 
+# Only the pages of the last numData rows are read from disk (copy-on-write, the files are never modified):
+def LoadDemo(path, numData=None):
+    header  = ReadDemoHeader(path)
+    n       = header["numData"]
+    start   = 0 if numData is None else max(0, n - numData)
+    if n == 0:
+        return np.zeros([0, header["stateDim"]], header["dtype"]), np.zeros([0, header["actionDim"]], header["dtype"])
 
+    states  = np.memmap(os.path.join(path, DEMO_STATE_FILE ), dtype=header["dtype"], mode="c", shape=(n, header["stateDim"] ))
+    actions = np.memmap(os.path.join(path, DEMO_ACTION_FILE), dtype=header["dtype"], mode="c", shape=(n, header["actionDim"]))
+    return states[start:], actions[start:]
 
 
+def LoadPickleDemo(path, numData=None):
+    with open(path, "rb") as f:
+        data = pickle.load(f)
 
+    if numData is not None:
+        data = data[-numData:]
 
+    states, actions = zip(*data)
+    return np.stack(states), np.stack(actions)
 
 
+# Appends transitions to a columnar demo folder, the header is written when closing:
+class DemoWriter:
+    def __init__(self, path, dtype="float32"):
+        os.makedirs(path, exist_ok=True)
+        self.path       = path
+        self.dtype      = np.dtype(dtype)
+        self.numData    = 0
+        self.stateDim   = None
+        self.actionDim  = None
+        self.stateFile  = open(os.path.join(path, DEMO_STATE_FILE ), "wb")
+        self.actionFile = open(os.path.join(path, DEMO_ACTION_FILE), "wb")
 
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *args):
+        self.Close()
 
+    # states: np.array (shape=(N, stateDim)), actions: np.array (shape=(N, actionDim))
+    def Write(self, states, actions):
+        states  = np.ascontiguousarray(states , dtype=self.dtype)
+        actions = np.ascontiguousarray(actions, dtype=self.dtype)
+        if states.shape[0] != actions.shape[0]:
+            raise ValueError(f"Got {states.shape[0]} states but {actions.shape[0]} actions !")
+        if self.stateDim is None:
+            self.stateDim, self.actionDim = states.shape[1], actions.shape[1]
+        elif (self.stateDim, self.actionDim) != (states.shape[1], actions.shape[1]):
+            raise ValueError(f"Invalid transition dims {(states.shape[1], actions.shape[1])}, expected {(self.stateDim, self.actionDim)} !")
+
+        self.stateFile .write(states .tobytes())
+        self.actionFile.write(actions.tobytes())
+        self.numData += states.shape[0]
+
+    def Close(self):
+        if self.stateFile.closed:
+            return
+
+        self.stateFile .close()
+        self.actionFile.close()
+        header = {
+            "version"  : DEMO_VERSION,
+            "numData"  : self.numData,
+            "stateDim" : self.stateDim or 0,
+            "actionDim": self.actionDim or 0,
+            "dtype"    : self.dtype.name
+        }
+        with open(os.path.join(self.path, DEMO_HEADER_FILE), "w") as f:
+            json.dump(header, f, indent=4)
+
+
+# Convert a legacy pickle demo ([[state0, action0], [state1, action1], ...]) to the columnar demo format:
+def ConvertDemo(pklPath, demoPath, dtype="float32"):
+    states, actions = LoadPickleDemo(pklPath)
+    with DemoWriter(demoPath, dtype) as writer:
+        writer.Write(states, actions)
+
+
+# Preprocessed demos are cached in <demo folder>/cache, keyed by the path, size and mtime of the demo files and the preprocessing
+# settings (a rewritten demo gets a new mtime, so nothing has to be read to find the cache):
+PREPROCESS_VERSION = 2
+
+
+def GetDemoStamp(path):
+    files = [os.path.join(path, name) for name in (DEMO_HEADER_FILE, DEMO_STATE_FILE, DEMO_ACTION_FILE)] if IsDemoFolder(path) else [path]
+    stamp = []
+    for file in files:
+        stat = os.stat(file)
+        stamp.append([os.path.abspath(file), stat.st_size, stat.st_mtime_ns])
+
+    return stamp
+
+
+# Returns {"states", "actions" (mapped to [-1, 1], atanh-transformed with tanh squashing), "logJacobians" (None without tanh), "stateMean", "stateStd"}.
+# With isDedup, repeated (state, action) rows are dropped (the first one is kept):
+def Preprocess(path, minActVal, maxActVal, numData=None, squashing=None, isDedup=False, cacheFolder=None):
+    if squashing not in (None, "tanh"):
+        raise ValueError(f"Invalid squashing function {squashing} !")
+
+    settings    = {"version": PREPROCESS_VERSION, "minActVal": float(minActVal), "maxActVal": float(maxActVal), "numData": numData, "squashing": squashing, "isDedup": isDedup}
+    key         = hashlib.sha1(json.dumps({"demo": GetDemoStamp(path), **settings}, sort_keys=True).encode("utf-8")).hexdigest()
+    cacheFolder = cacheFolder or os.path.join(os.path.dirname(os.path.abspath(path)), "cache")
+    cachePath   = os.path.join(cacheFolder, f"{os.path.basename(os.path.normpath(path))}_{key[:16]}.pt")
+    if os.path.exists(cachePath):
+        return torch.load(cachePath)
+
+    states, actions = LoadDemo(path, numData) if IsDemoFolder(path) else LoadPickleDemo(path, numData)
+    states , actions = np.asarray(states, dtype=np.float32), np.asarray(actions, dtype=np.float32)
+    if isDedup:
+        _, index = np.unique(np.concatenate([states, actions], 1), axis=0, return_index=True)
+        index    = np.sort(index)
+        states, actions = states[index], actions[index]
+
+    # Same mapping as ASAF1.MapAction:
+    states , actions = torch.from_numpy(states), torch.from_numpy(actions)
+    toMinus, toDivide = (maxActVal + minActVal) * 0.5, (maxActVal - minActVal) * 0.5
+    actions      = (actions - toMinus) / toDivide
+    logJacobians = None
+    if squashing == "tanh":
+        actions, logJacobians = AtanhAction(actions)
+
+    data = {
+        "states"      : states,
+        "actions"     : actions,
+        "logJacobians": logJacobians,
+        "stateMean"   : states.mean(0),
+        "stateStd"    : states.std(0) + EPS2,
+        "settings"    : settings
+    }
+    os.makedirs(cacheFolder, exist_ok=True)
+    tmpPath = cachePath + ".tmp"
+    torch.save(data, tmpPath)
+    os.replace(tmpPath, cachePath)
+    return data
+
+
+if __name__ == "__main__":
+    import argparse
 
+    parser = argparse.ArgumentParser(description="Convert a pickle expert demo to the columnar demo format.")
+    parser.add_argument("pklPath" , help="legacy pickle demo file")
+    parser.add_argument("demoPath", help="output demo folder")
+    args = parser.parse_args()
 
+    ConvertDemo(args.pklPath, args.demoPath)
+    print(ReadDemoHeader(args.demoPath))
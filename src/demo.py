@@ -0,0 +1,78 @@
+import os
+import collections
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+from data import DemoWriter
+from test import RolloutSeed, InitTestWorker
+
+
+# test.RolloutSeed of the jobs (modelPath, envName, hiddenDim, seed, actBackend, squashing) -> (reward, states, actions) in order,
+# with at most 2 * numWorkers episodes in flight (the pending ones are cancelled when the consumer stops):
+def RunEpisodes(jobs, numWorkers=1):
+    if numWorkers <= 1:
+        for job in jobs:
+            yield RolloutSeed(job)
+        return
+
+    with ProcessPoolExecutor(numWorkers, mp_context=mp.get_context("spawn"), initializer=InitTestWorker) as pool:
+        futures = collections.deque()
+        try:
+            for job in jobs:
+                futures.append(pool.submit(RolloutSeed, job))
+                if len(futures) >= 2 * numWorkers:
+                    yield futures.popleft().result()
+
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+# Roll out a trained checkpoint on seeded episodes (seed, seed + 1, ...) and stream the transitions of the episodes with a reward >= minReward
+# to a columnar demo folder (see data.DemoWriter), until numData transitions are written (the last episode is cut) or maxEpisodes are run:
+def GenerateDemo(modelPath, envName, demoPath, numData, hiddenDim=256, squashing=None, minReward=-float("inf"), numWorkers=1, seed=0, maxEpisodes=1000):
+    from tqdm import tqdm
+
+    jobs    = ((modelPath, envName, hiddenDim, s, "auto", squashing) for s in range(seed, seed + maxEpisodes))
+    rewards = []
+    numEpisodes = 0
+    with DemoWriter(demoPath) as writer, tqdm(total=numData) as progress:
+        for episodeReward, states, actions in RunEpisodes(jobs, numWorkers):
+            numEpisodes += 1
+            if episodeReward < minReward:
+                continue
+
+            n = min(len(states), numData - writer.numData)
+            writer.Write(states[:n], actions[:n])
+            rewards.append(episodeReward)
+            progress.update(n)
+            if writer.numData >= numData:
+                break
+
+    avgReward = sum(rewards) / len(rewards) if rewards else 0.
+    print(f"Transitions = {writer.numData} | Episodes = {numEpisodes} (accepted {len(rewards)}) | Average reward of accepted = {avgReward :.2f}")
+    if writer.numData < numData:
+        print(f"Only {writer.numData} of {numData} transitions after {maxEpisodes} episodes !")
+
+    return {"DemoPath": demoPath, "Transition": writer.numData, "Episode": numEpisodes, "AcceptedEpisode": len(rewards), "AvgReward": avgReward}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate an expert demo folder from a trained checkpoint.")
+    parser.add_argument("modelPath")
+    parser.add_argument("demoPath")
+    parser.add_argument("--env"        , required=True)
+    parser.add_argument("--numData"    , type=int  , default=25000)
+    parser.add_argument("--hidden"     , type=int  , default=256)
+    parser.add_argument("--squashing"  , default=None, choices=["tanh"])
+    parser.add_argument("--minReward"  , type=float, default=-float("inf"), help="episodes with a smaller reward are dropped")
+    parser.add_argument("--workers"    , type=int  , default=os.cpu_count())
+    parser.add_argument("--seed"       , type=int  , default=0)
+    parser.add_argument("--maxEpisodes", type=int  , default=1000)
+    args = parser.parse_args()
+
+    GenerateDemo(args.modelPath, args.env, args.demoPath, args.numData, args.hidden, args.squashing, args.minReward, args.workers, args.seed, args.maxEpisodes)
@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import torch
+from torch.nn.utils import clip_grad_norm_
+
+from model import ASAF1
+from data import ExpertBuffer
+from checkpoint import LoadCheckpoint
+from demo import RunEpisodes
+from rollout import MakeEnv
+from utils import SeedEverything, GetTrainIteration
+
+
+# KL(teacher || student) of the (pre-squashing) diagonal Gaussians of two policies, summed over the action dims:
+def GaussianKL(teacherMean, teacherLogStd, studentMean, studentLogStd):
+    variance = (torch.exp(2 * teacherLogStd) + (teacherMean - studentMean) ** 2) / (2 * torch.exp(2 * studentLogStd))
+    return (studentLogStd - teacherLogStd + variance - 0.5).sum(-1)
+
+
+# States of the teacher's own episodes (seeds seed, seed + 1, ...) until numStates states are collected:
+def CollectRolloutStates(modelPath, envName, hiddenDim, squashing, numStates, numWorkers=1, seed=0, maxEpisodes=1000):
+    states, n = [], 0
+    if numStates > 0:
+        jobs = ((modelPath, envName, hiddenDim, s, "auto", squashing) for s in range(seed, seed + maxEpisodes))
+        for _, episodeStates, _ in RunEpisodes(jobs, numWorkers):
+            states.append(episodeStates[:numStates - n])
+            n += len(states[-1])
+            if n >= numStates:
+                break
+
+    return torch.from_numpy(np.concatenate(states)) if states else None
+
+
+# Fit the mean / std of student.policy to the ones of the teacher policy on the states, numSteps minibatches of batchSize random states:
+def Distill(teacher, student, states, numSteps=20000, batchSize=256):
+    with torch.no_grad():
+        targets = [teacher.GetMeanLogStd(states[s: e]) for s, e in GetTrainIteration(states.size(0), 4096)]
+        teacherMean, teacherLogStd = torch.cat([mean for mean, _ in targets]), torch.cat([logStd for _, logStd in targets])
+
+    student.ToTrainMode()
+    lossList = []
+    for _ in range(numSteps):
+        index = torch.randint(states.size(0), (batchSize, ))
+        studentMean, studentLogStd = student.policy.GetMeanLogStd(states[index])
+        loss = GaussianKL(teacherMean[index], teacherLogStd[index], studentMean, studentLogStd).mean()
+        student.optimizer.zero_grad()
+        loss.backward()
+        clip_grad_norm_(student.policy.parameters(), student.gradClip)
+        student.optimizer.step()
+        lossList.append(loss.item())
+
+    student.actor.Refresh()
+    return lossList
+
+
+# Distill the checkpoint into a student of every hidden dim (saved as ../model/ASAF1_{hiddenDim}_{envName}_distilled.pth) and report the test reward
+# (TestGenerally) and the Act latency of the teacher and of every student. The states are the last numExpertStates of the expert demo
+# and numRolloutStates of episodes of the teacher:
+def DistillCheckpoint(modelPath, envName, expertDemoPath, hiddenDims=(32, 64, 128), squashing=None, numExpertStates=25000, numRolloutStates=25000,
+                      numSteps=20000, batchSize=256, lr=1e-3, testNumSeed=10, numWorkers=1, seed=0, modelSaveFolder="../model"):
+    from benchmark import TimeIt
+    from test import TestGenerally, LoadTestAgent
+
+    env       = MakeEnv(envName)
+    stateDim  = env.observation_space.shape[0]
+    actionDim = env.action_space.shape[0]
+    maxAction = env.action_space.high[0]
+    minAction = env.action_space.low[0]
+    SeedEverything(seed, env)
+
+    teacherDim = LoadCheckpoint(modelPath)["policy"]["fc0.weight"].size(0)
+    teacher    = LoadTestAgent(modelPath, env, teacherDim, squashing=squashing).policy
+
+    # Distillation states:
+    expertStates  = ExpertBuffer(expertDemoPath, numExpertStates)[:][0].float() if numExpertStates > 0 else None
+    rolloutStates = CollectRolloutStates(modelPath, envName, teacherDim, squashing, numRolloutStates, numWorkers, seed)
+    states        = torch.cat([s for s in (expertStates, rolloutStates) if s is not None])
+    print(f"Distillation states = {states.size(0)} (expert: {0 if expertStates is None else expertStates.size(0)} | rollout: {0 if rolloutStates is None else rolloutStates.size(0)})")
+
+    state   = np.random.randn(stateDim)
+    results = []
+    for hiddenDim in (teacherDim, *hiddenDims):
+        torch.manual_seed(seed)
+        agent = ASAF1(stateDim, actionDim, hiddenDim, minAction, maxAction, lr=lr, gradClip=1., squashing=squashing)
+        if hiddenDim == teacherDim and not results:
+            agent.policy.load_state_dict(teacher.state_dict())
+            path, loss = modelPath, 0.
+        else:
+            loss = sum(Distill(teacher, agent, states, numSteps, batchSize)[-100:]) / min(100, numSteps)
+            path = agent.Save(os.path.join(modelSaveFolder, f"ASAF1_{hiddenDim}_{envName}_distilled.pth"))
+
+        print("-" * 50 + f"\n[{path}]")
+        avgReward, _ = TestGenerally(path, envName, testNumSeed, hiddenDim, numWorkers, squashing=squashing)
+        agent.ToEvalMode()
+        latency = TimeIt(lambda: agent.Act(state), 1000)
+        results.append({
+            "ModelPath": path,
+            "HiddenDim": hiddenDim,
+            "Params"   : sum(p.numel() for p in agent.policy.parameters()),
+            "KL"       : loss,
+            "AvgReward": avgReward,
+            "Latency"  : latency
+        })
+
+    env.close()
+    print("\n" + "=" * 70)
+    for result in results:
+        print(f"| Hidden: {result['HiddenDim'] :4d} | Params: {result['Params'] :7d} | KL: {result['KL'] :.2e} | Avg reward: {result['AvgReward'] :9.2f} | Latency: {result['Latency'] * 1e6 :7.2f} us | Speedup: {results[0]['Latency'] / result['Latency'] :5.2f} |")
+
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distill an ASAF1 checkpoint into policies with smaller hidden dims.")
+    parser.add_argument("modelPath")
+    parser.add_argument("expertDemoPath")
+    parser.add_argument("--env"          , required=True)
+    parser.add_argument("--hidden"       , type=int  , nargs="+", default=[32, 64, 128])
+    parser.add_argument("--squashing"    , default=None, choices=["tanh"])
+    parser.add_argument("--expertStates" , type=int  , default=25000)
+    parser.add_argument("--rolloutStates", type=int  , default=25000)
+    parser.add_argument("--steps"        , type=int  , default=20000)
+    parser.add_argument("--batchSize"    , type=int  , default=256)
+    parser.add_argument("--lr"           , type=float, default=1e-3)
+    parser.add_argument("--testSeeds"    , type=int  , default=10)
+    parser.add_argument("--workers"      , type=int  , default=1)
+    parser.add_argument("--seed"         , type=int  , default=0)
+    parser.add_argument("--modelFolder"  , default="../model")
+    args = parser.parse_args()
+
+    DistillCheckpoint(args.modelPath, args.env, args.expertDemoPath, args.hidden, args.squashing, args.expertStates, args.rolloutStates,
+                      args.steps, args.batchSize, args.lr, args.testSeeds, args.workers, args.seed, args.modelFolder)
@@ -0,0 +1,212 @@
+import io
+import socket
+import weakref
+import datetime
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from model import ASAF1
+
+
+# Data-parallel ASAF1.Fit on the CPU gloo backend. The learner is rank 0 and keeps worker processes (ranks 1 ... N - 1) alive
+# between Fits. For every Fit the learner draws the schedule and computes πG as usual, copies the tensors into shared memory and
+# sends its agent state (policy, optimizer) to the workers. Then every process runs its shard of every minibatch, and the gradients
+# are all-reduced before the clip and the optimizer step, so all the processes take the same step and the learner's agent is a
+# normal ASAF1 (Save / Load / schedulers are unchanged).
+
+FIT_TENSORS = ("expertState", "expertAction", "expertOldProb", "expertLogJacobian", "agentState", "agentAction", "agentOldProb", "agentLogJacobian")
+
+
+def GetFreePort():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Part rank of worldSize of a minibatch index (slice or LongTensor):
+def ShardIndex(index, rank, worldSize):
+    if isinstance(index, slice):
+        n = index.stop - index.start
+        return slice(index.start + n * rank // worldSize, index.start + n * (rank + 1) // worldSize)
+
+    return index.tensor_split(worldSize)[rank]
+
+
+def GetIndexSize(index):
+    return index.stop - index.start if isinstance(index, slice) else index.numel()
+
+
+# Averages the gradients (and the two losses) of a minibatch over the processes. The expert and the agent loss of a process are weighted
+# by its share of the expert and of the agent rows (before the backward), so the summed gradients are the ones of the whole minibatch
+# even when the two shares differ (e.g. an uneven last batch):
+class GradientAllReduce:
+    def __init__(self, policy):
+        self.params       = list(policy.parameters())
+        self.flat         = torch.zeros(sum(p.numel() for p in self.params) + 2)
+        self.expertWeight = 1.
+        self.agentWeight  = 1.
+
+    # The loss ASAF1.UpdatePolicy runs the backward of:
+    def WeightLoss(self, expertLoss, agentLoss):
+        return expertLoss * self.expertWeight + agentLoss * self.agentWeight
+
+    def __call__(self, expertLoss, agentLoss):
+        offset = 0
+        for p in self.params:
+            self.flat[offset: offset + p.numel()].copy_(p.grad.reshape(-1))
+            offset += p.numel()
+        self.flat[-2], self.flat[-1] = expertLoss.float() * self.expertWeight, agentLoss.float() * self.agentWeight
+
+        dist.all_reduce(self.flat)
+
+        offset = 0
+        for p in self.params:
+            p.grad.copy_(self.flat[offset: offset + p.numel()].view_as(p.grad))
+            offset += p.numel()
+
+        return self.flat[-2], self.flat[-1]
+
+
+# Shard rank of worldSize of a minibatch index and its weight (share of the rows). A process with an empty shard (a batch smaller than the
+# number of processes) runs the whole batch with weight 0, so it still takes part in the all-reduce:
+def GetShard(index, rank, worldSize):
+    size  = GetIndexSize(index)
+    shard = ShardIndex(index, rank, worldSize)
+    if GetIndexSize(shard) == 0:
+        return index, 0.
+
+    return shard, GetIndexSize(shard) / size
+
+
+# Every process runs the minibatches of the schedule on its own shard of the expert and of the agent rows:
+def RunShardedSchedule(agent, schedule, tensors, allReduce, rank, worldSize):
+    expertState, expertAction, expertOldProb, expertLogJacobian, agentState, agentAction, agentOldProb, agentLogJacobian = (tensors[name] for name in FIT_TENSORS)
+
+    expertLossList, agentLossList = [], []
+    for batches in schedule:
+        for iE, iA in batches:
+            iE, allReduce.expertWeight = GetShard(iE, rank, worldSize)
+            iA, allReduce.agentWeight  = GetShard(iA, rank, worldSize)
+
+            expertLoss, agentLoss = agent.UpdatePolicy(
+                expertState[iE], expertAction[iE], expertOldProb[iE],
+                agentState [iA], agentAction [iA], agentOldProb [iA],
+                None if expertLogJacobian is None else expertLogJacobian[iE],
+                None if agentLogJacobian  is None else agentLogJacobian [iA]
+            )
+            expertLossList.append(expertLoss)
+            agentLossList .append(agentLoss )
+
+    return sum(expertLossList) / len(expertLossList), sum(agentLossList) / len(agentLossList)
+
+
+def FitWorker(rank, worldSize, initMethod, timeout, agentParams, commandQueue, numThreads):
+    torch.set_num_threads(numThreads)
+    dist.init_process_group("gloo", init_method=initMethod, rank=rank, world_size=worldSize, timeout=timeout)
+
+    agent     = ASAF1(**agentParams)
+    allReduce = GradientAllReduce(agent.policy)
+    agent.gradHook = allReduce
+    agent.ToTrainMode()
+
+    shared = {}
+    try:
+        while True:
+            command = commandQueue.get()
+            if command is None:
+                break
+
+            stateBytes, newShared, sizes, schedule = command
+            shared.update(newShared)
+            agent.LoadStateDict(torch.load(io.BytesIO(stateBytes), weights_only=False), isLoadOptimizer=True)
+
+            tensors = {name: None if size is None else shared[name][:size] for name, size in sizes.items()}
+            RunShardedSchedule(agent, schedule, tensors, allReduce, rank, worldSize)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dist.destroy_process_group()
+
+
+# Persistent group of numProcs - 1 worker processes for data-parallel Fits of agent (which has to be on the CPU).
+# agentParams are the ASAF1 arguments of agent (the workers build the same policy and optimizer).
+# The expert tensors are only copied to shared memory again when other tensor objects are passed (they must not change in place):
+class DataParallelFit:
+    def __init__(self, agent, agentParams, numProcs=2, numThreads=1, timeout=300):
+        if agent.policy.fc0.weight.device.type != "cpu":
+            raise ValueError(f"Invalid device {agent.policy.fc0.weight.device} for a data-parallel Fit (gloo only runs on the CPU) !")
+        if numProcs < 2:
+            raise ValueError(f"Invalid number of processes {numProcs} for a data-parallel Fit !")
+
+        ctx = mp.get_context("spawn")
+        self.agent     = agent
+        self.worldSize = numProcs
+        self.allReduce = GradientAllReduce(agent.policy)
+        self.shared    = {}
+        self.sources   = {}
+        self.queues    = [ctx.Queue() for _ in range(numProcs - 1)]
+        self.processes = []
+
+        initMethod = f"tcp://127.0.0.1:{GetFreePort()}"
+        timeout    = datetime.timedelta(seconds=timeout)
+        workerParams = {**agentParams, "scheduler": None}
+        for rank in range(1, numProcs):
+            args    = (rank, numProcs, initMethod, timeout, workerParams, self.queues[rank - 1], numThreads)
+            process = ctx.Process(target=FitWorker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+
+        dist.init_process_group("gloo", init_method=initMethod, rank=0, world_size=numProcs, timeout=timeout)
+
+    # Copies the tensors into shared memory, returns the shared tensors (re)allocated by this call:
+    def Stage(self, tensors):
+        newShared = {}
+        for name, tensor in tensors.items():
+            if tensor is None:
+                continue
+
+            shared = self.shared.get(name)
+            if shared is None or shared.size(0) < tensor.size(0) or shared.shape[1:] != tensor.shape[1:] or shared.dtype != tensor.dtype:
+                shared = torch.empty(tensor.shape, dtype=tensor.dtype).share_memory_()
+                self.shared[name], newShared[name] = shared, shared
+                self.sources.pop(name, None)
+
+            source = self.sources.get(name)
+            if source is None or source() is not tensor:
+                shared[:tensor.size(0)].copy_(tensor)
+                self.sources[name] = weakref.ref(tensor)
+
+        return newShared
+
+    # Same arguments and result as ASAF1.Fit:
+    def Fit(self, expertState, expertAction, agentState, agentAction, epochs, batchSize, isExpertMapped=False, expertLogJacobian=None):
+        agent = self.agent
+        schedule, expertAction, agentAction, agentLogJacobian, expertOldProb, agentOldProb = agent.PrepareFit(
+            expertState, expertAction, agentState, agentAction, epochs, batchSize, isExpertMapped, expertLogJacobian
+        )
+        tensors = dict(zip(FIT_TENSORS, (expertState, expertAction, expertOldProb, expertLogJacobian, agentState, agentAction, agentOldProb, agentLogJacobian)))
+
+        with agent.timer("Fit.share"):
+            newShared  = self.Stage(tensors)
+            sizes      = {name: None if tensor is None else tensor.size(0) for name, tensor in tensors.items()}
+            stateBytes = io.BytesIO()
+            torch.save(agent.StateDict(), stateBytes)
+            for queue in self.queues:
+                queue.put((stateBytes.getvalue(), newShared, sizes, schedule))
+
+        agent.gradHook = self.allReduce
+        try:
+            with agent.timer("Fit.epochs"):
+                return RunShardedSchedule(agent, schedule, tensors, self.allReduce, 0, self.worldSize)
+        finally:
+            agent.gradHook = None
+            agent.actor.Refresh()
+
+    def Close(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+        dist.destroy_process_group()
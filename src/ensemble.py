@@ -0,0 +1,299 @@
+import os
+import math
+import numpy as np
+
+import torch
+import torch.nn as nn
+
+from model import ASAF1, GaussianPolicy, PolicyActor, GetOptimizer, GetScheduler, GetSchedulerState, LogAddExp, INF
+from data import ExpertBuffer, AgentBuffer
+from utils import GetTrainIteration, SeedEverything, GetUniquePath
+from sampler import GetSampler
+from rollout import MakeEnv, MakeVecEnv, Collector
+from test import Test
+
+
+# N independent linear layers: weight (N, outDim, inDim) and bias (N, outDim), so member i is nn.Linear with weight[i] and bias[i]:
+class EnsembleLinear(nn.Module):
+    def __init__(self, numMembers, inDim, outDim):
+        super().__init__()
+        self.in_features  = inDim
+        self.out_features = outDim
+        self.weight = nn.Parameter(torch.empty(numMembers, outDim, inDim))
+        self.bias   = nn.Parameter(torch.empty(numMembers, outDim))
+        self.ResetParameters()
+
+    # Same distribution as the default initialization of nn.Linear:
+    def ResetParameters(self):
+        bound = 1 / math.sqrt(self.in_features)
+        nn.init.uniform_(self.weight, -bound, bound)
+        nn.init.uniform_(self.bias  , -bound, bound)
+
+    # x: (N, B, inDim) -> (N, B, outDim)
+    def forward(self, x):
+        return torch.baddbmm(self.bias.unsqueeze(1), x, self.weight.transpose(1, 2))
+
+
+# N GaussianPolicy stacked along the first dim of every parameter (forward and GetLogProb work on (N, B, dim) tensors):
+class EnsemblePolicy(GaussianPolicy):
+    def __init__(self, numMembers, stateDim, actionDim, hiddenDim=256, squashing=None):
+        nn.Module.__init__(self)
+        self.numMembers = numMembers
+        self.fc0   = EnsembleLinear(numMembers, stateDim, hiddenDim)
+        self.fc1   = EnsembleLinear(numMembers, hiddenDim, hiddenDim)
+        self.mu    = EnsembleLinear(numMembers, hiddenDim, actionDim)
+        self.sigma = EnsembleLinear(numMembers, hiddenDim, actionDim)
+        self.Initialize()
+
+        self.squashing = squashing
+
+    # state: (N, B, stateDim) -> action mean: (N, B, actionDim) (the sigma head is skipped)
+    def Mean(self, state):
+        h = torch.relu(self.fc0(state))
+        h = torch.relu(self.fc1(h))
+        return self.mu(h)
+
+    # State dict of member i in the format of GaussianPolicy:
+    def MemberStateDict(self, i):
+        return {name: value[i].clone() for name, value in self.state_dict().items()}
+
+    def LoadMemberStateDict(self, i, stateDict):
+        with torch.no_grad():
+            for name, value in self.state_dict().items():
+                value[i].copy_(stateDict[name])
+
+
+class ASAF1Ensemble(ASAF1):
+    def __init__(self, numMembers, stateDim, actionDim, hiddenDim, minActVal, maxActVal, optimizer="Adam", scheduler=None,
+                 lr=1e-3, gradClip=INF, squashing=None, schedulerWarmup=0, optimizerParams={}, schedulerParams={}, isFusedUpdate=True, sampling="window"):
+        super().__init__(stateDim, actionDim, hiddenDim, minActVal, maxActVal, optimizer=None, gradClip=gradClip, squashing=squashing,
+                         isFusedUpdate=isFusedUpdate, sampling=sampling)
+
+        # Only the policy (and the optimizer / scheduler on its parameters) differ from ASAF1, Act is overridden below:
+        self.numMembers = numMembers
+        self.policy     = EnsemblePolicy(numMembers, stateDim, actionDim, hiddenDim, squashing)
+        self.optimizer  = GetOptimizer(optimizer, self.policy.parameters(), lr, **optimizerParams)
+        self.scheduler  = GetScheduler(scheduler, self.optimizer, schedulerWarmup, **schedulerParams)
+        self.actor      = PolicyActor(self.policy, minActVal, maxActVal)
+
+        # Kept for Member (an ASAF1 with the same settings):
+        self.memberParams = dict(stateDim=stateDim, actionDim=actionDim, hiddenDim=hiddenDim, minActVal=minActVal, maxActVal=maxActVal,
+                                 optimizer=optimizer, scheduler=scheduler, lr=lr, gradClip=gradClip, squashing=squashing, schedulerWarmup=schedulerWarmup,
+                                 optimizerParams=optimizerParams, schedulerParams=schedulerParams, isFusedUpdate=isFusedUpdate, sampling=sampling)
+
+    # Clip the gradient norm of every member separately (as clip_grad_norm_ on each policy):
+    def ClipGradNorm(self):
+        grads = [param.grad for param in self.policy.parameters() if param.grad is not None]
+        norms = torch.stack([grad.pow(2).flatten(1).sum(1) for grad in grads]).sum(0).sqrt()
+        coef  = torch.clamp(self.gradClip / (norms + 1e-6), max=1.)
+        for grad in grads:
+            grad.mul_(coef.view(-1, *[1] * (grad.dim() - 1)))
+
+    # One step update of every member, the expert batch (B, dim) is shared and the agent batch is (N, B, dim).
+    # The losses of the members are summed, so every member only gets the gradient of its own loss:
+    def UpdatePolicy(self, expertState, expertAction, expertOldProb, agentState, agentAction, agentOldProb):
+        expertState  = expertState .unsqueeze(0).expand(self.numMembers, -1, -1)
+        expertAction = expertAction.unsqueeze(0).expand(self.numMembers, -1, -1)
+        if self.isFused:
+            logProb = self.policy.GetLogProb(torch.cat([expertState, agentState], 1), torch.cat([expertAction, agentAction], 1))
+            expertLogProb, agentLogProb = logProb[:, :expertState.size(1)], logProb[:, expertState.size(1):]
+        else:
+            expertLogProb = self.policy.GetLogProb(expertState, expertAction)
+            agentLogProb  = self.policy.GetLogProb(agentState , agentAction )
+
+        expertLoss = -(expertLogProb - LogAddExp(expertLogProb, expertOldProb)).mean((1, 2))
+        agentLoss  = -(agentOldProb  - LogAddExp(agentLogProb , agentOldProb )).mean((1, 2))
+
+        loss = (expertLoss + agentLoss).sum()
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.ClipGradNorm()
+        self.optimizer.step()
+
+        return expertLoss.detach(), agentLoss.detach()
+
+    # πG of the expert rows for every member: (N, nExpert, 1), and of the agent transitions of every member: (N, nAgent, 1)
+    def GetInitProb(self, expertState, expertAction, agentState, agentAction, batchSize, expertRows=None):
+        device, nExpertTransition, nAgentTransition = expertState.device, expertState.size(0), agentState.size(1)
+        if expertRows is None:
+            expertRows = [slice(s, e) for s, e in GetTrainIteration(nExpertTransition, batchSize)]
+
+        with torch.no_grad():
+            expertOldProb = torch.zeros([self.numMembers, nExpertTransition, 1], device=device)
+            for index in expertRows:
+                state  = expertState [index].unsqueeze(0).expand(self.numMembers, -1, -1)
+                action = expertAction[index].unsqueeze(0).expand(self.numMembers, -1, -1)
+                expertOldProb[:, index] = self.policy.GetLogProb(state, action)
+
+            agentOldProb  = torch.zeros([self.numMembers, nAgentTransition, 1], device=device)
+            for s, e in GetTrainIteration(nAgentTransition, batchSize):
+                agentOldProb[:, s: e] = self.policy.GetLogProb(agentState[:, s: e], agentAction[:, s: e])
+
+        return expertOldProb, agentOldProb
+
+    # Update every member for many times against the same expert minibatches.
+    # agentState: (N, nAgent, stateDim), agentAction: (N, nAgent, actionDim) (the transitions of every member)
+    # -> mean expert loss and mean agent loss of every member: np.array (shape=(N, ))
+    def Fit(self, expertState, expertAction, agentState, agentAction, epochs, batchSize):
+        nExpertTransition, nAgentTransition = expertState.size(0), agentState.size(1)
+        if self.optimizer:
+            sampler  = GetSampler(self.sampling, nExpertTransition, nAgentTransition, batchSize, expertState.device)
+            schedule = sampler.Schedule(epochs)
+
+            expertAction  , agentAction   = self.MapAction(expertAction), self.MapAction(agentAction)
+            with self.timer("GetInitProb"):
+                expertOldProb, agentOldProb = self.GetInitProb(expertState, expertAction, agentState, agentAction, batchSize, sampler.ExpertRows(schedule))
+
+            expertLossList, agentLossList = [], []
+            with self.timer("Fit.epochs"):
+                for batches in schedule:
+                    for iE, iA in batches:
+                        expertLoss, agentLoss = self.UpdatePolicy(
+                            expertState[iE], expertAction[iE], expertOldProb[:, iE],
+                            agentState [:, iA], agentAction [:, iA], agentOldProb [:, iA]
+                        )
+                        expertLossList.append(expertLoss)
+                        agentLossList .append(agentLoss )
+
+            return torch.stack(expertLossList).mean(0).cpu().numpy(), torch.stack(agentLossList).mean(0).cpu().numpy()
+        else:
+            raise Exception("There is no optimizer, so we cannot update policy !")
+
+    # state: np.array (shape=(N, stateDim) or (N, B, stateDim)), row i is given to member i
+    def Act(self, state):
+        state    = np.asarray(state, dtype=np.float32)
+        isSingle = state.ndim == 2
+        with torch.inference_mode():
+            state = torch.from_numpy(state).to(self.policy.fc0.weight.device).view(self.numMembers, -1, state.shape[-1])
+            mean  = self.policy.Mean(state)
+            if self.policy.squashing == "tanh":
+                mean = torch.tanh(mean)
+            action = self.RecoverAction(mean).cpu().numpy()
+
+        return action[:, 0] if isSingle else action
+
+    def SetDevice(self, device):
+        self.policy.to(device)
+
+    # Checkpoint of member i in the format of ASAF1.Save (the optimizer state is sliced out of the stacked one):
+    def MemberStateDict(self, i):
+        optimizer = {}
+        if self.optimizer:
+            state, params = self.optimizer.state_dict(), list(self.policy.parameters())
+            optimizer = {
+                "state"       : {k: {name: value[i].clone() if torch.is_tensor(value) and value.shape == params[k].shape else value
+                                     for name, value in paramState.items()} for k, paramState in state["state"].items()},
+                "param_groups": state["param_groups"]
+            }
+
+        return {
+            "policy"   : self.policy.MemberStateDict(i),
+            "optimizer": optimizer,
+            "scheduler": GetSchedulerState(self.scheduler)
+        }
+
+    # Load member i from a checkpoint of ASAF1.Save (only the policy):
+    def LoadMemberStateDict(self, i, checkpoint):
+        self.policy.LoadMemberStateDict(i, checkpoint["policy"])
+
+    # Member i as an ASAF1 agent (e.g. for Test):
+    def Member(self, i):
+        agent = ASAF1(**self.memberParams, actBackend="auto")
+        agent.LoadStateDict(self.MemberStateDict(i), isLoadOptimizer=bool(self.optimizer))
+        agent.SetDevice(self.policy.fc0.weight.device)
+        return agent
+
+    def SaveMember(self, i, path, writer=None):
+        if writer is None:
+            path = GetUniquePath(path)
+            torch.save(self.MemberStateDict(i), path)
+            return path
+        else:
+            writer.Submit(self.MemberStateDict(i), path)
+
+
+# Train numMembers agents (seeds) at once: member i acts in its own environment and fills its own agent buffer,
+# and one Fit updates all members when the buffers are full. Every member is saved in the format of ASAF1.Save:
+def TrainEnsemble(numMembers, expertDemoPath, maxExpertDemo, envName, maxTrans, numTransUpdate, epochsPerUpdate, batchSize,
+                  gradClip, lr, optimizer, optimizerParams, scheduler, schedulerParams, schedulerWarmup, hiddenDim, squashing,
+                  numTestEpisode, modelSaveFolder, seed, sampling="window"):
+    # Environment:
+    env       = MakeEnv(envName)
+    stateDim  = env.observation_space.shape[0]
+    actionDim = env.action_space.shape[0]
+    maxAction = env.action_space.high[0]
+    minAction = env.action_space.low[0]
+
+    # Random seed and device:
+    SeedEverything(seed, env)
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+    # Transition buffers (one agent buffer per member):
+    expertBuffer = ExpertBuffer(expertDemoPath, maxExpertDemo, device)
+    agentBuffers = [AgentBuffer(numTransUpdate, device, stateDim, actionDim) for _ in range(numMembers)]
+
+    # Agents:
+    agent = ASAF1Ensemble(numMembers, stateDim, actionDim, hiddenDim, minAction, maxAction, optimizer, scheduler, lr,
+                          gradClip, squashing, schedulerWarmup, optimizerParams, schedulerParams, sampling=sampling)
+    agent.SetDevice(device)
+    agent.ToTrainMode()
+
+    # Environment i is driven by member i:
+    collector = Collector(MakeVecEnv(envName, numMembers, seed, env), agent)
+
+    # Training process:
+    nowLR = 0.
+    expertStates, expertActions = expertBuffer[:]
+    totalEpisode, totalNumTrans = 0, 0
+    ewmaRewards = np.zeros(numMembers)
+    while totalNumTrans < maxTrans:
+        states, actions, finishedEpisodes = collector.Step()
+        for i in range(numMembers):
+            agentBuffers[i].Push(states[i], actions[i])
+        totalNumTrans += numMembers
+
+        # Update all members (the buffers are filled at the same rate):
+        if agentBuffers[0].IsFull():
+            agentStates  = torch.stack([buffer.states  for buffer in agentBuffers]).to(device)
+            agentActions = torch.stack([buffer.actions for buffer in agentBuffers]).to(device)
+            agent.Fit(expertStates, expertActions, agentStates, agentActions, epochsPerUpdate, batchSize)
+            for buffer in agentBuffers:
+                buffer.Clear()
+            nowLR = agent.UpdateScheduler()
+
+        for i, episodeReward, episodeNumTrans in finishedEpisodes:
+            totalEpisode  += 1
+            ewmaRewards[i] = ewmaRewards[i] * 0.95 + episodeReward * 0.05
+            print(f"| Epi: {totalEpisode} | Member: {i :2d} | Total trans: {totalNumTrans :7d} | Epi trans: {episodeNumTrans :5d} | Epi Reward: {episodeReward :.2f} | EWMA Reward: {ewmaRewards[i] :.2f} | LR: {nowLR :.6f} |")
+
+    collector.Close()
+    if numMembers > 1: env.close()
+
+    # Test and save every member:
+    testEnv = MakeEnv(envName)
+    results = []
+    for i in range(numMembers):
+        testReward, _ = Test(agent.Member(i), testEnv, numTestEpisode)
+        modelPath     = agent.SaveMember(i, os.path.join(modelSaveFolder, f"ASAF1_{hiddenDim}_{envName}_M={i}_R={round(testReward)}.pth"))
+        results.append({"Member": i, "ModelPath": modelPath, "TestReward": testReward})
+        print(f"Member {i :2d} | Test Reward = {testReward :.2f} | {modelPath}")
+
+    testEnv.close()
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    from train import GetDefaultConfig
+
+    parser = argparse.ArgumentParser(description="Train an ensemble of ASAF1 agents with the constants of train.py.")
+    parser.add_argument("--members", type=int, default=4)
+    args = parser.parse_args()
+
+    config = GetDefaultConfig()
+    TrainEnsemble(
+        args.members, config["expertDemoPath"], config["maxExpertDemo"], config["envName"], config["maxTrans"], config["numTransUpdate"],
+        config["epochsPerUpdate"], config["batchSize"], config["gradClip"], config["lr"], config["optimizer"], config["optimizerParams"],
+        config["scheduler"], config["schedulerParams"], config["schedulerWarmup"], config["hiddenDim"], config["squashing"],
+        config["numTestEpisode"], config["modelSaveFolder"], config["seed"], config["sampling"]
+    )
@@ -0,0 +1,164 @@
+import math
+
+
+# Sequential evaluation: episodes are collected in rounds and stopped as soon as the decision (which checkpoint is the best /
+# whether a reward threshold is reached) is settled at the given confidence. Bounds of the mean use the Student-t quantile of
+# n - 1 degrees of freedom, and the error rate 1 - confidence is split evenly over all the looks at the data (Bonferroni).
+
+# P(|T| < t) of the Student-t distribution with df (integer >= 1) degrees of freedom (Abramowitz & Stegun 26.7.3 / 26.7.4):
+def GetTwoSidedT(t, df):
+    theta = math.atan(t / math.sqrt(df))
+    cos2  = math.cos(theta) ** 2
+    if df % 2:
+        term = total = math.cos(theta) if df > 1 else 0.
+        for k in range(1, (df - 1) // 2):
+            term  *= cos2 * 2 * k / (2 * k + 1)
+            total += term
+        return 2 / math.pi * (theta + math.sin(theta) * total)
+    else:
+        term = total = 1.
+        for k in range(1, df // 2):
+            term  *= cos2 * (2 * k - 1) / (2 * k)
+            total += term
+        return math.sin(theta) * total
+
+
+# P(T < t) of the Student-t distribution (a fractional df is rounded down, which is conservative):
+def GetTCdf(t, df):
+    return 0.5 + math.copysign(0.5 * GetTwoSidedT(abs(t), max(1, int(df))), t)
+
+
+# Two-sided Student-t quantile: P(|T| < GetT(confidence, df)) = confidence:
+def GetT(confidence, df):
+    if df < 1:
+        return float("inf")
+
+    low, high = 0., 1.
+    while GetTwoSidedT(high, df) < confidence:
+        low, high = high, high * 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        low, high = (middle, high) if GetTwoSidedT(middle, df) < confidence else (low, middle)
+    return high
+
+
+# Sample sizes at which a sequential procedure checks its bounds (rounds of roundSize, the first one of firstSize, from minSize on):
+def GetLookSizes(maxSize, roundSize, minSize, firstSize=None):
+    sizes = [min(maxSize, firstSize or roundSize)]
+    while sizes[-1] < maxSize:
+        sizes.append(min(maxSize, sizes[-1] + roundSize))
+    return [size for size in sizes if size >= minSize]
+
+
+# Confidence of a single one of numTests bounds, so that all of them hold together with the given confidence (Bonferroni):
+def SplitConfidence(confidence, numTests):
+    return 1 - (1 - confidence) / max(1, numTests)
+
+
+def GetMeanStd(rewards):
+    n    = len(rewards)
+    mean = sum(rewards) / n
+    std  = math.sqrt(sum((r - mean) ** 2 for r in rewards) / (n - 1)) if n > 1 else float("inf")
+    return mean, std
+
+
+# (lower, upper) bound of the mean reward:
+def GetConfidenceBound(rewards, confidence=0.95):
+    mean, std = GetMeanStd(rewards)
+    halfWidth = GetT(confidence, len(rewards) - 1) * std / math.sqrt(len(rewards))
+    if math.isnan(halfWidth):
+        return -float("inf"), float("inf")
+    return mean - halfWidth, mean + halfWidth
+
+
+# Probability that the mean of rewardsA is larger than the mean of rewardsB (Welch's t):
+def GetWinProbability(rewardsA, rewardsB):
+    meanA, stdA = GetMeanStd(rewardsA)
+    meanB, stdB = GetMeanStd(rewardsB)
+    varA , varB = stdA ** 2 / len(rewardsA), stdB ** 2 / len(rewardsB)
+    scale = math.sqrt(varA + varB)
+    if math.isnan(scale) or math.isinf(scale):
+        return 0.5
+    if scale == 0:
+        return 1. if meanA > meanB else 0.5 if meanA == meanB else 0.
+    df = (varA + varB) ** 2 / (varA ** 2 / (len(rewardsA) - 1) + varB ** 2 / (len(rewardsB) - 1))
+    return GetTCdf((meanA - meanB) / scale, df)
+
+
+# Probability that the mean of rewards is larger than threshold:
+def GetAboveProbability(rewards, threshold):
+    mean, std = GetMeanStd(rewards)
+    scale     = std / math.sqrt(len(rewards))
+    if math.isinf(scale):
+        return 0.5
+    if scale == 0:
+        return 1. if mean > threshold else 0.5 if mean == threshold else 0.
+    return GetTCdf((mean - threshold) / scale, len(rewards) - 1)
+
+
+# Successive elimination over candidates (e.g. checkpoints): every round runs roundSeeds more seeds on the remaining candidates
+# (the same seeds for all of them) and drops every candidate whose upper bound is below the best lower bound.
+# The confidence is split over the bounds of all the candidates at all the looks.
+# Evaluate(jobs=[(candidate, seed), ...]) -> [reward, ...]
+def SuccessiveElimination(candidates, Evaluate, maxSeeds=50, roundSeeds=5, minSeeds=5, confidence=0.95):
+    if not candidates:
+        return {"Best": None, "BestReward": -float("inf"), "Rewards": {}, "Remaining": [], "Episodes": 0, "SavedEpisodes": 0, "Confidence": 0.}
+
+    numLooks  = len(GetLookSizes(maxSeeds, roundSeeds, minSeeds, max(roundSeeds, minSeeds)))
+    lookConfidence = SplitConfidence(confidence, numLooks * len(candidates))
+    rewards   = {candidate: [] for candidate in candidates}
+    remaining = list(candidates)
+    numSeeds  = 0
+    while numSeeds == 0 or (numSeeds < maxSeeds and len(remaining) > 1):
+        roundSize = max(roundSeeds, minSeeds) if numSeeds == 0 else roundSeeds
+        seeds     = range(numSeeds, min(maxSeeds, numSeeds + roundSize))
+        jobs      = [(candidate, seed) for candidate in remaining for seed in seeds]
+        for (candidate, _), reward in zip(jobs, Evaluate(jobs)):
+            rewards[candidate].append(reward)
+        numSeeds = seeds.stop
+
+        if numSeeds >= minSeeds:
+            bounds    = {candidate: GetConfidenceBound(rewards[candidate], lookConfidence) for candidate in remaining}
+            bestLower = max(lower for lower, _ in bounds.values())
+            remaining = [candidate for candidate in remaining if bounds[candidate][1] >= bestLower]
+
+    means    = {candidate: GetMeanStd(rewards[candidate])[0] for candidate in remaining}
+    best     = max(remaining, key=means.get)
+    runnerUp = max((candidate for candidate in candidates if candidate != best), key=lambda c: GetMeanStd(rewards[c])[0], default=None)
+    episodes = sum(len(r) for r in rewards.values())
+    return {
+        "Best"         : best,
+        "BestReward"   : means[best],
+        "Rewards"      : rewards,
+        "Remaining"    : remaining,
+        "Episodes"     : episodes,
+        "SavedEpisodes": len(candidates) * maxSeeds - episodes,
+        "Confidence"   : 1. if runnerUp is None else GetWinProbability(rewards[best], rewards[runnerUp])
+    }
+
+
+# Run episodes (roundEpisodes at a time) until the mean reward is settled above / below the threshold, or maxEpisodes are done.
+# The confidence is split over the looks.
+# Evaluate(seeds) -> [reward, ...]
+def SequentialThresholdTest(Evaluate, threshold, maxEpisodes=50, roundEpisodes=1, minEpisodes=3, confidence=0.95):
+    lookConfidence = SplitConfidence(confidence, len(GetLookSizes(maxEpisodes, roundEpisodes, minEpisodes)))
+    rewards = []
+    lower, upper = -float("inf"), float("inf")
+    while len(rewards) < maxEpisodes:
+        rewards += Evaluate(range(len(rewards), min(maxEpisodes, len(rewards) + roundEpisodes)))
+        if len(rewards) >= minEpisodes:
+            lower, upper = GetConfidenceBound(rewards, lookConfidence)
+            if lower > threshold or upper < threshold:
+                break
+
+    mean, _ = GetMeanStd(rewards)
+    pAbove  = GetAboveProbability(rewards, threshold)
+    return {
+        "Reward"       : mean,
+        "Rewards"      : rewards,
+        "IsAbove"      : mean >= threshold,
+        "IsSettled"    : lower > threshold or upper < threshold,
+        "Episodes"     : len(rewards),
+        "SavedEpisodes": maxEpisodes - len(rewards),
+        "Confidence"   : pAbove if mean >= threshold else 1 - pAbove
+    }
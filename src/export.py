@@ -0,0 +1,81 @@
+import copy
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from model import GaussianPolicy
+from checkpoint import LoadCheckpoint
+
+
+# Mean-only copy of a GaussianPolicy with the squashing and the RecoverAction scaling baked in:
+class DeployablePolicy(nn.Module):
+    def __init__(self, policy, minActVal, maxActVal):
+        super().__init__()
+        if policy.squashing not in (None, "tanh"):
+            raise ValueError(f"Invalid squashing function {policy.squashing} !")
+
+        self.fc0    = copy.deepcopy(policy.fc0)
+        self.fc1    = copy.deepcopy(policy.fc1)
+        self.mu     = copy.deepcopy(policy.mu)
+        self.isTanh = policy.squashing == "tanh"
+        self.register_buffer("toAdd"  , torch.tensor(float(maxActVal + minActVal) * 0.5))
+        self.register_buffer("toScale", torch.tensor(float(maxActVal - minActVal) * 0.5))
+
+    # state: (B, stateDim) -> action: (B, actionDim) in [min, max]
+    def forward(self, state):
+        h    = F.relu(self.fc0(state))
+        h    = F.relu(self.fc1(h))
+        mean = self.mu(h)
+        if self.isTanh:
+            mean = torch.tanh(mean)
+        return mean * self.toScale + self.toAdd
+
+
+# int8 dynamically quantized DeployablePolicy (weights quantized once, activations per call) for acting on the CPU:
+def QuantizePolicy(policy, minActVal, maxActVal):
+    module = DeployablePolicy(policy, minActVal, maxActVal).cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+
+
+# Build a GaussianPolicy from a checkpoint of ASAF1.Save (the dims are read from the weight shapes):
+def LoadPolicy(modelPath, squashing=None):
+    stateDict = LoadCheckpoint(modelPath)["policy"]
+    hiddenDim, stateDim = stateDict["fc0.weight"].shape
+    actionDim           = stateDict["mu.weight"].shape[0]
+    policy = GaussianPolicy(stateDim, actionDim, hiddenDim, squashing)
+    policy.load_state_dict(stateDict)
+    policy.eval()
+    return policy
+
+
+def ExportPolicy(modelPath, exportPath, minActVal, maxActVal, squashing=None, exportFormat="torchscript"):
+    policy = LoadPolicy(modelPath, squashing)
+    module = DeployablePolicy(policy, minActVal, maxActVal).eval()
+    if exportFormat == "torchscript":
+        torch.jit.save(torch.jit.freeze(torch.jit.script(module)), exportPath)
+    elif exportFormat == "onnx":
+        dummyState = torch.zeros(1, policy.fc0.in_features)
+        torch.onnx.export(
+            module, dummyState, exportPath, input_names=["state"], output_names=["action"],
+            dynamic_axes={"state": {0: "batch"}, "action": {0: "batch"}}
+        )
+    else:
+        raise ValueError(f"Invalid export format {exportFormat} !")
+
+    return exportPath
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the policy of an ASAF1 checkpoint for deployment.")
+    parser.add_argument("modelPath" , help="checkpoint saved by ASAF1.Save")
+    parser.add_argument("exportPath", help="output file (.pt for torchscript, .onnx for onnx)")
+    parser.add_argument("--minAct"   , type=float, required=True, help="env.action_space.low[0]")
+    parser.add_argument("--maxAct"   , type=float, required=True, help="env.action_space.high[0]")
+    parser.add_argument("--squashing", default=None, choices=["tanh"])
+    parser.add_argument("--format"   , default="torchscript", choices=["torchscript", "onnx"])
+    args = parser.parse_args()
+
+    print(ExportPolicy(args.modelPath, args.exportPath, args.minAct, args.maxAct, args.squashing, args.format))
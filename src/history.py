@@ -0,0 +1,187 @@
+import os
+import glob
+import json
+import pickle
+import struct
+import numpy as np
+
+
+# Append-only columnar history file:
+#   b"ASAFHIST" | uint32 header size | json header {"version", "columns", "dtypes"}
+#   chunk*     : uint32 nRows | column0 (nRows values) | column1 | ...
+# Every chunk is written as a whole, a truncated last chunk (e.g. after a crash) is ignored by the reader.
+HISTORY_MAGIC   = b"ASAFHIST"
+HISTORY_VERSION = 1
+HISTORY_COLUMNS = {
+    "Transition"  : "int64",
+    "Episode"     : "int64",
+    "Env"         : "int64",
+    "Reward"      : "float64",
+    "TestReward"  : "float64",
+    "LR"          : "float64",
+    "TransPerSec" : "float64",
+    "UpdatePerSec": "float64"
+}
+
+
+def ReadHistoryHeader(f):
+    if f.read(len(HISTORY_MAGIC)) != HISTORY_MAGIC:
+        raise ValueError(f"{f.name} is not a history file !")
+
+    size,  = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(size).decode("utf-8"))
+    return header, len(HISTORY_MAGIC) + 4 + size
+
+
+# An empty file (e.g. reserved by utils.GetUniquePath) is written from the start:
+class HistoryWriter:
+    def __init__(self, path, columns=HISTORY_COLUMNS, chunkSize=256):
+        self.path      = path
+        self.chunkSize = chunkSize
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # Continue an existing file (the columns and dtypes must be the same), a torn last chunk is cut off first:
+            reader = HistoryReader(path)
+            if list(reader.GetColumns().items()) != [(name, np.dtype(dtype).name) for name, dtype in columns.items()]:
+                raise ValueError(f"Columns of {path} are {reader.GetColumns()}, not {dict(columns)} !")
+            with open(path, "r+b") as f:
+                f.truncate(reader.size)
+            self.file = open(path, "ab")
+        else:
+            header = json.dumps({"version": HISTORY_VERSION, "columns": list(columns), "dtypes": list(columns.values())}).encode("utf-8")
+            self.file = open(path, "wb")
+            self.file.write(HISTORY_MAGIC + struct.pack("<I", len(header)) + header)
+            self.file.flush()
+
+        self.columns = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.rows    = {name: [] for name in columns}
+        self.numRows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+    def Append(self, **record):
+        for name in self.columns:
+            self.rows[name].append(record[name])
+
+        self.numRows += 1
+        if len(self.rows[next(iter(self.columns))]) >= self.chunkSize:
+            self.Flush()
+
+    # Write the buffered rows as one chunk:
+    def Flush(self):
+        nRows = len(self.rows[next(iter(self.columns))])
+        if nRows == 0 or self.file.closed:
+            return
+
+        chunk = [struct.pack("<I", nRows)]
+        for name, dtype in self.columns.items():
+            chunk.append(np.asarray(self.rows[name], dtype=dtype).tobytes())
+            self.rows[name].clear()
+
+        self.file.write(b"".join(chunk))
+        self.file.flush()
+
+    # Flush and return the size of the file (every row appended so far is on disk):
+    def Sync(self):
+        self.Flush()
+        return self.file.tell()
+
+    def Close(self):
+        self.Flush()
+        self.file.close()
+
+
+# Reads column subsets / row ranges, only the chunk headers are scanned when the file is opened:
+class HistoryReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header, offset = ReadHistoryHeader(f)
+            self.columns = {name: np.dtype(dtype) for name, dtype in zip(header["columns"], header["dtypes"])}
+            rowSize      = sum(dtype.itemsize for dtype in self.columns.values())
+            fileSize     = os.fstat(f.fileno()).st_size
+
+            # (offset of the first column, first row, number of rows) of every complete chunk:
+            self.chunks, numRows = [], 0
+            while offset + 4 <= fileSize:
+                f.seek(offset)
+                nRows, = struct.unpack("<I", f.read(4))
+                if offset + 4 + nRows * rowSize > fileSize:
+                    break
+                self.chunks.append((offset + 4, numRows, nRows))
+                numRows += nRows
+                offset  += 4 + nRows * rowSize
+
+        self.numRows = numRows
+        self.size    = offset
+
+    def __len__(self):
+        return self.numRows
+
+    # {column: dtype name}:
+    def GetColumns(self):
+        return {name: dtype.name for name, dtype in self.columns.items()}
+
+    # Returns {column: np.array} of the rows [start, end):
+    def Read(self, columns=None, start=0, end=None):
+        columns = list(self.columns) if columns is None else columns
+        end     = self.numRows if end is None else min(end, self.numRows)
+        result  = {name: [] for name in columns}
+        with open(self.path, "rb") as f:
+            for offset, firstRow, nRows in self.chunks:
+                s, e = max(start, firstRow), min(end, firstRow + nRows)
+                if s >= e:
+                    continue
+
+                columnOffset = offset
+                for name, dtype in self.columns.items():
+                    if name in result:
+                        f.seek(columnOffset + (s - firstRow) * dtype.itemsize)
+                        result[name].append(np.frombuffer(f.read((e - s) * dtype.itemsize), dtype=dtype))
+                    columnOffset += nRows * dtype.itemsize
+
+        return {name: np.concatenate(arrays) if arrays else np.zeros(0, self.columns[name]) for name, arrays in result.items()}
+
+
+# Readers of every history file matching the pattern (the columns are only read on demand):
+def OpenHistories(pattern="../history/*.hist"):
+    return {path: HistoryReader(path) for path in sorted(glob.glob(pattern))}
+
+
+# A history as {column: np.array} from a history file or a legacy pickle:
+def LoadHistory(path, columns=None, start=0, end=None):
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            history = pickle.load(f)
+        columns = list(history) if columns is None else columns
+        return {name: np.asarray(history[name][start:end]) for name in columns}
+    else:
+        return HistoryReader(path).Read(columns, start, end)
+
+
+def ConvertHistory(pklPath, histPath, chunkSize=4096):
+    with open(pklPath, "rb") as f:
+        history = pickle.load(f)
+
+    columns = {name: "int64" if all(isinstance(v, (int, np.integer)) for v in values) else "float64" for name, values in history.items()}
+    with HistoryWriter(histPath, columns, chunkSize) as writer:
+        for row in zip(*history.values()):
+            writer.Append(**dict(zip(history, row)))
+
+    return histPath
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert pickled training histories to the columnar history format.")
+    parser.add_argument("pklPaths", nargs="+", help="history pickle files")
+    args = parser.parse_args()
+
+    for pklPath in args.pklPaths:
+        histPath = os.path.splitext(pklPath)[0] + ".hist"
+        ConvertHistory(pklPath, histPath)
+        print(f"{pklPath} -> {histPath} ({len(HistoryReader(histPath))} rows)")
@@ -0,0 +1,32 @@
+import numpy as np
+
+import torch
+
+
+# Runs a policy exported by export.py without gym or the training stack:
+#   .onnx -> onnxruntime, anything else -> TorchScript
+class ExportedPolicy:
+    def __init__(self, path, numThreads=None):
+        self.isOnnx = path.endswith(".onnx")
+        if self.isOnnx:
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if numThreads: options.intra_op_num_threads = numThreads
+            self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        else:
+            if numThreads: torch.set_num_threads(numThreads)
+            self.module = torch.jit.load(path, map_location="cpu")
+
+    # state: np.array (shape=(stateDim, ) or (B, stateDim)) -> action: np.array (shape=(actionDim, ) or (B, actionDim))
+    def __call__(self, state):
+        state    = np.asarray(state, dtype=np.float32)
+        isSingle = state.ndim == 1
+        state    = state.reshape(-1, state.shape[-1])
+        if self.isOnnx:
+            action = self.session.run(None, {"state": state})[0]
+        else:
+            with torch.inference_mode():
+                action = self.module(torch.from_numpy(state)).numpy()
+
+        return action[0] if isSingle else action
@@ -1,18 +1,58 @@
-import os
+import math
+import numpy as np
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.distributions.normal import Normal
 from torch.nn.utils import clip_grad_norm_
-from warmup_scheduler import GradualWarmupScheduler
 
-from utils import GetTrainIteration, RandomTrainIteration, GetLR
+from utils import GetTrainIteration, GetLR, PhaseTimer, GetUniquePath, AtanhAction, EPS, EPS2
+from sampler import GetSampler
+from checkpoint import LoadCheckpoint
 
 
 INF  = float("inf")
-EPS  = 1e-8
-EPS2 = 1e-4
+
+LOG_EPS      = math.log(EPS)
+LOG_SQRT_2PI = 0.5 * math.log(2 * math.pi)
+
+# Storage dtype of the transitions and autocast dtype of the policy forwards (the weights and the loss always stay in fp32):
+PRECISIONS = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16
+}
+
+
+def GetPrecisionDtype(precision):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Invalid precision {precision} !")
+
+    return PRECISIONS[precision]
+
+
+# Log-prob of a diagonal Gaussian summed over the last dim, computed in closed form from the log std:
+#   sum(-0.5 * ((action - mean) / std) ** 2 - logStd - log(sqrt(2 pi)))
+# Only z = (action - mean) / std and 1 / std are kept for the backward (the action needs no gradient):
+class GaussianLogProb(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, mean, logStd, action):
+        invStd  = torch.exp(-logStd)
+        z       = (action - mean).mul_(invStd)
+        logProb = z.square().mul_(-0.5).sub_(logStd).sum(-1, keepdim=True).sub_(LOG_SQRT_2PI * mean.size(-1))
+        ctx.save_for_backward(z, invStd)
+        return logProb
+
+    @staticmethod
+    def backward(ctx, gradLogProb):
+        z, invStd  = ctx.saved_tensors
+        gradMean   = gradLogProb * z * invStd
+        gradLogStd = gradLogProb * (z.square() - 1)
+        return gradMean, gradLogStd, None
+
+
+# log(exp(a) + exp(b) + EPS) without overflow / underflow of the exp:
+def LogAddExp(a, b):
+    return torch.logaddexp(torch.logaddexp(a, b), a.new_tensor(LOG_EPS))
 
 
 def InitializeLinear(module, mul=1.):
@@ -25,11 +65,38 @@ def GetScheduler(name=None, optimizer=None, schedulerWarmup=0, **kwargs):
         return None
     else:
         if schedulerWarmup > 0:
+            from warmup_scheduler import GradualWarmupScheduler
             return GradualWarmupScheduler(optimizer, 1, schedulerWarmup, torch.optim.lr_scheduler.__getattribute__(name)(optimizer, **kwargs))
         else:
             return torch.optim.lr_scheduler.__getattribute__(name)(optimizer, **kwargs)
 
 
+# The state of a GradualWarmupScheduler holds its after_scheduler object (bound to the live optimizer), so that one is stored
+# by its own state_dict and loaded into the existing after_scheduler:
+def GetSchedulerState(scheduler):
+    if not scheduler:
+        return {}
+
+    state = scheduler.state_dict()
+    if getattr(scheduler, "after_scheduler", None) is not None:
+        state = {key: value for key, value in state.items() if key != "after_scheduler"}
+        state["afterScheduler"] = scheduler.after_scheduler.state_dict()
+    return state
+
+
+def LoadSchedulerState(scheduler, state):
+    state = dict(state)
+    after = state.pop("afterScheduler", None)
+    if "after_scheduler" in state:
+        # Checkpoints saved with the after_scheduler object:
+        afterScheduler = state.pop("after_scheduler")
+        after = afterScheduler.state_dict() if afterScheduler is not None else None
+
+    scheduler.load_state_dict(state)
+    if after is not None and getattr(scheduler, "after_scheduler", None) is not None:
+        scheduler.after_scheduler.load_state_dict(after)
+
+
 def GetOptimizer(name=None, params={}, lr=1e-3, **kwargs):
     if not name:
         return None
@@ -53,9 +120,21 @@ class GaussianPolicy(nn.Module):
         self.squashing = squashing
     
     def forward(self, state):
+        mean, logStd = self.GetMeanLogStd(state)
+        return mean, logStd.exp()
+
+    def GetMeanLogStd(self, state):
         h = F.relu(self.fc0(state))
         h = F.relu(self.fc1(h))
-        return self.mu(h), torch.clamp(self.sigma(h), -20, 2).exp()
+        if h.dtype != self.mu.weight.dtype:
+            # Under autocast only the hidden layers run in reduced precision, the log-prob is too sensitive to rounding of the heads:
+            with torch.autocast(h.device.type, enabled=False):
+                return self.Heads(h.float())
+
+        return self.Heads(h)
+
+    def Heads(self, h):
+        return self.mu(h), torch.clamp(self.sigma(h), -20, 2)
     
     def Initialize(self):
         InitializeLinear(self.fc0, 1)
@@ -63,19 +142,17 @@ class GaussianPolicy(nn.Module):
         InitializeLinear(self.mu, 0.1)
         InitializeLinear(self.sigma, 0.1)
         
-    def GetLogProb(self, state, action):
+    # With logJacobian (tanh squashing only) the action is already transformed by AtanhAction:
+    def GetLogProb(self, state, action, logJacobian=None):
+        action = action.float()
         if self.squashing is None:
-            mean, std = self(state)
-            logProb   = Normal(mean, std).log_prob(action)
-            logProb   = torch.sum(logProb, dim=-1, keepdim=True)
-            return logProb
+            mean, logStd = self.GetMeanLogStd(state)
+            return GaussianLogProb.apply(mean, logStd, action)
         elif self.squashing == "tanh":
-            mean, std  = self(state)
-            actionTemp = torch.atanh(torch.clamp(action, -1 + EPS2, 1 - EPS2))
-            logProb    = Normal(mean, std).log_prob(actionTemp)
-            logProb   -= torch.log(1 - action ** 2 + EPS)
-            logProb    = torch.sum(logProb, dim=-1, keepdim=True)
-            return logProb
+            if logJacobian is None:
+                action, logJacobian = AtanhAction(action)
+            mean, logStd = self.GetMeanLogStd(state)
+            return GaussianLogProb.apply(mean, logStd, action) - logJacobian
         else:
             raise ValueError(f"Invalid squashing function {self.squashing} !")
     
@@ -93,27 +170,162 @@ class GaussianPolicy(nn.Module):
             raise ValueError(f"Invalid squashing function {self.squashing} !")
         
 
+# Batched inference of the action mean with preallocated buffers (the sigma head is skipped):
+# Backends: "numpy" / "torch" (float32, "auto" picks by device) and "int8" (dynamically quantized copy of the mean path, CPU only):
+class PolicyActor:
+    def __init__(self, policy, minActVal, maxActVal, backend="auto"):
+        self.policy    = policy
+        self.backend   = backend
+        self.minActVal = minActVal
+        self.maxActVal = maxActVal
+        self.toAdd     = float(maxActVal + minActVal) * 0.5
+        self.toScale   = float(maxActVal - minActVal) * 0.5
+        self.Reset()
+
+    # Must be called whenever the parameters of the policy are moved to another device or replaced:
+    def Reset(self):
+        self.capacity         = 0
+        self.weights          = None
+        self.buffers          = None
+        self.allocatedBackend = None
+        self.quantized        = None
+
+    # Must be called whenever the parameters of the policy are updated (the int8 copy is quantized again by the next call):
+    def Refresh(self):
+        self.quantized = None
+
+    def GetBackend(self):
+        if self.backend == "auto":
+            return "numpy" if self.policy.fc0.weight.device.type == "cpu" else "torch"
+        else:
+            return self.backend
+
+    def Allocate(self, batchSize, backend):
+        capacity   = max(batchSize, 2 * self.capacity)
+        hiddenDim  = self.policy.fc0.out_features
+        stateDim   = self.policy.fc0.in_features
+        actionDim  = self.policy.mu.out_features
+        if backend == "numpy":
+            # Views sharing memory with the CPU parameters, so optimizer steps are seen without copying:
+            self.weights = [(layer.weight.detach().numpy().T, layer.bias.detach().numpy()) for layer in (self.policy.fc0, self.policy.fc1, self.policy.mu)]
+            self.buffers = [np.empty((capacity, dim), dtype=np.float32) for dim in (stateDim, hiddenDim, hiddenDim, actionDim)]
+        elif backend == "torch":
+            device = self.policy.fc0.weight.device
+            with torch.inference_mode():
+                self.buffers = [torch.empty((capacity, dim), device=device) for dim in (stateDim, hiddenDim, hiddenDim, actionDim)]
+                self.buffers.append(torch.empty((capacity, actionDim), pin_memory=device.type == "cuda"))
+        else:
+            raise ValueError(f"Invalid inference backend {backend} !")
+        
+        self.capacity = capacity
+        self.allocatedBackend = backend
+
+    def NumpyForward(self, state, batchSize):
+        x, h0, h1, out = (buffer[:batchSize] for buffer in self.buffers)
+        (w0, b0), (w1, b1), (wMu, bMu) = self.weights
+        x[...] = state
+        np.matmul(x , w0 , out=h0 ); np.add(h0 , b0 , out=h0); np.maximum(h0, 0, out=h0)
+        np.matmul(h0, w1 , out=h1 ); np.add(h1 , b1 , out=h1); np.maximum(h1, 0, out=h1)
+        np.matmul(h1, wMu, out=out); np.add(out, bMu, out=out)
+        if self.policy.squashing == "tanh":
+            np.tanh(out, out=out)
+        out *= self.toScale
+        out += self.toAdd
+        return out
+
+    def Int8Forward(self, state):
+        if self.quantized is None:
+            from export import QuantizePolicy
+            self.quantized = QuantizePolicy(self.policy, self.minActVal, self.maxActVal)
+
+        with torch.inference_mode():
+            return self.quantized(torch.from_numpy(state).float()).numpy()
+
+    def TorchForward(self, state, batchSize):
+        x, h0, h1, mean, out = (buffer[:batchSize] for buffer in self.buffers)
+        fc0, fc1, mu = self.policy.fc0, self.policy.fc1, self.policy.mu
+        with torch.inference_mode():
+            x.copy_(torch.from_numpy(state))
+            torch.addmm(fc0.bias, x , fc0.weight.t(), out=h0  ).relu_()
+            torch.addmm(fc1.bias, h0, fc1.weight.t(), out=h1  ).relu_()
+            torch.addmm(mu .bias, h1, mu .weight.t(), out=mean)
+            if self.policy.squashing == "tanh":
+                mean.tanh_()
+            mean.mul_(self.toScale).add_(self.toAdd)
+            out.copy_(mean)
+        return out.numpy()
+
+    # state: np.array (shape=(stateDim, ) or (B, stateDim)) -> action: np.array (shape=(actionDim, ) or (B, actionDim)) in [min, max]
+    def __call__(self, state):
+        if self.policy.squashing not in (None, "tanh"):
+            raise ValueError(f"Invalid squashing function {self.policy.squashing} !")
+
+        state     = np.asarray(state)
+        isSingle  = state.ndim == 1
+        state     = state.reshape(-1, state.shape[-1])
+        batchSize = state.shape[0]
+        backend   = self.GetBackend()
+        if backend == "int8":
+            out = self.Int8Forward(state)
+            return out[0] if isSingle else out
+
+        if batchSize > self.capacity or backend != self.allocatedBackend:
+            self.Allocate(batchSize, backend)
+
+        if backend == "numpy":
+            out = self.NumpyForward(state, batchSize)
+        else:
+            out = self.TorchForward(state, batchSize)
+        
+        # The buffers are reused by the next call, so only the returned action is a new array:
+        return out[0].copy() if isSingle else out.copy()
+
+
 class ASAF1:
     def __init__(self, stateDim, actionDim, hiddenDim, minActVal, maxActVal, optimizer="Adam", scheduler=None, 
-                 lr=1e-3, gradClip=INF, squashing=None, schedulerWarmup=0, optimizerParams={}, schedulerParams={}):
+                 lr=1e-3, gradClip=INF, squashing=None, schedulerWarmup=0, optimizerParams={}, schedulerParams={}, actBackend="auto", isFusedUpdate=True, sampling="window", precision="fp32"):
         self.minActVal = minActVal
         self.maxActVal = maxActVal
         self.gradClip  = gradClip
         self.policy    = GaussianPolicy(stateDim, actionDim, hiddenDim, squashing)
         self.optimizer = GetOptimizer(optimizer, self.policy.parameters(), lr, **optimizerParams)
         self.scheduler = GetScheduler(scheduler, self.optimizer, schedulerWarmup, **schedulerParams)
+        self.actor     = PolicyActor(self.policy, minActVal, maxActVal, actBackend)
+        self.isFused   = isFusedUpdate
+        self.sampling  = sampling
+        self.precision = GetPrecisionDtype(precision)
+        self.timer     = PhaseTimer()
+        self.gradHook  = None
+
+    # Autocast context of the policy forwards in Fit / GetInitProb (nothing for fp32):
+    def Autocast(self):
+        if self.precision == torch.float32:
+            return PhaseTimer.NULL_CONTEXT
+
+        return torch.autocast(self.policy.fc0.weight.device.type, dtype=self.precision)
     
     # One step update of the policy:
-    def UpdatePolicy(self, expertState, expertAction, expertOldProb, agentState, agentAction, agentOldProb):
-        expertLogProb = self.policy.GetLogProb(expertState, expertAction)
-        agentLogProb  = self.policy.GetLogProb(agentState , agentAction )
+    def UpdatePolicy(self, expertState, expertAction, expertOldProb, agentState, agentAction, agentOldProb, expertLogJacobian=None, agentLogJacobian=None):
+        with self.Autocast():
+            if self.isFused:
+                # One forward and one log-prob evaluation for both batches:
+                logJacobian = None if expertLogJacobian is None else torch.cat([expertLogJacobian, agentLogJacobian])
+                logProb     = self.policy.GetLogProb(torch.cat([expertState, agentState]), torch.cat([expertAction, agentAction]), logJacobian)
+                expertLogProb, agentLogProb = logProb[:expertState.size(0)], logProb[expertState.size(0):]
+            else:
+                expertLogProb = self.policy.GetLogProb(expertState, expertAction, expertLogJacobian)
+                agentLogProb  = self.policy.GetLogProb(agentState , agentAction , agentLogJacobian )
 
-        expertLoss = -(expertLogProb - torch.log(expertLogProb.exp() + expertOldProb.exp() + EPS)).mean()
-        agentLoss  = -(agentOldProb  - torch.log(agentLogProb .exp() + agentOldProb .exp() + EPS)).mean()
+        expertLoss = -(expertLogProb - LogAddExp(expertLogProb, expertOldProb)).mean()
+        agentLoss  = -(agentOldProb  - LogAddExp(agentLogProb , agentOldProb )).mean()
         
-        loss = expertLoss + agentLoss
+        # Data-parallel Fit (distributed.py): the losses of this process are weighted by its share of the rows,
+        # then the gradients and losses are summed over the processes before the clip:
+        loss = expertLoss + agentLoss if self.gradHook is None else self.gradHook.WeightLoss(expertLoss, agentLoss)
         self.optimizer.zero_grad()
         loss.backward()
+        if self.gradHook is not None:
+            expertLoss, agentLoss = self.gradHook(expertLoss.detach(), agentLoss.detach())
         clip_grad_norm_(self.policy.parameters(), self.gradClip)
         self.optimizer.step()
 
@@ -129,17 +341,20 @@ class ASAF1:
             
         return GetLR(self.optimizer)
 
-    # Get initial probability of the action vector (πG):
-    def GetInitProb(self, expertState, expertAction, agentState, agentAction, batchSize):
+    # Get initial probability of the action vector (πG), only on the given expert indices if expertRows is not None:
+    def GetInitProb(self, expertState, expertAction, agentState, agentAction, batchSize, expertRows=None, expertLogJacobian=None, agentLogJacobian=None):
         device, nExpertTransition, nAgentTransition = expertState.device, expertState.size(0), agentState.size(0)
-        with torch.no_grad():
+        if expertRows is None:
+            expertRows = [slice(s, e) for s, e in GetTrainIteration(nExpertTransition, batchSize)]
+
+        with torch.no_grad(), self.Autocast():
             expertOldProb = torch.zeros([nExpertTransition, 1], device=device)
-            for s, e in GetTrainIteration(nExpertTransition, batchSize):
-                expertOldProb[s: e] = self.policy.GetLogProb(expertState[s: e], expertAction[s: e])
+            for index in expertRows:
+                expertOldProb[index] = self.policy.GetLogProb(expertState[index], expertAction[index], None if expertLogJacobian is None else expertLogJacobian[index])
                 
             agentOldProb  = torch.zeros([nAgentTransition, 1], device=device)
             for s, e in GetTrainIteration(nAgentTransition, batchSize):
-                agentOldProb [s: e] = self.policy.GetLogProb(agentState [s: e], agentAction [s: e])
+                agentOldProb [s: e] = self.policy.GetLogProb(agentState [s: e], agentAction [s: e], None if agentLogJacobian  is None else agentLogJacobian [s: e])
         
         return expertOldProb, agentOldProb
     
@@ -155,36 +370,58 @@ class ASAF1:
         toAdd , toMultiply = (maxVal + minVal) * 0.5, (maxVal - minVal) * 0.5
         return action * toMultiply + toAdd
 
+    # Minibatch schedule, actions and πG of a Fit. The expert actions may come from data.Preprocess: already mapped to [-1, 1] (isExpertMapped),
+    # and with tanh squashing also transformed by AtanhAction (expertLogJacobian), then the agent actions are transformed once here too:
+    def PrepareFit(self, expertState, expertAction, agentState, agentAction, epochs, batchSize, isExpertMapped=False, expertLogJacobian=None):
+        # The minibatches of all epochs are drawn first, so πG is only computed once on the expert rows actually used:
+        sampler  = GetSampler(self.sampling, expertState.size(0), agentState.size(0), batchSize, expertState.device)
+        schedule = sampler.Schedule(epochs)
+
+        # The states may be stored in bf16, the (small) actions are mapped in fp32:
+        expertAction = expertAction.float() if isExpertMapped else self.MapAction(expertAction.float())
+        agentAction  = self.MapAction(agentAction.float())
+        agentLogJacobian = None
+        if expertLogJacobian is not None:
+            agentAction, agentLogJacobian = AtanhAction(agentAction)
+
+        with self.timer("GetInitProb"):
+            expertOldProb, agentOldProb = self.GetInitProb(expertState, expertAction, agentState, agentAction, batchSize, sampler.ExpertRows(schedule),
+                                                           expertLogJacobian, agentLogJacobian)
+
+        return schedule, expertAction, agentAction, agentLogJacobian, expertOldProb, agentOldProb
+
     # Update the policy for many times:
-    def Fit(self, expertState, expertAction, agentState, agentAction, epochs, batchSize):
-        nExpertTransition, nAgentTransition = expertState.size(0), agentState.size(0)
-        batchLength = nAgentTransition // batchSize + int(nAgentTransition % batchSize != 0)
+    def Fit(self, expertState, expertAction, agentState, agentAction, epochs, batchSize, isExpertMapped=False, expertLogJacobian=None):
         if self.optimizer:
-            expertAction  , agentAction   = self.MapAction(expertAction), self.MapAction(agentAction)
-            expertOldProb , agentOldProb  = self.GetInitProb(expertState, expertAction, agentState, agentAction, batchSize)
+            schedule, expertAction, agentAction, agentLogJacobian, expertOldProb, agentOldProb = self.PrepareFit(
+                expertState, expertAction, agentState, agentAction, epochs, batchSize, isExpertMapped, expertLogJacobian
+            )
+
             expertLossList, agentLossList = [], []
-            for _ in range(epochs):
-                agentBatchWindows  = GetTrainIteration(nAgentTransition, batchSize)
-                expertBatchWindows = RandomTrainIteration(nExpertTransition, batchSize, batchLength)
-                for (sE, eE), (sA, eA) in zip(expertBatchWindows, agentBatchWindows):
-                    expertLoss, agentLoss = self.UpdatePolicy(
-                        expertState[sE: eE], expertAction[sE: eE], expertOldProb[sE: eE],
-                        agentState [sA: eA], agentAction [sA: eA], agentOldProb [sA: eA]
-                    )
-                    expertLossList.append(expertLoss)
-                    agentLossList .append(agentLoss )
+            with self.timer("Fit.epochs"):
+                for batches in schedule:
+                    for iE, iA in batches:
+                        expertLoss, agentLoss = self.UpdatePolicy(
+                            expertState[iE], expertAction[iE], expertOldProb[iE],
+                            agentState [iA], agentAction [iA], agentOldProb [iA],
+                            None if expertLogJacobian is None else expertLogJacobian[iE],
+                            None if agentLogJacobian  is None else agentLogJacobian [iA]
+                        )
+                        expertLossList.append(expertLoss)
+                        agentLossList .append(agentLoss )
 
+            self.actor.Refresh()
             return sum(expertLossList) / len(expertLossList), sum(agentLossList) / len(agentLossList)
         else:
             raise Exception("There is no optimizer, so we cannot update policy !")
     
-    # state: np.array (shape=(stateDim, ))
+    # state: np.array (shape=(stateDim, ) or (B, stateDim))
     def Act(self, state):
-        action = self.policy.OneStepAction(state)
-        return self.RecoverAction(action)
+        return self.actor(state)
     
     def SetDevice(self, device):
         self.policy.to(device)
+        self.actor.Reset()
     
     def ToTrainMode(self):
         self.policy.train()
@@ -192,25 +429,31 @@ class ASAF1:
     def ToEvalMode(self):
         self.policy.eval()
     
-    def Save(self, path):
-        while os.path.exists(path):
-            path, ext = os.path.splitext(path)
-            path += ('_new' + ext)
-        
-        checkpoint = {
+    def StateDict(self):
+        return {
             "policy"   : self.policy.state_dict(),
             "optimizer": self.optimizer.state_dict() if self.optimizer else {},
-            "scheduler": self.scheduler.state_dict() if self.scheduler else {}
+            "scheduler": GetSchedulerState(self.scheduler)
         }
-        torch.save(checkpoint, path)
     
-    def Load(self, path, isLoadOptimizer=False):
-        checkpoint = torch.load(path)
+    def LoadStateDict(self, checkpoint, isLoadOptimizer=False):
         self.policy.load_state_dict(checkpoint["policy"])
+        self.actor.Refresh()
         if isLoadOptimizer:
             if self.optimizer: self.optimizer.load_state_dict(checkpoint["optimizer"])
-            if self.scheduler: self.scheduler.load_state_dict(checkpoint["scheduler"])
-
+            if self.scheduler: LoadSchedulerState(self.scheduler, checkpoint["scheduler"])
+    
+    # With a checkpoint.CheckpointWriter the checkpoint is written in the background (the final path is then unknown):
+    def Save(self, path, writer=None):
+        if writer is None:
+            path = GetUniquePath(path)
+            torch.save(self.StateDict(), path)
+            return path
+        else:
+            writer.Submit(self.StateDict(), path)
+    
+    def Load(self, path, isLoadOptimizer=False):
+        self.LoadStateDict(LoadCheckpoint(path, self.policy.fc0.weight.device), isLoadOptimizer)
 
 if __name__ == '__main__':
     import gym
@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+
+
+# Persistent index of the checkpoints of a model folder and of their per-seed test rewards:
+#   files      : {path: {"hash", "size", "mtime"}} (a file is only hashed again when its size or mtime changes)
+#   checkpoints: {hash: {"envName", "hiddenDim", "squashing", "paths", "rewards": {rewardKey: {seed: reward}}}}
+# The rewards belong to the content of a checkpoint, so renamed or copied files are not evaluated again. The rewards of a squashed
+# or an int8 policy are kept apart from the plain float ones (see GetRewardKey).
+REGISTRY_VERSION = 1
+REGISTRY_FILE    = "registry.json"
+
+
+def GetFileHash(path, chunkSize=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunkSize), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+# envName, envName|tanh, envName|int8 or envName|tanh|int8:
+def GetRewardKey(envName, squashing=None, actBackend="auto"):
+    return "|".join([envName] + ([squashing] if squashing else []) + (["int8"] if actBackend == "int8" else []))
+
+
+class CheckpointRegistry:
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data["version"] != REGISTRY_VERSION:
+                raise ValueError(f"Invalid registry version {data['version']} of {path} !")
+            self.files, self.checkpoints = data["files"], data["checkpoints"]
+        else:
+            self.files, self.checkpoints = {}, {}
+
+    def Save(self):
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump({"version": REGISTRY_VERSION, "files": self.files, "checkpoints": self.checkpoints}, f, indent=1)
+        os.replace(tmpPath, self.path)
+
+    # Returns the content hash of the checkpoint file (new or changed files are hashed and indexed):
+    def Register(self, modelPath, envName, hiddenDim, squashing=None):
+        modelPath = os.path.abspath(modelPath)
+        stat      = os.stat(modelPath)
+        entry     = self.files.get(modelPath)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            entry = {"hash": GetFileHash(modelPath), "size": stat.st_size, "mtime": stat.st_mtime}
+            self.files[modelPath] = entry
+
+        checkpoint = self.checkpoints.setdefault(entry["hash"], {"envName": envName, "hiddenDim": hiddenDim, "squashing": squashing, "paths": [], "rewards": {}})
+        if modelPath not in checkpoint["paths"]:
+            checkpoint["paths"].append(modelPath)
+
+        return entry["hash"]
+
+    def GetRewards(self, modelHash, envName):
+        return {int(seed): reward for seed, reward in self.checkpoints[modelHash]["rewards"].get(envName, {}).items()}
+
+    def AddRewards(self, modelHash, envName, rewards):
+        envRewards = self.checkpoints[modelHash]["rewards"].setdefault(envName, {})
+        envRewards.update({str(seed): reward for seed, reward in rewards.items()})
+
+    # jobs = [(modelPath, seed), ...] -> [reward, ...], only the jobs without a stored reward are run by Run(jobs) -> [reward, ...].
+    # The rewards are stored under rewardKey (default GetRewardKey(envName, squashing)), e.g. to keep the rewards of the int8 policy apart:
+    def Evaluate(self, jobs, envName, hiddenDim, Run, squashing=None, rewardKey=None):
+        rewardKey = rewardKey or GetRewardKey(envName, squashing)
+        hashes    = {modelPath: self.Register(modelPath, envName, hiddenDim, squashing) for modelPath in set(modelPath for modelPath, _ in jobs)}
+        cached    = {modelHash: self.GetRewards(modelHash, rewardKey) for modelHash in set(hashes.values())}
+        missing   = list(dict.fromkeys((modelPath, seed) for modelPath, seed in jobs if seed not in cached[hashes[modelPath]]))
+        if missing:
+            for (modelPath, seed), reward in zip(missing, Run(missing)):
+                cached[hashes[modelPath]][seed] = reward
+                self.AddRewards(hashes[modelPath], rewardKey, {seed: reward})
+        self.Save()
+
+        return [cached[hashes[modelPath]][seed] for modelPath, seed in jobs]
+
+    # Best existing checkpoint by the average reward of the seeds 0 ... numSeeds - 1, from the stored rewards only:
+    def Best(self, envName, hiddenDim=None, numSeeds=50, squashing=None):
+        best, bestReward = None, -float("inf")
+        for checkpoint in self.checkpoints.values():
+            if hiddenDim is not None and checkpoint["hiddenDim"] != hiddenDim:
+                continue
+
+            rewards = checkpoint["rewards"].get(GetRewardKey(envName, squashing), {})
+            paths   = [path for path in checkpoint["paths"] if os.path.exists(path)]
+            if not paths or any(str(seed) not in rewards for seed in range(numSeeds)):
+                continue
+
+            avgReward = sum(rewards[str(seed)] for seed in range(numSeeds)) / numSeeds
+            if avgReward > bestReward:
+                best, bestReward = paths[0], avgReward
+
+        return best, bestReward
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the checkpoint registry of a model folder (no evaluation is run).")
+    parser.add_argument("--folder"   , default="../model")
+    parser.add_argument("--env"      , required=True)
+    parser.add_argument("--hidden"   , type=int, default=None)
+    parser.add_argument("--seeds"    , type=int, default=50, help="number of seeds the average is taken over")
+    parser.add_argument("--squashing", default=None, choices=["tanh"])
+    args = parser.parse_args()
+
+    registry = CheckpointRegistry(os.path.join(args.folder, REGISTRY_FILE))
+    best, bestReward = registry.Best(args.env, args.hidden, args.seeds, args.squashing)
+    print(f"Best Model: [{best}]")
+    print(f"Best Reward = {bestReward :.2f}")
@@ -0,0 +1,149 @@
+import multiprocessing as mp
+
+import numpy as np
+
+from utils import PhaseTimer
+from synthetic import SYNTHETIC_ENVS, MakeSyntheticEnv
+
+
+def MakeEnv(envName):
+    if envName in SYNTHETIC_ENVS:
+        return MakeSyntheticEnv(envName)
+
+    import gym
+    import pybullet_envs
+    return gym.make(envName)
+
+
+def EnvWorker(remote, parentRemote, envName, seed):
+    parentRemote.close()
+    env = MakeEnv(envName)
+    env.seed(seed)
+    try:
+        while True:
+            command, data = remote.recv()
+            if command == "step":
+                nextState, reward, done, _ = env.step(data)
+                remote.send((nextState, reward, done))
+            elif command == "reset":
+                remote.send(env.reset())
+            elif command == "close":
+                break
+            else:
+                raise ValueError(f"Invalid command {command} !")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+        remote.close()
+
+
+# Steps environments in the current process (no auto reset):
+class SerialVecEnv:
+    def __init__(self, envs):
+        self.envs = envs
+
+    def __len__(self):
+        return len(self.envs)
+
+    def Reset(self, indices=None):
+        indices = range(len(self.envs)) if indices is None else indices
+        return np.stack([self.envs[i].reset() for i in indices])
+
+    def Step(self, actions):
+        results = [env.step(action) for env, action in zip(self.envs, actions)]
+        nextStates, rewards, dones, _ = zip(*results)
+        return np.stack(nextStates), np.array(rewards), np.array(dones)
+
+    def Close(self):
+        for env in self.envs:
+            env.close()
+
+
+# Steps every environment copy in its own subprocess (no auto reset):
+class SubprocVecEnv:
+    def __init__(self, envName, numEnvs, seed=0, context="spawn"):
+        ctx = mp.get_context(context)
+        self.remotes, workRemotes = zip(*[ctx.Pipe() for _ in range(numEnvs)])
+        self.processes = []
+        for i, (remote, workRemote) in enumerate(zip(self.remotes, workRemotes)):
+            process = ctx.Process(target=EnvWorker, args=(workRemote, remote, envName, seed + i), daemon=True)
+            process.start()
+            workRemote.close()
+            self.processes.append(process)
+
+    def __len__(self):
+        return len(self.remotes)
+
+    def Reset(self, indices=None):
+        indices = range(len(self.remotes)) if indices is None else indices
+        for i in indices:
+            self.remotes[i].send(("reset", None))
+        return np.stack([self.remotes[i].recv() for i in indices])
+
+    def Step(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", action))
+        nextStates, rewards, dones = zip(*[remote.recv() for remote in self.remotes])
+        return np.stack(nextStates), np.array(rewards), np.array(dones)
+
+    def Close(self):
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+
+
+def MakeVecEnv(envName, numEnvs, seed=0, env=None):
+    if numEnvs <= 1:
+        return SerialVecEnv([env if env is not None else MakeEnv(envName)])
+    else:
+        return SubprocVecEnv(envName, numEnvs, seed)
+
+
+# Collects transitions from a vectorized environment with one batched policy forward per step:
+class Collector:
+    def __init__(self, envs, agent, timer=None):
+        self.envs            = envs
+        self.agent           = agent
+        self.timer           = timer or PhaseTimer()
+        self.states          = envs.Reset()
+        self.episodeReward   = np.zeros(len(envs))
+        self.episodeNumTrans = np.zeros(len(envs), dtype=np.int64)
+        self.needReset       = []
+        self.numDropped      = 0
+
+    # Returns (states, actions, finishedEpisodes) where finishedEpisodes = [(envIndex, episodeReward, episodeNumTrans), ...]:
+    def Step(self):
+        # Finished environments are reset lazily, so they can still be used (e.g. for testing) between two steps:
+        if self.needReset:
+            with self.timer("env.reset"):
+                self.states[self.needReset] = self.envs.Reset(self.needReset)
+            self.needReset = []
+
+        states  = self.states
+        with self.timer("agent.Act"):
+            actions = self.agent.Act(states)
+        with self.timer("env.step"):
+            nextStates, rewards, dones = self.envs.Step(actions)
+        self.episodeReward   += rewards
+        self.episodeNumTrans += 1
+
+        finishedEpisodes = []
+        for i in np.flatnonzero(dones):
+            finishedEpisodes.append((int(i), float(self.episodeReward[i]), int(self.episodeNumTrans[i])))
+            self.episodeReward  [i] = 0
+            self.episodeNumTrans[i] = 0
+            self.needReset.append(i)
+
+        self.states = nextStates
+        return states, actions, finishedEpisodes
+
+    # Called by the learner after every Fit (the policy is shared in this process). The numRest transitions of the current step
+    # not pushed yet were collected with the old weights, so they are dropped (returns False then):
+    def OnPolicyUpdated(self, numRest=0):
+        self.numDropped += numRest
+        return numRest == 0
+
+    def Close(self):
+        self.envs.Close()
@@ -0,0 +1,72 @@
+import torch
+
+from utils import GetTrainIteration, RandomTrainIteration
+
+
+# Minibatch schedules for ASAF1.Fit. A schedule has one list of (expertIndex, agentIndex) pairs per epoch,
+# where an index is a slice or a LongTensor on the training device, so batches are gathered with state[index].
+
+# Random contiguous expert windows paired with the agent windows in order:
+class WindowSampler:
+    def __init__(self, nExpert, nAgent, batchSize, device="cpu"):
+        self.nExpert     = nExpert
+        self.nAgent      = nAgent
+        self.batchSize   = batchSize
+        self.batchLength = nAgent // batchSize + int(nAgent % batchSize != 0)
+
+    def Schedule(self, epochs):
+        schedule = []
+        for _ in range(epochs):
+            expertWindows = RandomTrainIteration(self.nExpert, self.batchSize, self.batchLength)
+            agentWindows  = GetTrainIteration(self.nAgent, self.batchSize)
+            schedule.append([(slice(sE, eE), slice(sA, eA)) for (sE, eE), (sA, eA) in zip(expertWindows, agentWindows)])
+
+        return schedule
+
+    # Expert indices used by a schedule, each window only once:
+    def ExpertRows(self, schedule):
+        windows = sorted(set((index.start, index.stop) for batches in schedule for index, _ in batches))
+        return [slice(s, e) for s, e in windows]
+
+
+# Shuffled per-epoch permutations generated directly on the training device:
+class RandomSampler:
+    def __init__(self, nExpert, nAgent, batchSize, device="cpu"):
+        self.nExpert   = nExpert
+        self.nAgent    = nAgent
+        self.batchSize = batchSize
+        self.device    = device
+
+    def Schedule(self, epochs):
+        schedule = []
+        for _ in range(epochs):
+            agentIndex = torch.randperm(self.nAgent, device=self.device)
+            if self.nExpert >= self.nAgent:
+                expertIndex = torch.randperm(self.nExpert, device=self.device)[:self.nAgent]
+            else:
+                expertIndex = torch.randint(self.nExpert, (self.nAgent, ), device=self.device)
+
+            schedule.append(list(zip(expertIndex.split(self.batchSize), agentIndex.split(self.batchSize))))
+
+        return schedule
+
+    def ExpertRows(self, schedule):
+        used = torch.zeros(self.nExpert, dtype=torch.bool, device=self.device)
+        for batches in schedule:
+            for index, _ in batches:
+                used[index] = True
+
+        return used.nonzero().squeeze(1).split(self.batchSize)
+
+
+SAMPLERS = {
+    "window": WindowSampler,
+    "random": RandomSampler
+}
+
+
+def GetSampler(name, nExpert, nAgent, batchSize, device="cpu"):
+    if name not in SAMPLERS:
+        raise ValueError(f"Invalid sampling mode {name} !")
+
+    return SAMPLERS[name](nExpert, nAgent, batchSize, device)
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import itertools
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import GetUniquePath
+
+
+# Cartesian product of the grid ({Train argument: [values]}) and the seeds -> list of Train kwargs overrides:
+def ExpandGrid(grid, seeds):
+    names   = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        for seed in seeds:
+            config = dict(zip(names, values))
+            config["seed"] = seed
+            configs.append(config)
+    return configs
+
+
+# Short name of a run from the arguments that differ between the runs of the sweep:
+def GetRunName(config, names):
+    return "_".join(f"{name}={os.path.basename(str(config[name]))}" for name in names if name in config)
+
+
+# Every worker takes its own block of cores, and torch only uses that many threads:
+def InitSweepWorker(coreSlots, numThreads):
+    cores = coreSlots.get()
+    if hasattr(os, "sched_setaffinity") and cores:
+        os.sched_setaffinity(0, cores)
+
+    import torch
+    torch.set_num_threads(numThreads)
+    torch.set_num_interop_threads(1)
+
+
+def RunConfig(config, logPath):
+    from train import Train, GetDefaultConfig
+
+    kwargs  = {**GetDefaultConfig(), **config}
+    result  = {"Config": config, "Log": logPath}
+    start   = time.perf_counter()
+    with open(logPath, "w") as log:
+        stdout, sys.stdout = sys.stdout, log
+        try:
+            result.update(Train(**kwargs))
+        except Exception:
+            traceback.print_exc(file=log)
+            result["Error"] = traceback.format_exc().splitlines()[-1]
+        finally:
+            sys.stdout = stdout
+
+    result["Seconds"] = time.perf_counter() - start
+    return result
+
+
+def LoadIndex(indexPath):
+    if not os.path.exists(indexPath):
+        return []
+    with open(indexPath, "r") as f:
+        return json.load(f)
+
+
+def SaveIndex(index, indexPath):
+    tmpPath = indexPath + ".tmp"
+    with open(tmpPath, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmpPath, indexPath)
+
+
+# Run every configuration in a pool of numWorkers processes with numThreads cores each.
+# The index is rewritten as runs finish, configurations already in the index are skipped:
+def Sweep(configs, indexPath="../model/sweep.json", logFolder="../history/sweep", numWorkers=None, numThreads=1):
+    cores      = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    numWorkers = numWorkers or max(1, len(cores) // numThreads)
+    os.makedirs(logFolder, exist_ok=True)
+
+    index   = LoadIndex(indexPath)
+    done    = [entry["Config"] for entry in index if "Error" not in entry]
+    configs = [config for config in configs if config not in done]
+    index   = [entry for entry in index if "Error" not in entry]
+    names   = [name for name in (configs[0] if configs else {}) if len({str(config[name]) for config in configs}) > 1]
+    print(f"Runs = {len(configs)} (skipped {len(done)}) | Workers = {numWorkers} | Threads per worker = {numThreads}")
+
+    # Limit the OpenMP / MKL pools of the workers before they import torch:
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(numThreads)
+
+    ctx       = mp.get_context("spawn")
+    coreSlots = ctx.Queue()
+    for i in range(numWorkers):
+        coreSlots.put(set(cores[i * numThreads: (i + 1) * numThreads]) if (i + 1) * numThreads <= len(cores) else set())
+
+    with ProcessPoolExecutor(numWorkers, mp_context=ctx, initializer=InitSweepWorker, initargs=(coreSlots, numThreads)) as executor:
+        futures = {}
+        for config in configs:
+            logPath = GetUniquePath(os.path.join(logFolder, (GetRunName(config, names) or "run") + ".log"))
+            open(logPath, "w").close()
+            futures[executor.submit(RunConfig, config, logPath)] = config
+
+        for future in as_completed(futures):
+            result = future.result()
+            name   = GetRunName(result["Config"], names)
+            index.append(result)
+            SaveIndex(index, indexPath)
+            if "Error" in result:
+                print(f"{name} | Failed: {result['Error']} | Log = {result['Log']}")
+            else:
+                print(f"{name} | Test Reward = {result['TestReward'] :.2f} | {result['Seconds'] :.0f}s | {result['ModelPath']}")
+
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a grid of Train configurations and seeds in parallel processes.")
+    parser.add_argument("grid"       , help='JSON (string or file) of {Train argument: [values]}, e.g. \'{"hiddenDim": [64, 128, 256]}\'')
+    parser.add_argument("--seeds"    , type=int, nargs="+", default=[87])
+    parser.add_argument("--workers"  , type=int, default=None, help="number of parallel runs (default: cores // threads)")
+    parser.add_argument("--threads"  , type=int, default=1   , help="cores and torch threads per run")
+    parser.add_argument("--index"    , default="../model/sweep.json")
+    parser.add_argument("--logFolder", default="../history/sweep")
+    args = parser.parse_args()
+
+    if os.path.exists(args.grid):
+        with open(args.grid, "r") as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+
+    Sweep(ExpandGrid(grid, args.seeds), args.index, args.logFolder, args.workers, args.threads)
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+# Deterministic gym-style environments with the dims of the real tasks, for benchmarks without a simulator:
+SYNTHETIC_ENVS = {
+    "SyntheticAnt-v0"                   : {"stateDim": 111, "actionDim": 8, "episodeLength": 1000},
+    "SyntheticInvertedDoublePendulum-v0": {"stateDim": 9  , "actionDim": 1, "episodeLength": 1000}
+}
+
+
+class Box:
+    def __init__(self, low, high, shape):
+        self.shape = shape
+        self.low   = np.full(shape, low , dtype=np.float32)
+        self.high  = np.full(shape, high, dtype=np.float32)
+
+
+# Linear dynamics s' = tanh(A s + B a) + noise, the reward is larger when the action follows a fixed linear expert:
+class SyntheticEnv:
+    def __init__(self, stateDim, actionDim, episodeLength=1000, minAction=-1., maxAction=1., seed=0):
+        self.observation_space = Box(-np.inf, np.inf, (stateDim, ))
+        self.action_space      = Box(minAction, maxAction, (actionDim, ))
+        self.reward_range      = (-float("inf"), float("inf"))
+        self.episodeLength     = episodeLength
+        self.seed(seed)
+
+        # The dynamics do not depend on the seed, only the initial states and the noise do:
+        params = np.random.RandomState(12345)
+        self.A = params.randn(stateDim , stateDim) / np.sqrt(stateDim)
+        self.B = params.randn(actionDim, stateDim) / np.sqrt(actionDim)
+        self.K = params.randn(stateDim , actionDim) / np.sqrt(stateDim)
+
+    def seed(self, seed=None):
+        self.rng = np.random.RandomState(seed)
+        return [seed]
+
+    def reset(self):
+        self.t     = 0
+        self.state = self.rng.randn(self.observation_space.shape[0]) * 0.1
+        return self.state.copy()
+
+    # Action of the synthetic expert (used to generate demos):
+    def ExpertAction(self, state):
+        return np.clip(np.tanh(state @ self.K), self.action_space.low, self.action_space.high)
+
+    def step(self, action):
+        action     = np.clip(action, self.action_space.low, self.action_space.high)
+        reward     = 1. - float(np.mean(np.square(action - self.ExpertAction(self.state))))
+        self.state = np.tanh(self.state @ self.A + action @ self.B) + self.rng.randn(self.state.shape[0]) * 0.01
+        self.t    += 1
+        return self.state.copy(), reward, self.t >= self.episodeLength, {}
+
+    def render(self, mode="human"):
+        pass
+
+    def close(self):
+        pass
+
+
+def MakeSyntheticEnv(envName):
+    return SyntheticEnv(**SYNTHETIC_ENVS[envName])
+
+
+# Demo of the synthetic expert in the columnar demo format:
+def GenerateSyntheticDemo(envName, demoPath, numData, seed=0):
+    from data import DemoWriter
+
+    env = MakeSyntheticEnv(envName)
+    env.seed(seed)
+    with DemoWriter(demoPath) as writer:
+        state, states, actions = env.reset(), [], []
+        for _ in range(numData):
+            action = env.ExpertAction(state)
+            states .append(state )
+            actions.append(action)
+            state, _, done, _ = env.step(action)
+            if done: state = env.reset()
+
+        writer.Write(np.stack(states), np.stack(actions))
+
+    return demoPath
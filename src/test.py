@@ -1,15 +1,20 @@
-import gym
-import pybullet_envs
+import os
 import glob
-from tqdm import trange
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 from model import ASAF1
 from utils import SeedEverything
+from rollout import MakeEnv
+from evaluation import SuccessiveElimination, SequentialThresholdTest
+from registry import CheckpointRegistry, GetRewardKey
 
 import torch
 
 
-def Test(agent, env, nEpisode, isRender=False, isEnvClose=False, minReward=-float("inf")):
+# With a trajectory list, the (state, action) pairs of the episodes are appended to it:
+def Test(agent, env, nEpisode, isRender=False, isEnvClose=False, minReward=-float("inf"), trajectory=None):
     agent.ToEvalMode()
     anyTooSmall = False
     with torch.no_grad():
@@ -20,6 +25,7 @@ def Test(agent, env, nEpisode, isRender=False, isEnvClose=False, minReward=-floa
             while not done:
                 if isRender: env.render()
                 action = agent.Act(state)
+                if trajectory is not None: trajectory.append((state, action))
                 state, reward, done, _ = env.step(action)
                 episodeReward += reward
             
@@ -31,56 +37,177 @@ def Test(agent, env, nEpisode, isRender=False, isEnvClose=False, minReward=-floa
     return totalReward / nEpisode, anyTooSmall
 
 
-def TestGenerally(modelPath, envName, testNumSeed=50, hiddenDim=256):
-    env       = gym.make(envName)
+def LoadTestAgent(modelPath, env, hiddenDim=256, actBackend="auto", squashing=None):
     stateDim  = env.observation_space.shape[0]
     actionDim = env.action_space.shape[0]
     maxAction = env.action_space.high[0]
     minAction = env.action_space.low[0]
 
-    agent = ASAF1(stateDim, actionDim, hiddenDim, minAction, maxAction)
+    agent = ASAF1(stateDim, actionDim, hiddenDim, minAction, maxAction, squashing=squashing, actBackend=actBackend)
     agent.Load(modelPath)
+    return agent
 
-    rewardList = []
-    for seed in trange(testNumSeed):
-        SeedEverything(seed, env)
-        rewardList.append(Test(agent, env, 1, isEnvClose=False)[0])
 
-    avgReward, minReward, maxReward = sum(rewardList) / testNumSeed, min(rewardList), max(rewardList)
+# Environments and agents of one evaluation process, created once and reused for every seed:
+workerEnvs, workerAgents = {}, {}
+
+
+def InitTestWorker():
+    torch.set_num_threads(1)
+
+
+# job = (modelPath, envName, hiddenDim, seed, actBackend, squashing) -> (env, agent) of the job, seeded with its seed
+def GetSeededWorker(job):
+    modelPath, envName, hiddenDim, seed, actBackend, squashing = job
+    if envName not in workerEnvs:
+        workerEnvs[envName] = MakeEnv(envName)
+    
+    env = workerEnvs[envName]
+    key = (modelPath, hiddenDim, actBackend, squashing)
+    if key not in workerAgents:
+        workerAgents[key] = LoadTestAgent(modelPath, env, hiddenDim, actBackend, squashing)
+
+    SeedEverything(seed, env)
+    return env, workerAgents[key]
+
+
+# job -> reward of one seeded episode
+def TestSeed(job):
+    env, agent = GetSeededWorker(job)
+    return Test(agent, env, 1, isEnvClose=False)[0]
+
+
+# job -> (reward, states, actions) of one seeded episode
+def RolloutSeed(job):
+    env, agent = GetSeededWorker(job)
+    trajectory = []
+    reward     = Test(agent, env, 1, isEnvClose=False, trajectory=trajectory)[0]
+    states, actions = zip(*trajectory)
+    return reward, np.asarray(states, dtype=np.float32), np.asarray(actions, dtype=np.float32)
+
+
+# Run the jobs in a process pool (every worker creates its own env and loads the policies), results keep the order of the jobs:
+def TestSeeds(jobs, numWorkers=1):
+    from tqdm import tqdm
+
+    if numWorkers <= 1:
+        return [TestSeed(job) for job in tqdm(jobs)]
+
+    with ProcessPoolExecutor(numWorkers, mp_context=mp.get_context("spawn"), initializer=InitTestWorker) as pool:
+        chunkSize = max(1, len(jobs) // (numWorkers * 4))
+        return list(tqdm(pool.map(TestSeed, jobs, chunksize=chunkSize), total=len(jobs)))
+
+
+def PrintTestResult(rewardList):
+    avgReward, minReward, maxReward = sum(rewardList) / len(rewardList), min(rewardList), max(rewardList)
     print("=" * 100)
     print(f"Average Test Reward = {avgReward :.2f}")
     print(f"Minimum Test Reward = {maxReward :.2f} (index = {rewardList.index(maxReward)})")
     print(f"Maximum Test Reward = {minReward :.2f} (index = {rewardList.index(minReward)})")
-    env.close()
+    return avgReward
+
+
+# Evaluate(jobs=[(modelPath, seed), ...]) -> [reward, ...], with a registry only the rewards it does not hold yet are run
+# (the rewards of squashed / int8 policies are registered apart from the plain float ones):
+def GetEvaluate(envName, hiddenDim, numWorkers=1, registry=None, actBackend="auto", squashing=None):
+    Run = lambda jobs: TestSeeds([(modelPath, envName, hiddenDim, seed, actBackend, squashing) for modelPath, seed in jobs], numWorkers)
+    if registry is None:
+        return Run
+
+    return lambda jobs: registry.Evaluate(jobs, envName, hiddenDim, Run, squashing, GetRewardKey(envName, squashing, actBackend))
+
+
+# With threshold, seeds are only run until the average reward is settled above / below it (numWorkers seeds per round):
+def TestGenerally(modelPath, envName, testNumSeed=50, hiddenDim=256, numWorkers=1, threshold=None, confidence=0.95, registryPath=None, actBackend="auto",
+                  squashing=None):
+    from tqdm import trange
+
+    registry = CheckpointRegistry(registryPath) if registryPath else None
+    Evaluate = GetEvaluate(envName, hiddenDim, numWorkers, registry, actBackend, squashing)
+    if threshold is not None:
+        result = SequentialThresholdTest(
+            lambda seeds: Evaluate([(modelPath, seed) for seed in seeds]),
+            threshold, testNumSeed, max(1, numWorkers), confidence=confidence
+        )
+        rewardList = result["Rewards"]
+        print(f"Reward {'>=' if result['IsAbove'] else '<'} {threshold} with confidence {result['Confidence'] :.3f} after {result['Episodes']} seeds (saved {result['SavedEpisodes']})")
+    elif numWorkers > 1 or registry is not None:
+        rewardList = Evaluate([(modelPath, seed) for seed in range(testNumSeed)])
+    else:
+        env   = MakeEnv(envName)
+        agent = LoadTestAgent(modelPath, env, hiddenDim, actBackend, squashing)
+
+        rewardList = []
+        for seed in trange(testNumSeed):
+            SeedEverything(seed, env)
+            rewardList.append(Test(agent, env, 1, isEnvClose=False)[0])
+        
+        env.close()
+
+    avgReward = PrintTestResult(rewardList)
     return avgReward, rewardList
 
 
-def TestAll(envName, hiddenDim, testNumSeed=50):
-    modelPaths = glob.glob(f"../model/ASAF1_{hiddenDim}_{envName}_*.pth")
+# With isAdaptive, the checkpoints are evaluated in rounds of roundSeeds seeds and the ones that are clearly worse are dropped (successive elimination).
+# With registryPath, the per-seed rewards are kept in the checkpoint registry, so only new or changed checkpoints (and new seeds) are run:
+def TestAll(envName, hiddenDim, testNumSeed=50, numWorkers=1, isAdaptive=False, confidence=0.95, roundSeeds=5, modelFolder="../model", registryPath=None,
+            actBackend="auto", squashing=None):
+    modelPaths = sorted(glob.glob(os.path.join(modelFolder, f"ASAF1_{hiddenDim}_{envName}_*.pth")))
+    registry   = CheckpointRegistry(registryPath) if registryPath else None
+    Evaluate   = GetEvaluate(envName, hiddenDim, numWorkers, registry, actBackend, squashing)
     bestReward, bestModelPath = -float("inf"), None
-    for modelPath in modelPaths:
-        print("-" * 50 + f"\n[{modelPath}]")
-        avgReward, _ = TestGenerally(modelPath, envName, testNumSeed, hiddenDim)
-        if avgReward > bestReward:
-            bestReward = avgReward
-            bestModelPath = modelPath
+    if isAdaptive:
+        result = SuccessiveElimination(modelPaths, Evaluate, testNumSeed, roundSeeds, confidence=confidence)
+        for modelPath in modelPaths:
+            rewards = result["Rewards"][modelPath]
+            print("-" * 50 + f"\n[{modelPath}] ({len(rewards)} seeds{'' if modelPath in result['Remaining'] else ', dropped'})")
+            PrintTestResult(rewards)
+
+        bestModelPath, bestReward = result["Best"], result["BestReward"]
+    else:
+        if numWorkers > 1 or registry is not None:
+            # Seeds of all checkpoints are spread over the workers at once:
+            rewards    = Evaluate([(modelPath, seed) for modelPath in modelPaths for seed in range(testNumSeed)])
+            rewardDict = {modelPath: rewards[i * testNumSeed: (i + 1) * testNumSeed] for i, modelPath in enumerate(modelPaths)}
+
+        for modelPath in modelPaths:
+            print("-" * 50 + f"\n[{modelPath}]")
+            if numWorkers > 1 or registry is not None:
+                avgReward = PrintTestResult(rewardDict[modelPath])
+            else:
+                avgReward, _ = TestGenerally(modelPath, envName, testNumSeed, hiddenDim, actBackend=actBackend, squashing=squashing)
+
+            if avgReward > bestReward:
+                bestReward = avgReward
+                bestModelPath = modelPath
     
     print("\n" + "=" * 70)
     print(f"Best Model: [{bestModelPath}]")
     print(f"Best Reward = {bestReward :.2f}")
+    if isAdaptive:
+        print(f"Confidence  = {result['Confidence'] :.3f}")
+        print(f"Episodes    = {result['Episodes']} (saved {result['SavedEpisodes']} of {len(modelPaths) * testNumSeed})")
     print("")
-
-
-if __name__ == '__main__':
-
-    TestAll(
-        envName    = "Ant-v2",
-        hiddenDim  = 256
+    return bestModelPath, bestReward
+
+
+# Keyword arguments of TestAll (and of TestGenerally where the names match):
+def GetDefaultConfig():
+    return dict(
+        envName      = "Ant-v2",
+        hiddenDim    = 256,
+        testNumSeed  = 50,
+        numWorkers   = os.cpu_count(),
+        isAdaptive   = False,
+        confidence   = 0.95,
+        roundSeeds   = 5,
+        modelFolder  = "../model",
+        registryPath = "../model/registry.json",
+        actBackend   = "auto",
+        squashing    = None
     )
 
 
+if __name__ == '__main__':
 
-
-
-
-
+    TestAll(**GetDefaultConfig())
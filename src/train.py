@@ -1,13 +1,16 @@
 import os
-import gym
-import pybullet_envs
+import time
 
 import torch
 
-from model import ASAF1
+from model import ASAF1, GetPrecisionDtype
 from data import ExpertBuffer, AgentBuffer
-from utils import SeedEverything, SavePickle
-from test import Test
+from utils import SeedEverything, GetUniquePath, PhaseTimer
+from history import HistoryWriter
+from checkpoint import CheckpointWriter, LoadCheckpoint, GetRandomState, SetRandomState
+from rollout import MakeEnv, MakeVecEnv, Collector
+from actor import AsyncCollector
+from evaluation import SequentialThresholdTest
 
 
 ENVIRONMENT_NAME      = "Ant-v2"
@@ -22,6 +25,10 @@ MAX_NUM_TRANSITION    = 2000000
 NUM_TRANSITION_UPDATE = 4000
 EPOCHS_PER_UPDATE     = 10
 UPDATE_BATCH_SIZE     = 256
+SAMPLING_MODE         = "window"
+PRECISION             = "fp32"
+IS_PREPROCESS_DEMO    = True
+IS_DEDUP_DEMO         = False
 
 GRADIENT_CLIPPING     = 1.
 LEARNING_RATE         = 1e-3
@@ -37,15 +44,47 @@ SQUASHING_FUNCTION    = None
 IS_TEST_AGENT         = True
 IS_EARLY_STOPPING     = False
 TEST_NUM_EPISODE      = 5
+IS_ADAPTIVE_TEST      = False
+TEST_CONFIDENCE       = 0.95
 CAN_TEST_REWARD       = 3000
 END_TRAIN_REWARD      = 5000
 
+NUM_ENVIRONMENTS      = 1
+NUM_ASYNC_ACTORS      = 0
+MAX_POLICY_STALENESS  = 1
+NUM_FIT_PROCESSES     = 1
+ACT_BACKEND           = "auto"
+
+IS_PROFILING          = False
+PROFILE_FIT_TRACE     = None
+
+CHECKPOINT_INTERVAL   = 100000
+RESUME_STATE_PATH     = None
+
+
+# Push transitions until the buffer is full, returns the number pushed:
+def PushTransitions(agentBuffer, states, actions, timer):
+    numPushed = 0
+    for state, action in zip(states, actions):
+        if agentBuffer.IsFull():
+            break
+        with timer("buffer.Push"):
+            agentBuffer.Push(state, action)
+        numPushed += 1
+
+    return numPushed
+
 
 def Train(expertDemoPath, maxExpertDemo, envName, endTrainReward, maxTrans, numTransUpdate, epochsPerUpdate, batchSize, 
           gradClip, lr, optimizer, optimizerParams, scheduler, schedulerParams, schedulerWarmup, hiddenDim, squashing, 
-          canTestReward, isTest, numTestEpisode, isEarlyStop, modelSaveFolder, historySaveFolder, seed):
+          canTestReward, isTest, numTestEpisode, isEarlyStop, modelSaveFolder, historySaveFolder, seed, numEnvs=1, sampling="window",
+          numActors=0, maxStaleness=1, isProfile=False, profileFitPath=None,
+          checkpointInterval=0, resumePath=None, precision="fp32", isPreprocess=False, isDedup=False, isAdaptiveTest=False, testConfidence=0.95,
+          numFitProcs=1, actBackend="auto"):
+    from test import Test
+
     # Environment:
-    env       = gym.make(envName)
+    env       = MakeEnv(envName)
     stateDim  = env.observation_space.shape[0]
     actionDim = env.action_space.shape[0]
     maxAction = env.action_space.high[0]
@@ -57,123 +96,255 @@ def Train(expertDemoPath, maxExpertDemo, envName, endTrainReward, maxTrans, numT
     print(f"Max action   = {maxAction :.5f}")
     print(f"Min action   = {minAction :.5f}")
     print(f"Reward range = {env.reward_range}")
+    print(f"Num envs     = {numEnvs}")
+    print(f"Num actors   = {numActors}")
+    print(f"Fit procs    = {numFitProcs}")
     print("=" * 100)
 
     # Random seed:
     SeedEverything(seed, env)
 
-    # Device:
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    # Device (the data-parallel Fit only runs on the CPU):
+    device = torch.device("cuda:0" if torch.cuda.is_available() and numFitProcs <= 1 else "cpu")
 
-    # Transition buffers:
-    expertBuffer = ExpertBuffer(expertDemoPath, maxExpertDemo, device)
-    agentBuffer  = AgentBuffer (numTransUpdate, device)
+    # Transition buffers (stored in bf16 with precision="bf16", the expert actions are mapped once and cached with isPreprocess):
+    dtype        = GetPrecisionDtype(precision)
+    if isPreprocess:
+        expertBuffer = ExpertBuffer(expertDemoPath, maxExpertDemo, device, dtype, minAction, maxAction, squashing, isDedup)
+    else:
+        expertBuffer = ExpertBuffer(expertDemoPath, maxExpertDemo, device, dtype)
+    agentBuffer  = AgentBuffer (numTransUpdate, device, stateDim, actionDim, dtype)
 
 
     # Agent:
     agent = ASAF1(stateDim, actionDim, hiddenDim, minAction, maxAction, optimizer, scheduler, lr, 
-                  gradClip, squashing, schedulerWarmup, optimizerParams, schedulerParams)
+                  gradClip, squashing, schedulerWarmup, optimizerParams, schedulerParams, actBackend=actBackend, sampling=sampling, precision=precision)
     agent.SetDevice(device)
     agent.ToTrainMode()
 
-    # History:
-    history = {
-        "Transition": [],
-        "Episode"   : [],
-        "Reward"    : [],
-        "TestReward": [],
-        "LR"        : []
-    }
+    # Per-phase timers (no-op when profiling is disabled):
+    timer = PhaseTimer(isProfile)
+    agent.timer = timer
+
+    # Data-parallel Fit over numFitProcs processes (this one and numFitProcs - 1 workers kept alive until the end):
+    fitter = agent
+    if numFitProcs > 1:
+        from distributed import DataParallelFit
+        fitParams = dict(stateDim=stateDim, actionDim=actionDim, hiddenDim=hiddenDim, minActVal=minAction, maxActVal=maxAction, optimizer=optimizer,
+                         lr=lr, gradClip=gradClip, squashing=squashing, optimizerParams=optimizerParams, sampling=sampling, precision=precision)
+        fitter    = DataParallelFit(agent, fitParams, numFitProcs)
+
+    # Resume from a training state (the simulators are not saved, so the episodes running at that time are restarted):
+    resumeState = LoadCheckpoint(resumePath) if resumePath else None
+    if resumeState:
+        agent      .LoadStateDict(resumeState["agent"], isLoadOptimizer=True)
+        agentBuffer.LoadStateDict(resumeState["agentBuffer"])
+
+    # History (streamed to disk in chunks while training, renamed with the final test reward at the end):
+    if resumeState:
+        historyPath = resumeState["historyPath"]
+        if os.path.exists(historyPath):
+            with open(historyPath, "r+b") as f:
+                f.truncate(resumeState["historyBytes"])
+    else:
+        historyPath = GetUniquePath(os.path.join(historySaveFolder, f"ASAF1_{hiddenDim}_{envName}_S={seed}.hist"))
+    history = HistoryWriter(historyPath)
+
+    # Checkpoints are written by a background thread, the training state is saved every checkpointInterval transitions:
+    writer    = CheckpointWriter()
+    statePath = os.path.join(modelSaveFolder, os.path.splitext(os.path.basename(historyPath))[0] + ".state")
+
+    # Rollout: asynchronous actor processes (numEnvs environments each), or environments stepped by this process
+    # (with one environment the training env itself is stepped):
+    if numActors > 0:
+        agentParams = dict(stateDim=stateDim, actionDim=actionDim, hiddenDim=hiddenDim, minActVal=minAction, maxActVal=maxAction, squashing=squashing,
+                           actBackend=actBackend)
+        chunkSize   = max(1, numTransUpdate // (4 * numActors))
+        collector   = AsyncCollector(envName, agent, agentParams, numActors, numEnvs, chunkSize, maxStaleness, seed, timer)
+    else:
+        collector   = Collector(MakeVecEnv(envName, numEnvs, seed, env), agent, timer)
 
     # Training process:
-    state, nowLR = env.reset(), 0.
+    nowLR     = 0.
     expertStates   , expertActions = expertBuffer[:]
     totalEpisode   , totalNumTrans, totalReachGoalTimes = 0, 0, 0
-    episodeNumTrans, episodeReward, ewmaReward, testReward = 0, 0, 0, 0
-    while totalNumTrans < maxTrans:
-        # Get one transition of the agent:
-        action = agent.Act(state)
-        nextState, reward, done, _ = env.step(action)
-        agentBuffer.Push(state, action)
-
-        # Record something:
-        episodeReward   += reward
-        episodeNumTrans += 1
-        totalNumTrans   += 1
-
-        # When the episode is done:
-        if done:
+    ewmaReward     , testReward    = 0, 0
+    numUpdates     , fitSeconds    = 0, 0.
+    testEpisodes   , savedTestEpisodes = 0, 0
+    updatesPerFit  = epochsPerUpdate * (numTransUpdate // batchSize + int(numTransUpdate % batchSize != 0))
+    startTime      = time.perf_counter()
+    isStop, isFitProfiled = False, False
+    if resumeState:
+        counters = resumeState["counters"]
+        totalEpisode, totalNumTrans, totalReachGoalTimes = counters["totalEpisode"], counters["totalNumTrans"], counters["totalReachGoalTimes"]
+        ewmaReward  , testReward   , nowLR               = counters["ewmaReward"]  , counters["testReward"]   , counters["nowLR"]
+        numUpdates  , fitSeconds   , isFitProfiled       = counters["numUpdates"]  , counters["fitSeconds"]   , counters["isFitProfiled"]
+        testEpisodes, savedTestEpisodes                  = counters.get("testEpisodes", 0), counters.get("savedTestEpisodes", 0)
+        startTime  -= counters["elapsedSeconds"]
+        SetRandomState(resumeState["random"])
+        print(f"Resume from {resumePath} (Epi: {totalEpisode} | Total trans: {totalNumTrans})")
+
+    lastStateNumTrans = totalNumTrans
+    while totalNumTrans < maxTrans and not isStop:
+        # Get one transition of every environment with one batched forward (or one chunk of the actors),
+        # pushed until the agent buffer is full (the rest waits for the Fit):
+        states, actions, finishedEpisodes = collector.Step()
+        numPushed      = PushTransitions(agentBuffer, states, actions, timer)
+        totalNumTrans += numPushed
+
+        # When some episodes are done:
+        for envIndex, episodeReward, episodeNumTrans in finishedEpisodes:
             # Print training message:
             totalEpisode += 1
             ewmaReward    = ewmaReward * 0.95 + episodeReward * 0.05
-            print(f"| Epi: {totalEpisode} | Total trans: {totalNumTrans :7d} | Epi trans: {episodeNumTrans :5d} | Epi Reward: {episodeReward :.2f} | EWMA Reward: {ewmaReward :.2f} | LR: {nowLR :.6f} |", end="")
+            print(f"| Epi: {totalEpisode} | Env: {envIndex :2d} | Total trans: {totalNumTrans :7d} | Epi trans: {episodeNumTrans :5d} | Epi Reward: {episodeReward :.2f} | EWMA Reward: {ewmaReward :.2f} | LR: {nowLR :.6f} |", end="")
             
             # Test agent:
             if isTest and episodeReward >= canTestReward and totalNumTrans >= maxTrans // 2:
-                testReward, anyTooSmall = Test(agent, env, numTestEpisode, False, False, endTrainReward * 0.9)
+                with timer("Test"):
+                    if isAdaptiveTest:
+                        # Stop testing once the average reward is settled above / below endTrainReward:
+                        result = SequentialThresholdTest(lambda seeds: [Test(agent, env, 1)[0] for _ in seeds], endTrainReward, numTestEpisode, 
+                                                         minEpisodes=min(3, numTestEpisode), confidence=testConfidence)
+                        testReward , anyTooSmall = result["Reward"], min(result["Rewards"]) < endTrainReward * 0.9
+                        testEpisodes, savedTestEpisodes = testEpisodes + result["Episodes"], savedTestEpisodes + result["SavedEpisodes"]
+                    else:
+                        testReward , anyTooSmall = Test(agent, env, numTestEpisode, False, False, endTrainReward * 0.9)
+                        testEpisodes += numTestEpisode
                 print(f" => Test Reward = {testReward :.2f}")
                 if testReward >= endTrainReward and not anyTooSmall:
-                    agent.Save(os.path.join(modelSaveFolder  , f"ASAF1_{hiddenDim}_{envName}_E={totalEpisode}_R={round(testReward)}.pth"))
+                    agent.Save(os.path.join(modelSaveFolder  , f"ASAF1_{hiddenDim}_{envName}_E={totalEpisode}_R={round(testReward)}.pth"), writer)
                     totalReachGoalTimes += 1
-                    if isEarlyStop and totalReachGoalTimes >= 10: break
+                    if isEarlyStop and totalReachGoalTimes >= 10:
+                        isStop = True
+                        break
 
             else:
                 print("")
 
             # Record history:
-            history["Transition"].append(totalNumTrans)
-            history["Episode"   ].append(totalEpisode)
-            history["Reward"    ].append(episodeReward)
-            history["TestReward"].append(testReward)
-            history["LR"        ].append(nowLR)
-
-            # Reset environment:
-            episodeNumTrans, episodeReward = 0, 0
-            state = env.reset()
-        else:
-            state = nextState
-        
-        # Update policy:
-        if agentBuffer.IsFull():
-            agentStates , agentActions  = agentBuffer[:]
-            agent.Fit(expertStates, expertActions, agentStates, agentActions, epochsPerUpdate, batchSize)
+            history.Append(
+                Transition   = totalNumTrans,
+                Episode      = totalEpisode,
+                Env          = envIndex,
+                Reward       = episodeReward,
+                TestReward   = testReward,
+                LR           = nowLR,
+                TransPerSec  = totalNumTrans / (time.perf_counter() - startTime),
+                UpdatePerSec = numUpdates / fitSeconds if fitSeconds > 0 else 0.
+            )
+
+        # Update policy (a torch profiler trace of the first Fit is saved if profileFitPath is given):
+        if agentBuffer.IsFull() and not isStop:
+            with timer("buffer.slice"):
+                agentStates , agentActions  = agentBuffer[:]
+
+            fitStart   = time.perf_counter()
+            fitContext = torch.profiler.profile(record_shapes=True) if profileFitPath and not isFitProfiled else PhaseTimer.NULL_CONTEXT
+            with fitContext as profiler:
+                fitter.Fit(expertStates, expertActions, agentStates, agentActions, epochsPerUpdate, batchSize, expertBuffer.isMapped, expertBuffer.logJacobians)
+            if profiler is not None:
+                profiler.export_chrome_trace(profileFitPath)
+                isFitProfiled = True
+
+            fitSeconds += time.perf_counter() - fitStart
+            numUpdates += updatesPerFit
+            timer.Count("Fit", 1)
             agentBuffer.Clear()
             nowLR = agent.UpdateScheduler(objective=ewmaReward if scheduler == "ReduceLROnPlateau" else None)
+
+            # The rest of the step / chunk was collected with the old weights, it starts the new window unless the collector drops it:
+            if collector.OnPolicyUpdated(len(states) - numPushed):
+                totalNumTrans += PushTransitions(agentBuffer, states[numPushed:], actions[numPushed:], timer)
+
+        # Save everything needed to resume the run (after the Fit, so the window of the agent buffer is restarted):
+        if checkpointInterval > 0 and totalNumTrans - lastStateNumTrans >= checkpointInterval:
+            counters = {
+                "totalEpisode": totalEpisode, "totalNumTrans": totalNumTrans, "totalReachGoalTimes": totalReachGoalTimes,
+                "ewmaReward"  : ewmaReward  , "testReward"   : testReward   , "nowLR"              : nowLR,
+                "numUpdates"  : numUpdates  , "fitSeconds"   : fitSeconds   , "isFitProfiled"      : isFitProfiled,
+                "testEpisodes": testEpisodes, "savedTestEpisodes": savedTestEpisodes,
+                "elapsedSeconds": time.perf_counter() - startTime
+            }
+            trainState = {
+                "agent"       : agent.StateDict(),
+                "agentBuffer" : agentBuffer.StateDict(),
+                "counters"    : counters,
+                "random"      : GetRandomState(),
+                "historyPath" : historyPath,
+                "historyBytes": history.Sync()
+            }
+            writer.Submit(trainState, statePath, isUnique=False)
+            lastStateNumTrans = totalNumTrans
     
+    if numActors > 0 or numEnvs > 1:
+        print(f"Dropped stale transitions = {collector.numDropped}")
+    if isProfile:
+        print(timer.Summary())
+    if isAdaptiveTest:
+        print(f"Test episodes = {testEpisodes} (saved {savedTestEpisodes})")
+
     # Save model and history:
     modelSavePath   = os.path.join(modelSaveFolder  , f"ASAF1_{hiddenDim}_{envName}_R={round(testReward)}.pth")
-    historySavePath = os.path.join(historySaveFolder, f"ASAF1_{hiddenDim}_{envName}_R={round(testReward)}.pkl")
-    agent.Save(modelSavePath)
-    SavePickle(history, historySavePath)
+    historySavePath = GetUniquePath(os.path.join(historySaveFolder, f"ASAF1_{hiddenDim}_{envName}_R={round(testReward)}.hist"))
+    writer.Close()
+    modelSavePath = agent.Save(modelSavePath)
+    history.Close()
+    os.replace(historyPath, historySavePath)
 
-    # Close environment:
-    env.close()
+    # Close environments:
+    collector.Close()
+    if numFitProcs > 1: fitter.Close()
+    if numEnvs > 1 or numActors > 0: env.close()
+
+    return {"ModelPath": modelSavePath, "HistoryPath": historySavePath, "TestReward": testReward, "Episode": totalEpisode, "Transition": totalNumTrans,
+            "TestEpisodes": testEpisodes, "SavedTestEpisodes": savedTestEpisodes, "DroppedTransitions": collector.numDropped}
         
         
-if __name__ == '__main__':
-    Train(
-        EXPERT_DEMO_PATH,
-        MAX_NUM_EXPERT_DEMO,
-        ENVIRONMENT_NAME,
-        END_TRAIN_REWARD,
-        MAX_NUM_TRANSITION,
-        NUM_TRANSITION_UPDATE,
-        EPOCHS_PER_UPDATE, 
-        UPDATE_BATCH_SIZE,
-        GRADIENT_CLIPPING,
-        LEARNING_RATE,
-        OPTIMIZER_NAME,
-        OPTIMIZER_PARAMETERS,
-        SCHEDULER_NAME,
-        SCHEDULER_PARAMETERS,
-        SCHEDULER_WARMUP,
-        NETWORK_HIDDEN_DIM,
-        SQUASHING_FUNCTION,
-        CAN_TEST_REWARD,
-        IS_TEST_AGENT,
-        TEST_NUM_EPISODE,
-        IS_EARLY_STOPPING,
-        MODEL_SAVE_FOLDER,
-        HISTORY_SAVE_FOLDER,
-        RANDOM_SEED
+# Keyword arguments of Train from the constants above:
+def GetDefaultConfig():
+    return dict(
+        expertDemoPath     = EXPERT_DEMO_PATH,
+        maxExpertDemo      = MAX_NUM_EXPERT_DEMO,
+        envName            = ENVIRONMENT_NAME,
+        endTrainReward     = END_TRAIN_REWARD,
+        maxTrans           = MAX_NUM_TRANSITION,
+        numTransUpdate     = NUM_TRANSITION_UPDATE,
+        epochsPerUpdate    = EPOCHS_PER_UPDATE,
+        batchSize          = UPDATE_BATCH_SIZE,
+        gradClip           = GRADIENT_CLIPPING,
+        lr                 = LEARNING_RATE,
+        optimizer          = OPTIMIZER_NAME,
+        optimizerParams    = OPTIMIZER_PARAMETERS,
+        scheduler          = SCHEDULER_NAME,
+        schedulerParams    = SCHEDULER_PARAMETERS,
+        schedulerWarmup    = SCHEDULER_WARMUP,
+        hiddenDim          = NETWORK_HIDDEN_DIM,
+        squashing          = SQUASHING_FUNCTION,
+        canTestReward      = CAN_TEST_REWARD,
+        isTest             = IS_TEST_AGENT,
+        numTestEpisode     = TEST_NUM_EPISODE,
+        isEarlyStop        = IS_EARLY_STOPPING,
+        modelSaveFolder    = MODEL_SAVE_FOLDER,
+        historySaveFolder  = HISTORY_SAVE_FOLDER,
+        seed               = RANDOM_SEED,
+        numEnvs            = NUM_ENVIRONMENTS,
+        sampling           = SAMPLING_MODE,
+        numActors          = NUM_ASYNC_ACTORS,
+        maxStaleness       = MAX_POLICY_STALENESS,
+        isProfile          = IS_PROFILING,
+        profileFitPath     = PROFILE_FIT_TRACE,
+        checkpointInterval = CHECKPOINT_INTERVAL,
+        resumePath         = RESUME_STATE_PATH,
+        precision          = PRECISION,
+        isPreprocess       = IS_PREPROCESS_DEMO,
+        isDedup            = IS_DEDUP_DEMO,
+        isAdaptiveTest     = IS_ADAPTIVE_TEST,
+        testConfidence     = TEST_CONFIDENCE,
+        numFitProcs        = NUM_FIT_PROCESSES,
+        actBackend         = ACT_BACKEND
     )
+
+
+if __name__ == '__main__':
+    Train(**GetDefaultConfig())
@@ -1,14 +1,29 @@
 import os
 import copy
+import time
 import random
 import pickle
+import contextlib
+from collections import defaultdict
 import numpy as np
-import matplotlib.pyplot as plt
 
 import torch
 
 
+EPS  = 1e-8
+EPS2 = 1e-4
+
+
+# action in [-1, 1] -> (atanh(action), sum(log(1 - action^2 + EPS))), the pre-squashing action and the log-det of tanh:
+def AtanhAction(action):
+    preAction   = torch.atanh(torch.clamp(action, -1 + EPS2, 1 - EPS2))
+    logJacobian = torch.sum(torch.log(1 - action ** 2 + EPS), dim=-1, keepdim=True)
+    return preAction, logJacobian
+
+
 def PlotScheduler(scheduler, n_iter=1000, title="LR Scheduler"):
+    import matplotlib.pyplot as plt
+
     scheduler = copy.deepcopy(scheduler)
     scheduler.verbose = False
     for i in range(n_iter):
@@ -56,11 +71,56 @@ def GetLR(optimizer):
         return p['lr']
 
 
-def SavePickle(obj, path):
-    while os.path.exists(path):
-        path, ext = os.path.splitext(path)
-        path += ('_new' + ext)
+# Named wall-clock timers and counters. When disabled, every timer is the same no-op context manager:
+class PhaseTimer:
+    NULL_CONTEXT = contextlib.nullcontext()
+
+    def __init__(self, isEnabled=False):
+        self.isEnabled = isEnabled
+        self.seconds   = defaultdict(float)
+        self.calls     = defaultdict(int)
+        self.counters  = defaultdict(int)
+
+    def __call__(self, name):
+        return self.Phase(name) if self.isEnabled else self.NULL_CONTEXT
 
+    @contextlib.contextmanager
+    def Phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls  [name] += 1
+
+    def Count(self, name, n=1):
+        if self.isEnabled:
+            self.counters[name] += n
+
+    def Summary(self):
+        lines, total = [], sum(self.seconds.values()) or 1.
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            lines.append(f"| {name :20s} | {seconds :10.3f} s | {self.calls[name] :9d} calls | {seconds / self.calls[name] * 1e3 :10.4f} ms/call | {seconds / total * 100 :6.2f} % |")
+        for name, n in self.counters.items():
+            lines.append(f"| {name :20s} | {n :12d} counts |")
+
+        return "\n".join(lines)
+
+
+# Append "_new" to the file name until it does not exist. The file is created (empty) at once, so concurrent processes
+# (e.g. the runs of a sweep) never get the same path:
+def GetUniquePath(path):
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            path, ext = os.path.splitext(path)
+            path += ('_new' + ext)
+
+
+def SavePickle(obj, path):
+    path = GetUniquePath(path)
     with open(path, "wb") as f:
         pickle.dump(obj, f)
 
@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+from model import ASAF1
+from actor import AsyncCollector
+
+ENV_NAME = "SyntheticInvertedDoublePendulum-v0"
+
+
+def MakeCollector(envName=ENV_NAME, **kwargs):
+    torch.manual_seed(0)
+    agentParams = dict(stateDim=9, actionDim=1, hiddenDim=16, minActVal=-1., maxActVal=1.)
+    return AsyncCollector(envName, ASAF1(**agentParams), agentParams, 1, chunkSize=100, seed=0, pollSeconds=0.1, **kwargs)
+
+
+# Strictly on-policy: the rest of a chunk is dropped by a Fit, so are the chunks the actor collected before it pulled the new weights:
+def test_stale_chunks_are_dropped():
+    collector = MakeCollector(maxStaleness=0)
+    try:
+        states, actions, _ = collector.Step()
+        assert states.shape == (100, 9) and actions.shape == (100, 1) and collector.version == 0
+        assert not collector.OnPolicyUpdated(40)
+        assert collector.numDropped == 40
+
+        numStale = 0
+        while True:
+            states, actions, _ = collector.Step()
+            if len(states) > 0:
+                break
+            numStale += 1
+
+        assert collector.version == 1 and len(states) == 100
+        assert collector.numDropped == 40 + 100 * numStale
+    finally:
+        collector.Close()
+
+
+def test_chunks_within_staleness_are_kept():
+    collector = MakeCollector(maxStaleness=1)
+    try:
+        collector.Step()
+        assert collector.OnPolicyUpdated(40)
+        assert collector.numDropped == 0
+    finally:
+        collector.Close()
+
+
+# An actor that dies (here the env cannot be created) raises in the learner instead of blocking it:
+def test_dead_actor_raises():
+    collector = MakeCollector("NoSuchEnv-v0")
+    with pytest.raises(RuntimeError, match="exited with code 1"):
+        collector.Step()
+    assert all(not process.is_alive() for process in collector.processes)
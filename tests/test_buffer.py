@@ -0,0 +1,45 @@
+import numpy as np
+import torch
+
+from data import AgentBuffer
+
+
+def FillBuffer(buffer, rows, stateDim=3, actionDim=2):
+    for i in range(rows):
+        buffer.Push(np.full(stateDim, i, dtype=np.float32), np.full(actionDim, -i, dtype=np.float32))
+
+
+def test_slices_are_views():
+    buffer = AgentBuffer(8, stateDim=3, actionDim=2)
+    FillBuffer(buffer, 8)
+    states, actions = buffer[:]
+    assert states.data_ptr() == buffer.states.data_ptr() and actions.data_ptr() == buffer.actions.data_ptr()
+    assert buffer[2:5][0].data_ptr() == buffer.states[2].data_ptr()
+
+    # Writes through the numpy arrays are seen by the tensors:
+    buffer.Push(np.full(3, 100, dtype=np.float32), np.zeros(2, dtype=np.float32))
+    assert states[0, 0].item() == 100
+
+
+def test_ring_and_full_state():
+    buffer = AgentBuffer(4)
+    FillBuffer(buffer, 3)
+    assert not buffer.IsFull() and buffer.states.shape == (4, 3)
+    FillBuffer(buffer, 2)
+    assert buffer.IsFull() and buffer.pointer == 1
+    # The second fill wrote 0 to the last row and 1 over the first one:
+    np.testing.assert_array_equal(buffer[:][0][:, 0].numpy(), [1, 1, 2, 0])
+    buffer.Clear()
+    assert not buffer.IsFull()
+
+
+def test_bf16_storage_and_state_dict():
+    buffer = AgentBuffer(4, dtype=torch.bfloat16)
+    FillBuffer(buffer, 4)
+    assert buffer.states.dtype == torch.bfloat16 and buffer.GetMemorySize() == 4 * (3 + 2) * 2
+    np.testing.assert_array_equal(buffer[:][0][:, 0].float().numpy(), [0, 1, 2, 3])
+
+    restored = AgentBuffer(4, dtype=torch.bfloat16)
+    restored.LoadStateDict(buffer.StateDict())
+    assert restored.IsFull() and restored.pointer == buffer.pointer
+    assert torch.equal(restored[:][1], buffer[:][1])
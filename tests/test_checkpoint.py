@@ -0,0 +1,82 @@
+import random
+import torch
+
+from model import ASAF1
+from data import AgentBuffer
+from checkpoint import CheckpointWriter, Snapshot, LoadCheckpoint, GetRandomState, SetRandomState
+
+
+def MakeAgent():
+    return ASAF1(4, 2, 16, -1., 1., scheduler="StepLR", lr=1e-2, schedulerWarmup=3, schedulerParams={"step_size": 2, "gamma": 0.5})
+
+
+def StepScheduler(agent, n):
+    lrs = []
+    for _ in range(n):
+        agent.optimizer.step()
+        agent.scheduler.step()
+        lrs.append(agent.optimizer.param_groups[0]["lr"])
+    return lrs
+
+
+def test_snapshot_leaves_out_after_scheduler():
+    agent = MakeAgent()
+    state = Snapshot(agent.StateDict())
+    assert "after_scheduler" not in state["scheduler"]
+    assert state["scheduler"]["afterScheduler"]["step_size"] == 2
+
+
+def test_resume_lr_after_warmup(tmp_path):
+    agent = MakeAgent()
+    StepScheduler(agent, 5)
+
+    writer = CheckpointWriter()
+    writer.Submit(agent.StateDict(), str(tmp_path / "agent.pth"), isUnique=False)
+    writer.Close()
+
+    resumed = MakeAgent()
+    resumed.Load(str(tmp_path / "agent.pth"), isLoadOptimizer=True)
+    assert resumed.scheduler.after_scheduler.optimizer is resumed.optimizer
+    assert resumed.optimizer.param_groups[0]["lr"] == agent.optimizer.param_groups[0]["lr"]
+
+    expected = StepScheduler(agent, 6)
+    assert StepScheduler(resumed, 6) == expected
+    assert expected[-1] < expected[0]
+
+
+# Rounds of the training loop on random transitions: push into the agent buffer, Fit (window sampler), step the scheduler:
+def RunRounds(agent, agentBuffer, expertStates, expertActions, n):
+    lrs = []
+    for _ in range(n):
+        for _ in range(16):
+            agentBuffer.Push(torch.randn(4).numpy(), (torch.rand(2) * 2 - 1).numpy())
+        agent.Fit(expertStates, expertActions, agentBuffer.states, agentBuffer.actions, 2, 8)
+        lrs.append(agent.UpdateScheduler())
+    return lrs
+
+
+def test_resumed_training_continues_identically(tmp_path):
+    random.seed(0)
+    torch.manual_seed(0)
+    expertStates, expertActions = torch.randn(64, 4), torch.rand(64, 2) * 1.8 - 0.9
+    agent, agentBuffer = MakeAgent(), AgentBuffer(32)
+    RunRounds(agent, agentBuffer, expertStates, expertActions, 4)
+
+    writer = CheckpointWriter()
+    writer.Submit({"agent": agent.StateDict(), "agentBuffer": agentBuffer.StateDict(), "random": GetRandomState()}, str(tmp_path / "state.pth"), isUnique=False)
+    writer.Close()
+    expected = RunRounds(agent, agentBuffer, expertStates, expertActions, 4)
+
+    # Train runs other rounds before resuming in a fresh process:
+    RunRounds(MakeAgent(), AgentBuffer(32), expertStates, expertActions, 1)
+    state = LoadCheckpoint(str(tmp_path / "state.pth"))
+    resumed, resumedBuffer = MakeAgent(), AgentBuffer(32)
+    resumed      .LoadStateDict(state["agent"], isLoadOptimizer=True)
+    resumedBuffer.LoadStateDict(state["agentBuffer"])
+    SetRandomState(state["random"])
+
+    assert RunRounds(resumed, resumedBuffer, expertStates, expertActions, 4) == expected
+    assert resumedBuffer.pointer == agentBuffer.pointer
+    torch.testing.assert_close(resumedBuffer.states, agentBuffer.states, rtol=0, atol=0)
+    for name, param in agent.policy.state_dict().items():
+        torch.testing.assert_close(resumed.policy.state_dict()[name], param, rtol=0, atol=0)
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import torch
+
+import data
+from data import ExpertBuffer, DemoWriter, Preprocess
+from utils import AtanhAction
+
+
+def WriteDemo(path, numData=100, stateDim=5, actionDim=2, seed=0):
+    rng = np.random.default_rng(seed)
+    states, actions = rng.standard_normal((numData, stateDim)).astype(np.float32), rng.uniform(-2, 2, (numData, actionDim)).astype(np.float32)
+    with DemoWriter(path) as writer:
+        writer.Write(states, actions)
+    return states, actions
+
+
+def FailRead(*args):
+    raise AssertionError("The demo is read on a cache hit !")
+
+
+def test_preprocess_cache_is_keyed_by_file_stamp(tmp_path, monkeypatch):
+    demoPath = str(tmp_path / "demo")
+    WriteDemo(demoPath)
+    first = Preprocess(demoPath, -2., 2., squashing="tanh")
+
+    # A cache hit reads nothing of the demo:
+    monkeypatch.setattr(data, "LoadDemo", FailRead)
+    second = Preprocess(demoPath, -2., 2., squashing="tanh")
+    torch.testing.assert_close(second["actions"], first["actions"])
+    monkeypatch.undo()
+
+    # A rewritten demo is preprocessed again:
+    stat = os.stat(os.path.join(demoPath, data.DEMO_ACTION_FILE))
+    _, actions = WriteDemo(demoPath, seed=1)
+    os.utime(os.path.join(demoPath, data.DEMO_ACTION_FILE), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    third = Preprocess(demoPath, -2., 2., squashing="tanh")
+    torch.testing.assert_close(third["actions"], AtanhAction(torch.from_numpy(actions) / 2)[0])
+
+
+def test_mapped_actions_stay_fp32_with_bf16_storage(tmp_path):
+    demoPath = str(tmp_path / "demo")
+    WriteDemo(demoPath)
+    buffer = ExpertBuffer(demoPath, dtype=torch.bfloat16, minActVal=-2., maxActVal=2., squashing="tanh")
+    states, actions = buffer[:]
+    assert states.dtype == torch.bfloat16
+    assert actions.dtype == torch.float32 and buffer.logJacobians.dtype == torch.float32
+    torch.testing.assert_close(actions, Preprocess(demoPath, -2., 2., squashing="tanh")["actions"])
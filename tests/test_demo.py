@@ -0,0 +1,43 @@
+import numpy as np
+import torch
+
+from model import ASAF1
+from data import ExpertBuffer, LoadDemo, ReadDemoHeader
+from demo import GenerateDemo, RunEpisodes
+from test import RolloutSeed, TestSeed
+
+ENV_NAME = "SyntheticInvertedDoublePendulum-v0"
+
+
+def SaveAgent(path, squashing=None):
+    torch.manual_seed(0)
+    return ASAF1(9, 1, 16, -1., 1., squashing=squashing).Save(path)
+
+
+def test_rollout_matches_test_seed(tmp_path):
+    path = SaveAgent(str(tmp_path / "agent.pth"), "tanh")
+    job  = (path, ENV_NAME, 16, 3, "auto", "tanh")
+    reward, states, actions = RolloutSeed(job)
+    assert reward == TestSeed(job)
+    assert states.shape == (1000, 9) and actions.shape == (1000, 1) and states.dtype == np.float32
+    assert np.abs(actions).max() <= 1.
+
+
+def test_generated_demo_round_trip(tmp_path):
+    path     = SaveAgent(str(tmp_path / "agent.pth"))
+    demoPath = str(tmp_path / "demo")
+    result   = GenerateDemo(path, ENV_NAME, demoPath, 1500, 16, seed=5)
+    assert result["Transition"] == 1500 and result["Episode"] == 2
+    assert ReadDemoHeader(demoPath)["numData"] == 1500
+
+    episodes = list(RunEpisodes([(path, ENV_NAME, 16, seed, "auto", None) for seed in (5, 6)]))
+    states   = np.concatenate([episode[1] for episode in episodes])[:1500]
+    actions  = np.concatenate([episode[2] for episode in episodes])[:1500]
+    demoStates, demoActions = LoadDemo(demoPath)
+    np.testing.assert_array_equal(demoStates , states )
+    np.testing.assert_array_equal(demoActions, actions)
+
+    # The memory-mapped tail, as ExpertBuffer reads it:
+    demoStates, _ = LoadDemo(demoPath, 100)
+    assert isinstance(demoStates, np.memmap) or isinstance(demoStates.base, np.memmap)
+    np.testing.assert_array_equal(ExpertBuffer(demoPath, 100)[:][0].numpy(), states[-100:])
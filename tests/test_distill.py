@@ -0,0 +1,25 @@
+import numpy as np
+import torch
+
+from model import ASAF1
+from data import DemoWriter
+from distill import DistillCheckpoint
+from test import TestSeed
+
+ENV_NAME = "SyntheticInvertedDoublePendulum-v0"
+
+
+def test_distill_squashed_checkpoint(tmp_path):
+    torch.manual_seed(0)
+    modelPath = ASAF1(9, 1, 32, -1., 1., squashing="tanh").Save(str(tmp_path / f"ASAF1_32_{ENV_NAME}.pth"))
+    demoPath  = str(tmp_path / "demo")
+    with DemoWriter(demoPath) as writer:
+        writer.Write(np.random.randn(500, 9).astype(np.float32), np.random.uniform(-1, 1, (500, 1)).astype(np.float32))
+
+    results = DistillCheckpoint(modelPath, ENV_NAME, demoPath, hiddenDims=(8, ), squashing="tanh", numExpertStates=500, numRolloutStates=500,
+                                numSteps=300, testNumSeed=1, modelSaveFolder=str(tmp_path))
+    teacher, student = results
+    assert teacher["HiddenDim"] == 32 and student["HiddenDim"] == 8
+    assert teacher["AvgReward"] == TestSeed((modelPath, ENV_NAME, 32, 0, "auto", "tanh"))
+    assert student["AvgReward"] == TestSeed((student["ModelPath"], ENV_NAME, 8, 0, "auto", "tanh"))
+    assert student["KL"] < 0.1
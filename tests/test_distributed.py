@@ -0,0 +1,47 @@
+import random
+import pytest
+import torch
+
+from model import ASAF1
+from distributed import DataParallelFit
+from synthetic import SYNTHETIC_ENVS
+
+
+# Two Fits (the second one reuses the shared expert tensors) with the same seeds, the scheduler is stepped in between:
+def RunFits(numProcs, expertState, expertAction, agentState, agentAction):
+    dims   = SYNTHETIC_ENVS["SyntheticInvertedDoublePendulum-v0"]
+    params = dict(stateDim=dims["stateDim"], actionDim=dims["actionDim"], hiddenDim=32, minActVal=-1., maxActVal=1., gradClip=1.,
+                  scheduler="StepLR", schedulerParams={"step_size": 1, "gamma": 0.5})
+    random.seed(0)
+    torch.manual_seed(0)
+    agent  = ASAF1(**params)
+    fitter = DataParallelFit(agent, params, numProcs) if numProcs > 1 else agent
+    try:
+        losses = []
+        for _ in range(2):
+            losses.append(fitter.Fit(expertState, expertAction, agentState, agentAction, 2, 256))
+            agent.UpdateScheduler()
+    finally:
+        if numProcs > 1:
+            fitter.Close()
+
+    return agent, losses
+
+
+# With 416 agent rows the last minibatch has 160 agent rows against a 256-row expert window, so the processes get different shares
+# of the expert and of the agent rows (with 3 processes even in the full batches):
+@pytest.mark.parametrize("numProcs, nAgent", [(2, 256), (3, 416)])
+def test_data_parallel_fit_matches_fit(numProcs, nAgent):
+    dims = SYNTHETIC_ENVS["SyntheticInvertedDoublePendulum-v0"]
+    generator = torch.Generator().manual_seed(0)
+    expertState, expertAction = torch.randn(512, dims["stateDim"], generator=generator), torch.rand(512, dims["actionDim"], generator=generator) * 2 - 1
+    agentState , agentAction  = torch.randn(nAgent, dims["stateDim"], generator=generator), torch.rand(nAgent, dims["actionDim"], generator=generator) * 2 - 1
+
+    agent  , losses   = RunFits(1, expertState, expertAction, agentState, agentAction)
+    dpAgent, dpLosses = RunFits(numProcs, expertState, expertAction, agentState, agentAction)
+
+    for (expertLoss, agentLoss), (dpExpertLoss, dpAgentLoss) in zip(losses, dpLosses):
+        assert abs(expertLoss - dpExpertLoss) < 1e-5 and abs(agentLoss - dpAgentLoss) < 1e-5
+    assert dpAgent.optimizer.param_groups[0]["lr"] == agent.optimizer.param_groups[0]["lr"]
+    for name, param in agent.policy.state_dict().items():
+        torch.testing.assert_close(dpAgent.policy.state_dict()[name], param, rtol=1e-5, atol=1e-5)
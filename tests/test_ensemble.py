@@ -0,0 +1,23 @@
+import numpy as np
+import torch
+
+from ensemble import ASAF1Ensemble
+
+
+def test_ensemble_members_match_the_batched_model():
+    torch.manual_seed(0)
+    ensemble = ASAF1Ensemble(3, 5, 2, 16, -2., 2., squashing="tanh")
+    for name in ("actor", "precision", "timer", "gradHook"):
+        assert hasattr(ensemble, name)
+
+    expertState, expertAction = torch.randn(64, 5), torch.rand(64, 2) * 4 - 2
+    agentState , agentAction  = torch.randn(3, 32, 5), torch.rand(3, 32, 2) * 4 - 2
+    expertLoss, agentLoss = ensemble.Fit(expertState, expertAction, agentState, agentAction, 2, 16)
+    assert expertLoss.shape == (3, ) and np.isfinite(agentLoss).all()
+
+    state   = np.random.randn(3, 5).astype(np.float32)
+    actions = ensemble.Act(state)
+    for i in range(3):
+        member = ensemble.Member(i)
+        member.ToEvalMode()
+        np.testing.assert_allclose(member.Act(state[i]), actions[i], rtol=1e-5, atol=1e-6)
@@ -0,0 +1,49 @@
+import math
+import random
+
+import pytest
+
+from evaluation import GetT, GetTCdf, GetLookSizes, GetConfidenceBound, SuccessiveElimination, SequentialThresholdTest
+
+
+@pytest.mark.parametrize("df, expected", [(1, 12.7062), (2, 4.3027), (4, 2.7764), (9, 2.2622), (30, 2.0423)])
+def test_t_quantile(df, expected):
+    assert GetT(0.95, df) == pytest.approx(expected, abs=1e-3)
+    assert GetTCdf(expected, df) == pytest.approx(0.975, abs=1e-4)
+    assert GetTCdf(-expected, df) == pytest.approx(0.025, abs=1e-4)
+
+
+def test_look_sizes():
+    assert GetLookSizes(50, 5, 5) == list(range(5, 51, 5))
+    assert GetLookSizes(5, 1, 3) == [3, 4, 5]
+    assert GetLookSizes(12, 5, 5, 8) == [8, 12]
+
+
+def test_confidence_bound_small_sample():
+    lower, upper = GetConfidenceBound([0., 1., 2.], 0.95)
+    assert (upper - lower) / 2 == pytest.approx(4.3027 / math.sqrt(3), abs=1e-3)
+    assert GetConfidenceBound([1.], 0.95) == (-float("inf"), float("inf"))
+
+
+def test_elimination_without_candidates():
+    result = SuccessiveElimination([], lambda jobs: [0. for _ in jobs])
+    assert result["Best"] is None and result["BestReward"] == -float("inf") and result["Episodes"] == 0
+
+
+def test_elimination_drops_worse_candidates():
+    rng   = random.Random(0)
+    means = {"a": 0., "b": 10., "c": 100.}
+    result = SuccessiveElimination(list(means), lambda jobs: [means[c] + rng.gauss(0, 1) for c, _ in jobs], maxSeeds=50, roundSeeds=5)
+    assert result["Best"] == "c"
+    assert result["Remaining"] == ["c"]
+    assert result["SavedEpisodes"] > 0 and result["Confidence"] > 0.99
+
+
+def test_threshold_test_stops_early():
+    rng    = random.Random(0)
+    result = SequentialThresholdTest(lambda seeds: [1000 + rng.gauss(0, 1) for _ in seeds], 500, maxEpisodes=50)
+    assert result["IsAbove"] and result["IsSettled"]
+    assert result["Episodes"] < 50
+
+    result = SequentialThresholdTest(lambda seeds: [500 + rng.gauss(0, 100) for _ in seeds], 500, maxEpisodes=10)
+    assert result["Episodes"] == 10
@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import pytest
+
+import torch
+
+from model import ASAF1
+from benchmark import BenchmarkExport
+
+
+def test_benchmark_export_leaves_no_files(tmp_path, monkeypatch):
+    torch.manual_seed(0)
+    modelPath = ASAF1(5, 2, 16, -2., 2., squashing="tanh").Save(str(tmp_path / "agent.pth"))
+    workPath  = tmp_path / "cwd"
+    workPath.mkdir()
+    monkeypatch.chdir(workPath)
+
+    results = BenchmarkExport(modelPath, -2., 2., "tanh", batchSizes=(1, 8), nRepeat=2)
+    assert {result["Path"] for result in results} >= {"ASAF1.Act", "torchscript"}
+    assert os.listdir(workPath) == []
+
+    exportFolder = tmp_path / "export"
+    exportFolder.mkdir()
+    BenchmarkExport(modelPath, -2., 2., "tanh", batchSizes=(1, ), nRepeat=2, exportFolder=str(exportFolder))
+    assert "benchmark_policy.pt" in os.listdir(exportFolder)
+
+
+def MakeInt8Agent(squashing, seed=0):
+    torch.manual_seed(seed)
+    return ASAF1(9, 2, 64, -2., 2., squashing=squashing, actBackend="int8")
+
+
+# The int8 backend stays close to the float policy, and is quantized again after a Fit or a LoadStateDict:
+@pytest.mark.parametrize("squashing", [None, "tanh"])
+def test_int8_act_tracks_the_float_policy(squashing):
+    agent  = MakeInt8Agent(squashing)
+    states = np.random.RandomState(0).randn(32, 9).astype(np.float32)
+    FloatAct = lambda: agent.RecoverAction(np.stack([agent.policy.OneStepAction(state) for state in states]))
+    before   = agent.Act(states)
+    assert agent.actor.quantized is not None
+    np.testing.assert_allclose(before, FloatAct(), atol=2e-3)
+    np.testing.assert_allclose(agent.Act(states[0]), FloatAct()[0], atol=2e-3)
+
+    expertState, expertAction = torch.randn(256, 9), torch.rand(256, 2) * 4 - 2
+    agentState , agentAction  = torch.randn(256, 9), torch.rand(256, 2) * 4 - 2
+    agent.Fit(expertState, expertAction, agentState, agentAction, 2, 64)
+    assert agent.actor.quantized is None
+    afterFit = agent.Act(states)
+    assert np.abs(afterFit - before).max() > 1e-2
+    np.testing.assert_allclose(afterFit, FloatAct(), atol=2e-3)
+
+    agent.LoadStateDict(MakeInt8Agent(squashing, seed=1).StateDict())
+    assert agent.actor.quantized is None
+    afterLoad = agent.Act(states)
+    assert np.abs(afterLoad - afterFit).max() > 1e-2
+    np.testing.assert_allclose(afterLoad, FloatAct(), atol=2e-3)
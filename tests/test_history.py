@@ -0,0 +1,62 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from history import HistoryWriter, HistoryReader, LoadHistory, ConvertHistory
+
+COLUMNS = {"Transition": "int64", "Reward": "float64"}
+
+
+def WriteRows(path, rows, chunkSize=4):
+    with HistoryWriter(path, COLUMNS, chunkSize) as writer:
+        for transition, reward in rows:
+            writer.Append(Transition=transition, Reward=reward)
+
+
+def test_round_trip_with_column_and_row_ranges(tmp_path):
+    path = str(tmp_path / "run.hist")
+    rows = [(i, i * 0.5) for i in range(10)]
+    WriteRows(path, rows)
+
+    reader = HistoryReader(path)
+    assert len(reader) == 10 and len(reader.chunks) == 3
+    history = reader.Read()
+    np.testing.assert_array_equal(history["Transition"], np.arange(10))
+    assert history["Transition"].dtype == np.int64
+    np.testing.assert_array_equal(reader.Read(["Reward"], 3, 7)["Reward"], np.arange(3, 7) * 0.5)
+    assert list(reader.Read(["Reward"], 3, 7)) == ["Reward"]
+
+
+def test_continue_cuts_torn_tail(tmp_path):
+    path = str(tmp_path / "run.hist")
+    WriteRows(path, [(i, float(i)) for i in range(8)])
+    completeSize = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b"\x04\x00\x00\x00" + b"\x00" * 20)
+
+    assert len(HistoryReader(path)) == 8
+    WriteRows(path, [(i, float(i)) for i in range(8, 12)])
+    assert os.path.getsize(path) > completeSize
+    np.testing.assert_array_equal(LoadHistory(path)["Transition"], np.arange(12))
+
+
+def test_continue_checks_columns_and_dtypes(tmp_path):
+    path = str(tmp_path / "run.hist")
+    WriteRows(path, [(0, 0.)])
+    with pytest.raises(ValueError):
+        HistoryWriter(path, {"Transition": "int64", "Reward": "float32"})
+    with pytest.raises(ValueError):
+        HistoryWriter(path, {"Reward": "float64", "Transition": "int64"})
+
+
+def test_legacy_pickle(tmp_path):
+    pklPath = str(tmp_path / "run.pkl")
+    with open(pklPath, "wb") as f:
+        pickle.dump({"Transition": [1, 2, 3], "Reward": [0.5, 1.5, 2.5]}, f)
+
+    histPath = ConvertHistory(pklPath, str(tmp_path / "run.hist"))
+    for path in (pklPath, histPath):
+        history = LoadHistory(path, ["Reward"], 1)
+        np.testing.assert_array_equal(history["Reward"], [1.5, 2.5])
@@ -0,0 +1,77 @@
+import pytest
+import torch
+from torch.distributions import Normal
+
+from model import ASAF1, GaussianLogProb, LogAddExp, EPS
+from benchmark import ReferenceLogProb, ReferenceLoss
+
+
+def GetInputs(batchSize=16, actionDim=4, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    mean   = torch.randn(batchSize, actionDim, dtype=torch.float64, generator=generator, requires_grad=True)
+    logStd = (torch.rand(batchSize, actionDim, dtype=torch.float64, generator=generator) - 0.5).requires_grad_()
+    action = torch.randn(batchSize, actionDim, dtype=torch.float64, generator=generator)
+    return mean, logStd, action
+
+
+def test_gaussian_logprob_gradcheck():
+    assert torch.autograd.gradcheck(GaussianLogProb.apply, GetInputs())
+
+
+def test_gaussian_logprob_matches_reference():
+    mean, logStd, action = GetInputs()
+    logProb = GaussianLogProb.apply(mean, logStd, action)
+    grads   = torch.autograd.grad(logProb.sum(), (mean, logStd))
+
+    refLogProb = Normal(mean, logStd.exp()).log_prob(action).sum(-1, keepdim=True)
+    refGrads   = torch.autograd.grad(refLogProb.sum(), (mean, logStd))
+
+    torch.testing.assert_close(logProb, refLogProb, rtol=1e-12, atol=1e-12)
+    for grad, refGrad in zip(grads, refGrads):
+        torch.testing.assert_close(grad, refGrad, rtol=1e-12, atol=1e-12)
+
+
+def test_logaddexp_matches_reference():
+    generator = torch.Generator().manual_seed(0)
+    a = (torch.randn(64, 1, dtype=torch.float64, generator=generator) * 5).requires_grad_()
+    b = (torch.randn(64, 1, dtype=torch.float64, generator=generator) * 5).requires_grad_()
+
+    value    = LogAddExp(a, b)
+    grads    = torch.autograd.grad(value.sum(), (a, b))
+    refValue = torch.log(a.exp() + b.exp() + EPS)
+    refGrads = torch.autograd.grad(refValue.sum(), (a, b))
+
+    torch.testing.assert_close(value, refValue, rtol=1e-12, atol=1e-12)
+    for grad, refGrad in zip(grads, refGrads):
+        torch.testing.assert_close(grad, refGrad, rtol=1e-12, atol=1e-12)
+    assert torch.autograd.gradcheck(LogAddExp, (a, b))
+
+    # No overflow where the reference exp does:
+    assert torch.isfinite(LogAddExp(torch.tensor([1000.]), torch.tensor([999.]))).all()
+
+
+# GetLogProb and the ASAF loss of ASAF1.UpdatePolicy against the torch.distributions reference (fp32):
+@pytest.mark.parametrize("squashing", [None, "tanh"])
+def test_policy_loss_matches_reference(squashing):
+    torch.manual_seed(0)
+    agent = ASAF1(6, 3, 32, -1., 1., squashing=squashing)
+    expertState, expertAction = torch.randn(128, 6), torch.rand(128, 3) * 1.998 - 0.999
+    agentState , agentAction  = torch.randn(128, 6), torch.rand(128, 3) * 1.998 - 0.999
+    expertOldProb, agentOldProb = torch.randn(128, 1) * 5, torch.randn(128, 1) * 5
+
+    results = []
+    for GetLogProb in (agent.policy.GetLogProb, lambda s, a: ReferenceLogProb(agent.policy, s, a)):
+        agent.policy.zero_grad()
+        expertLogProb, agentLogProb = GetLogProb(expertState, expertAction), GetLogProb(agentState, agentAction)
+        if len(results) == 0:
+            loss = -(expertLogProb - LogAddExp(expertLogProb, expertOldProb)).mean() - (agentOldProb - LogAddExp(agentLogProb, agentOldProb)).mean()
+        else:
+            loss = ReferenceLoss(expertLogProb, expertOldProb, agentLogProb, agentOldProb)
+        loss.backward()
+        results.append((expertLogProb.detach(), loss.detach(), [param.grad.clone() for param in agent.policy.parameters()]))
+
+    (logProb, loss, grads), (refLogProb, refLoss, refGrads) = results
+    torch.testing.assert_close(logProb, refLogProb, rtol=1e-4, atol=1e-4)
+    torch.testing.assert_close(loss, refLoss, rtol=1e-5, atol=1e-5)
+    for grad, refGrad in zip(grads, refGrads):
+        torch.testing.assert_close(grad, refGrad, rtol=1e-3, atol=1e-5)
@@ -0,0 +1,105 @@
+import random
+import numpy as np
+import pytest
+import torch
+
+from model import ASAF1
+
+
+def MakeAgent(squashing=None, **kwargs):
+    torch.manual_seed(0)
+    return ASAF1(6, 3, 32, -2., 2., squashing=squashing, **kwargs)
+
+
+# The legacy path of Act: OneStepAction of every single state, then RecoverAction:
+def LegacyAct(agent, states):
+    return np.stack([agent.RecoverAction(agent.policy.OneStepAction(state)) for state in states])
+
+
+@pytest.mark.parametrize("squashing", [None, "tanh"])
+@pytest.mark.parametrize("backend", ["numpy", "torch"])
+def test_act_matches_legacy_path(squashing, backend):
+    agent  = MakeAgent(squashing, actBackend=backend)
+    states = np.random.RandomState(0).randn(5, 6).astype(np.float32)
+    np.testing.assert_allclose(agent.Act(states[0]), LegacyAct(agent, states[:1])[0], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(agent.Act(states), LegacyAct(agent, states), rtol=1e-5, atol=1e-6)
+
+    # A larger batch reallocates the buffers, the returned actions are not overwritten by the next call:
+    actions = agent.Act(np.repeat(states, 4, axis=0))
+    agent.Act(states[::-1].copy())
+    np.testing.assert_allclose(actions, LegacyAct(agent, np.repeat(states, 4, axis=0)), rtol=1e-5, atol=1e-6)
+
+
+# The numpy backend reads views of the parameters, an optimizer step must be seen without a Refresh:
+def test_numpy_views_track_optimizer_steps():
+    agent  = MakeAgent(actBackend="numpy")
+    states = np.random.RandomState(0).randn(8, 6).astype(np.float32)
+    before = agent.Act(states)
+
+    expertState, expertAction = torch.randn(64, 6), torch.rand(64, 3) * 4 - 2
+    agentState , agentAction  = torch.randn(64, 6), torch.rand(64, 3) * 4 - 2
+    agent.UpdatePolicy(expertState, agent.MapAction(expertAction), torch.zeros(64, 1), agentState, agent.MapAction(agentAction), torch.zeros(64, 1))
+
+    after = agent.Act(states)
+    assert not np.allclose(after, before)
+    np.testing.assert_allclose(after, LegacyAct(agent, states), rtol=1e-5, atol=1e-6)
+
+
+# The fused update (one forward for both batches) against separate expert / agent forwards:
+@pytest.mark.parametrize("squashing", [None, "tanh"])
+def test_fused_update_matches_separate(squashing):
+    generator = torch.Generator().manual_seed(1)
+    expertState, expertAction = torch.randn(64, 6, generator=generator), torch.rand(64, 3, generator=generator) * 1.998 - 0.999
+    agentState , agentAction  = torch.randn(48, 6, generator=generator), torch.rand(48, 3, generator=generator) * 1.998 - 0.999
+    expertOldProb, agentOldProb = torch.randn(64, 1, generator=generator), torch.randn(48, 1, generator=generator)
+
+    results = []
+    for isFusedUpdate in (True, False):
+        agent  = MakeAgent(squashing, isFusedUpdate=isFusedUpdate)
+        losses = agent.UpdatePolicy(expertState, expertAction, expertOldProb, agentState, agentAction, agentOldProb)
+        results.append((losses, [param.grad.clone() for param in agent.policy.parameters()], [param.detach().clone() for param in agent.policy.parameters()]))
+
+    (losses, grads, params), (refLosses, refGrads, refParams) = results
+    np.testing.assert_allclose(losses, refLosses, rtol=1e-6, atol=1e-6)
+    for value, refValue in zip(grads + params, refGrads + refParams):
+        torch.testing.assert_close(value, refValue, rtol=1e-5, atol=1e-6)
+
+
+# πG is only computed on the expert rows the schedule uses, Fit gives the same result as with πG of every expert row:
+@pytest.mark.parametrize("sampling", ["window", "random"])
+def test_init_prob_only_on_used_expert_rows(sampling):
+    generator = torch.Generator().manual_seed(2)
+    expertState, expertAction = torch.randn(1000, 6, generator=generator), torch.rand(1000, 3, generator=generator) * 4 - 2
+    agentState , agentAction  = torch.randn(200, 6, generator=generator), torch.rand(200, 3, generator=generator) * 4 - 2
+
+    agent = MakeAgent(sampling=sampling)
+    random.seed(0)
+    torch.manual_seed(3)
+    schedule, mappedExpertAction, _, _, expertOldProb, _ = agent.PrepareFit(expertState, expertAction, agentState, agentAction, 2, 64)
+    used = torch.zeros(1000, dtype=torch.bool)
+    for batches in schedule:
+        for index, _ in batches:
+            used[index] = True
+
+    fullOldProb, _ = agent.GetInitProb(expertState, mappedExpertAction, agentState, agent.MapAction(agentAction), 64)
+    assert used.sum() < 1000
+    assert (expertOldProb[~used] == 0).all()
+    torch.testing.assert_close(expertOldProb[used], fullOldProb[used])
+
+    # Fit against the same schedule with πG of every expert row:
+    random.seed(0)
+    torch.manual_seed(3)
+    losses = agent.Fit(expertState, expertAction, agentState, agentAction, 2, 64)
+    refAgent = MakeAgent(sampling=sampling)
+    refAgentAction = refAgent.MapAction(agentAction)
+    expertOldProb, agentOldProb = refAgent.GetInitProb(expertState, mappedExpertAction, agentState, refAgentAction, 64)
+    expertLosses, agentLosses = [], []
+    for batches in schedule:
+        for iE, iA in batches:
+            expertLoss, agentLoss = refAgent.UpdatePolicy(expertState[iE], mappedExpertAction[iE], expertOldProb[iE], agentState[iA], refAgentAction[iA], agentOldProb[iA])
+            expertLosses.append(expertLoss)
+            agentLosses .append(agentLoss )
+
+    np.testing.assert_allclose(losses, (np.mean(expertLosses), np.mean(agentLosses)), rtol=1e-6)
+    for param, refParam in zip(agent.policy.parameters(), refAgent.policy.parameters()):
+        torch.testing.assert_close(param, refParam)
@@ -0,0 +1,58 @@
+import os
+import json
+
+import torch
+
+from model import ASAF1
+from rollout import MakeEnv
+from registry import CheckpointRegistry, GetRewardKey
+from test import Test, LoadTestAgent, TestGenerally, TestAll
+from utils import SeedEverything
+
+ENV_NAME = "SyntheticInvertedDoublePendulum-v0"
+
+
+def SaveAgent(path, hiddenDim=16, squashing=None, seed=0):
+    torch.manual_seed(seed)
+    agent = ASAF1(9, 1, hiddenDim, -1., 1., squashing=squashing)
+    return agent.Save(path)
+
+
+def test_only_missing_rewards_are_run(tmp_path):
+    path   = SaveAgent(str(tmp_path / "a.pth"))
+    copy   = str(tmp_path / "b.pth")
+    with open(path, "rb") as src, open(copy, "wb") as dst:
+        dst.write(src.read())
+
+    calls = []
+    Run   = lambda jobs: calls.append(list(jobs)) or [float(seed) for _, seed in jobs]
+    registry = CheckpointRegistry(str(tmp_path / "registry.json"))
+    assert registry.Evaluate([(path, 0), (path, 1)], ENV_NAME, 16, Run) == [0., 1.]
+    assert registry.Evaluate([(copy, 1), (copy, 2)], ENV_NAME, 16, Run) == [1., 2.]
+    assert calls == [[(path, 0), (path, 1)], [(copy, 2)]]
+
+    # Squashed rewards are kept apart and the registry is persisted:
+    registry.Evaluate([(path, 0)], ENV_NAME, 16, Run, squashing="tanh")
+    assert len(calls) == 3
+    reloaded = CheckpointRegistry(str(tmp_path / "registry.json"))
+    assert reloaded.Best(ENV_NAME, 16, 3) == (os.path.abspath(path), 1.)
+    assert reloaded.Best(ENV_NAME, 16, 1, squashing="tanh") == (os.path.abspath(path), 0.)
+
+
+def test_squashing_reaches_the_test_agent(tmp_path):
+    path = SaveAgent(str(tmp_path / f"ASAF1_16_{ENV_NAME}_R=0.pth"), squashing="tanh")
+    env  = MakeEnv(ENV_NAME)
+    expected = []
+    for seed in range(2):
+        SeedEverything(seed, env)
+        expected.append(Test(LoadTestAgent(path, env, 16, squashing="tanh"), env, 1)[0])
+
+    registryPath = str(tmp_path / "registry.json")
+    _, rewards = TestGenerally(path, ENV_NAME, 2, 16, registryPath=registryPath, squashing="tanh")
+    assert rewards == expected
+    with open(registryPath) as f:
+        checkpoints = json.load(f)["checkpoints"]
+    assert list(next(iter(checkpoints.values()))["rewards"]) == [GetRewardKey(ENV_NAME, "tanh")]
+
+    bestPath, bestReward = TestAll(ENV_NAME, 16, 2, modelFolder=str(tmp_path), registryPath=registryPath, squashing="tanh")
+    assert bestPath == path and bestReward == sum(expected) / 2
@@ -0,0 +1,53 @@
+import random
+import pytest
+import torch
+
+from sampler import GetSampler, WindowSampler, RandomSampler
+
+
+def GetUsedRows(schedule, n, side):
+    used = torch.zeros(n, dtype=torch.bool)
+    for batches in schedule:
+        for batch in batches:
+            used[batch[side]] = True
+    return used
+
+
+def test_window_sampler_keeps_agent_order():
+    random.seed(0)
+    sampler  = WindowSampler(1000, 300, 64)
+    schedule = sampler.Schedule(3)
+    for batches in schedule:
+        assert [(iA.start, iA.stop) for _, iA in batches] == [(0, 64), (64, 128), (128, 192), (192, 256), (256, 300)]
+        assert all(0 <= iE.start < iE.stop <= 1000 for iE, _ in batches)
+
+    rows = sampler.ExpertRows(schedule)
+    assert len(rows) == len(set((index.start, index.stop) for index in rows))
+    assert torch.equal(GetUsedRows([[(index, None) for index in rows]], 1000, 0), GetUsedRows(schedule, 1000, 0))
+
+
+@pytest.mark.parametrize("nExpert", [1000, 100])
+def test_random_sampler_visits_every_agent_row_once(nExpert):
+    torch.manual_seed(0)
+    sampler  = RandomSampler(nExpert, 300, 64)
+    schedule = sampler.Schedule(3)
+    for batches in schedule:
+        agentIndex = torch.cat([iA for _, iA in batches])
+        assert torch.equal(agentIndex.sort().values, torch.arange(300))
+        assert [iA.numel() for _, iA in batches] == [64, 64, 64, 64, 44]
+        assert all(iE.numel() == iA.numel() and iE.max() < nExpert for iE, iA in batches)
+
+    # Every used expert row is in ExpertRows once, in batches of at most batchSize rows:
+    rows = sampler.ExpertRows(schedule)
+    assert all(index.numel() <= 64 for index in rows)
+    expertRows = torch.cat(rows)
+    assert expertRows.unique().numel() == expertRows.numel()
+    assert torch.equal(GetUsedRows([[(expertRows, None)]], nExpert, 0), GetUsedRows(schedule, nExpert, 0))
+
+
+def test_random_sampler_device():
+    schedule = GetSampler("random", 100, 50, 16, torch.device("meta")).Schedule(1)
+    assert all(iE.device.type == "meta" and iA.device.type == "meta" for iE, iA in schedule[0])
+
+    with pytest.raises(ValueError):
+        GetSampler("sorted", 100, 50, 16)
@@ -0,0 +1,47 @@
+import os
+
+from sweep import ExpandGrid, Sweep, LoadIndex
+from history import LoadHistory, HistoryWriter
+from utils import GetUniquePath
+from test_train import GetConfig
+
+
+def test_expand_grid():
+    configs = ExpandGrid({"hiddenDim": [16, 32], "lr": [1e-3]}, [0, 1])
+    assert configs == [
+        {"hiddenDim": 16, "lr": 1e-3, "seed": 0}, {"hiddenDim": 16, "lr": 1e-3, "seed": 1},
+        {"hiddenDim": 32, "lr": 1e-3, "seed": 0}, {"hiddenDim": 32, "lr": 1e-3, "seed": 1}
+    ]
+
+
+# A path is reserved as soon as it is returned, so two runs asking for the same name before writing get different files:
+def test_unique_paths_are_reserved(tmp_path):
+    path = str(tmp_path / "run.hist")
+    assert GetUniquePath(path) == path
+    assert GetUniquePath(path) == str(tmp_path / "run_new.hist")
+
+    with HistoryWriter(path, {"Transition": "int64"}) as writer:
+        writer.Append(Transition=1)
+    assert list(LoadHistory(path)["Transition"]) == [1]
+
+
+# Two concurrent runs with the same hiddenDim / env / seed get their own history and training state files:
+def test_sweep_runs_do_not_share_files(tmp_path, monkeypatch):
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        monkeypatch.setenv(name, "1")
+
+    base    = {key: value for key, value in GetConfig(tmp_path, maxTrans=2000, checkpointInterval=1000).items() if key != "seed"}
+    grid    = {"endTrainReward": [1e8, 2e8]}
+    configs = [{**base, **config} for config in ExpandGrid(grid, [0])]
+    index   = Sweep(configs, str(tmp_path / "sweep.json"), str(tmp_path / "logs"), numWorkers=2)
+
+    assert len(index) == 2 and all("Error" not in result for result in index)
+    assert LoadIndex(str(tmp_path / "sweep.json")) == index
+    assert len({result["HistoryPath"] for result in index}) == 2
+    for result in index:
+        assert list(LoadHistory(result["HistoryPath"])["Transition"]) == [1000, 2000]
+    assert len(list((tmp_path / "model").glob("*.state"))) == 2
+    assert sorted(os.listdir(tmp_path / "logs")) == ["endTrainReward=100000000.0.log", "endTrainReward=200000000.0.log"]
+
+    # Finished configurations are skipped:
+    assert Sweep(configs, str(tmp_path / "sweep.json"), str(tmp_path / "logs"), numWorkers=2) == index
@@ -0,0 +1,23 @@
+import torch
+
+from model import ASAF1
+from test import TestGenerally, GetEvaluate
+
+ENV_NAME = "SyntheticInvertedDoublePendulum-v0"
+
+
+def SaveAgent(path, seed=0):
+    torch.manual_seed(seed)
+    return ASAF1(9, 1, 16, -1., 1.).Save(path)
+
+
+# The process pool gives the per-seed rewards of the serial loop, in the order of the seeds / jobs:
+def test_pool_matches_serial_rewards(tmp_path):
+    paths = [SaveAgent(str(tmp_path / f"{i}.pth"), i) for i in range(2)]
+    _, serialRewards = TestGenerally(paths[0], ENV_NAME, 4, 16)
+    _, poolRewards   = TestGenerally(paths[0], ENV_NAME, 4, 16, numWorkers=2)
+    assert poolRewards == serialRewards
+    assert len(set(serialRewards)) == 4
+
+    jobs = [(path, seed) for seed in range(2) for path in paths]
+    assert GetEvaluate(ENV_NAME, 16, 2)(jobs) == GetEvaluate(ENV_NAME, 16, 1)(jobs)
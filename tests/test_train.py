@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from train import Train, GetDefaultConfig
+from history import LoadHistory
+from checkpoint import LoadCheckpoint
+from synthetic import GenerateSyntheticDemo
+from rollout import SerialVecEnv, MakeEnv, Collector
+from model import ASAF1
+
+
+ENV_NAME = "SyntheticInvertedDoublePendulum-v0"
+
+
+# Small Train configuration on the synthetic env (1000-step episodes, no test episodes):
+def GetConfig(tmp_path, **kwargs):
+    demoPath = str(tmp_path / "demo")
+    if not (tmp_path / "demo").exists():
+        GenerateSyntheticDemo(ENV_NAME, demoPath, 2000)
+    for folder in ("model", "history"):
+        (tmp_path / folder).mkdir(exist_ok=True)
+
+    return {
+        **GetDefaultConfig(),
+        "expertDemoPath": demoPath, "maxExpertDemo": 2000, "envName": ENV_NAME, "maxTrans": 3000, "numTransUpdate": 1000,
+        "epochsPerUpdate": 1, "batchSize": 256, "hiddenDim": 16, "canTestReward": float("inf"), "isPreprocess": False,
+        "scheduler": "StepLR", "schedulerParams": {"step_size": 1, "gamma": 0.5}, "schedulerWarmup": 0, "seed": 0,
+        "checkpointInterval": 0, "modelSaveFolder": str(tmp_path / "model"), "historySaveFolder": str(tmp_path / "history"),
+        **kwargs
+    }
+
+
+def test_collector_drops_the_rest_after_a_fit():
+    envs      = SerialVecEnv([MakeEnv(ENV_NAME) for _ in range(2)])
+    collector = Collector(envs, ASAF1(9, 1, 16, -1., 1.))
+    states, actions, _ = collector.Step()
+    assert states.shape == (2, 9) and actions.shape == (2, 1)
+    assert collector.OnPolicyUpdated(0)
+    assert not collector.OnPolicyUpdated(1)
+    assert collector.numDropped == 1
+    collector.Close()
+
+
+# Every episode ends on the step that fills the buffer, it is recorded with the LR of the weights that collected it:
+def test_episodes_are_handled_before_the_fit(tmp_path):
+    result  = Train(**GetConfig(tmp_path))
+    history = LoadHistory(result["HistoryPath"])
+    np.testing.assert_allclose(history["LR"], [0., 5e-4, 2.5e-4])
+    np.testing.assert_array_equal(history["Transition"], [1000, 2000, 3000])
+    assert result["DroppedTransitions"] == 0
+
+
+# 2 envs and an odd window: the step that fills the buffer has 1 transition left, collected with the old weights:
+def test_off_policy_rest_is_dropped(tmp_path):
+    result = Train(**GetConfig(tmp_path, numEnvs=2, numTransUpdate=999))
+    assert result["DroppedTransitions"] == 3
+    assert result["Transition"] == 3001
+
+
+# The profile table is printed with isProfile, and the throughput columns of the history are filled in either case:
+@pytest.mark.parametrize("isProfile", [False, True])
+def test_profile_and_throughput_columns(tmp_path, capsys, isProfile):
+    result  = Train(**GetConfig(tmp_path, maxTrans=2000, isProfile=isProfile))
+    output  = capsys.readouterr().out
+    history = LoadHistory(result["HistoryPath"])
+    assert (history["TransPerSec"] > 0).all()
+    assert history["UpdatePerSec"][0] == 0. and history["UpdatePerSec"][1] > 0
+    assert ("| Fit " in output) == isProfile
+    assert ("buffer.Push" in output) == isProfile
+
+
+# The test episode counters continue from the training state (1 test of numTestEpisode episodes per 1000-step episode after maxTrans // 2):
+@pytest.mark.parametrize("isAdaptiveTest", [False, True])
+def test_resume_keeps_test_counters(tmp_path, isAdaptiveTest):
+    config    = GetConfig(tmp_path, canTestReward=-float("inf"), endTrainReward=1e9, numTestEpisode=5, isAdaptiveTest=isAdaptiveTest)
+    first     = Train(**{**config, "maxTrans": 2000, "checkpointInterval": 1000})
+    statePath = str(next((tmp_path / "model").glob("*.state")))
+    state     = LoadCheckpoint(statePath)["counters"]
+    assert (state["testEpisodes"], state["savedTestEpisodes"]) == (first["TestEpisodes"], first["SavedTestEpisodes"])
+    assert state["testEpisodes"] > 0 and (state["savedTestEpisodes"] > 0) == isAdaptiveTest
+
+    # The state is saved after the Fit, so the resumed run starts a new window:
+    resumed = Train(**{**config, "maxTrans": 3000, "resumePath": statePath})
+    assert resumed["Transition"] == 3000 and resumed["DroppedTransitions"] == 0
+    assert resumed["TestEpisodes"] == state["testEpisodes"] * 3 // 2
+    assert resumed["SavedTestEpisodes"] == state["savedTestEpisodes"] * 3 // 2
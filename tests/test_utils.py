@@ -0,0 +1,26 @@
+from utils import PhaseTimer
+
+
+def test_disabled_timer_records_nothing():
+    timer = PhaseTimer()
+    with timer("Fit"):
+        pass
+    timer.Count("Fit", 3)
+    assert timer("Fit") is PhaseTimer.NULL_CONTEXT
+    assert not timer.seconds and not timer.calls and not timer.counters
+    assert timer.Summary() == ""
+
+
+def test_enabled_timer_summary():
+    timer = PhaseTimer(True)
+    for _ in range(2):
+        with timer("Fit"):
+            pass
+    with timer("env.step"):
+        pass
+    timer.Count("Fit", 3)
+    assert timer.calls == {"Fit": 2, "env.step": 1} and timer.counters == {"Fit": 3}
+
+    lines = timer.Summary().splitlines()
+    assert len(lines) == 3
+    assert lines[-1].split("|")[1].strip() == "Fit" and "3 counts" in lines[-1]